@@ -2,22 +2,28 @@
 Medical GraphRAG API 服务
 提供超适应症用药分析的 REST API 接口
 """
-from fastapi import FastAPI, HTTPException, status
+from fastapi import FastAPI, HTTPException, Request, status
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse
+from starlette.concurrency import iterate_in_threadpool, run_in_threadpool
 from pydantic import BaseModel, Field
-from typing import Optional, List, Dict, Any
+from typing import Optional, List, Dict, Any, AsyncIterator, Iterator
+import asyncio
+import codecs
+import json
 import logging
 import sys
 import os
+import tempfile
 from datetime import datetime
 
 # 添加项目根目录到路径
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-from app.shared import get_es_client, Config, setup_logging
-from app.inference.engine import process_case, batch_process
-from app.inference.entity_matcher import EntityRecognizer
-from app.inference.knowledge_retriever import KnowledgeEnhancer
+from app.shared import get_async_es_client, get_async_llm_client, close_llm_http_clients, Config, setup_logging
+from app.inference.engine import AsyncInferenceEngine
+from app.inference.deadline import DeadlineExceededError
+from app.inference.job_queue import JobQueue
 
 # 加载环境变量
 Config.load_env()
@@ -43,9 +49,24 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# 全局 ES 客户端
+# 全局 ES 客户端（异步）
 es_client = None
 
+# 全局推理引擎（启动时创建一次，所有请求共享ES连接池和LLM HTTP客户端）
+engine: Optional[AsyncInferenceEngine] = None
+
+# 批量任务队列（inference.jobs 未启用时为None）
+job_queue: Optional[JobQueue] = None
+
+# 检测客户端断开的轮询间隔（秒）
+DISCONNECT_POLL_INTERVAL = 0.5
+
+# 流式批量请求体在内存中暂存的上限（字节），超过后写入临时文件
+BATCH_SPOOL_MAX_MEMORY = 8 * 1024 * 1024
+
+# 增量解析JSON数组请求体时每次读取的字节数
+BATCH_ARRAY_READ_SIZE = 64 * 1024
+
 # ==================== 数据模型 ====================
 
 class HealthResponse(BaseModel):
@@ -74,6 +95,9 @@ class AnalysisRequest(BaseModel):
     patient: PatientInfo
     prescription: PrescriptionInfo
     clinical_context: Optional[str] = Field(None, description="临床背景")
+    deadline_ms: Optional[int] = Field(
+        None, gt=0, description="时间预算（毫秒），LLM阶段超时时返回规则结论并标记degraded"
+    )
 
     class Config:
         schema_extra = {
@@ -124,17 +148,24 @@ class DiseaseDetailRequest(BaseModel):
 @app.on_event("startup")
 async def startup_event():
     """应用启动时初始化"""
-    global es_client
+    global es_client, engine, job_queue
     try:
         logger.info("正在初始化 Elasticsearch 客户端...")
-        es_client = get_es_client()
+        es_client = get_async_es_client()
         
         # 测试连接
-        if es_client.ping():
+        if await es_client.ping():
             logger.info("Elasticsearch 连接成功")
         else:
             logger.error("Elasticsearch 连接失败")
             raise Exception("无法连接到 Elasticsearch")
+        
+        logger.info("正在初始化推理引擎...")
+        engine = AsyncInferenceEngine(es=es_client, llm_client=get_async_llm_client())
+        
+        job_queue = JobQueue.from_config(engine, Config.get_inference_config().get('jobs', {}))
+        if job_queue:
+            job_queue.start()
             
     except Exception as e:
         logger.error(f"启动失败: {str(e)}")
@@ -143,11 +174,200 @@ async def startup_event():
 @app.on_event("shutdown")
 async def shutdown_event():
     """应用关闭时清理资源"""
-    global es_client
+    global es_client, engine, job_queue
+    if job_queue:
+        await job_queue.stop()
+        job_queue = None
+        logger.info("任务队列已停止")
+    if engine:
+        await engine.llm_client.close()
+        await close_llm_http_clients()
+        engine = None
+        logger.info("LLM 客户端已关闭")
     if es_client:
-        es_client.close()
+        await es_client.close()
         logger.info("Elasticsearch 连接已关闭")
 
+# ==================== 辅助函数 ====================
+
+def build_analysis_input(request: AnalysisRequest) -> Dict[str, Any]:
+    """由分析请求构造病例描述与推理引擎的输入数据"""
+    description = f"患者{request.patient.age}岁{request.patient.gender}性，诊断为{request.patient.diagnosis}"
+    if request.patient.medical_history:
+        description += f"，{request.patient.medical_history}"
+    description += f"。处方{request.prescription.drug_name}"
+    if request.prescription.dosage:
+        description += f" {request.prescription.dosage}"
+    if request.prescription.frequency:
+        description += f" {request.prescription.frequency}"
+    if request.clinical_context:
+        description += f"。{request.clinical_context}"
+    
+    return {
+        "description": description,
+        "patient_info": {
+            "age": request.patient.age,
+            "gender": request.patient.gender,
+            "diagnosis": request.patient.diagnosis,
+            "medical_history": request.patient.medical_history
+        },
+        "prescription": {
+            "drug_name": request.prescription.drug_name,
+            "dosage": request.prescription.dosage,
+            "frequency": request.prescription.frequency,
+            "duration": request.prescription.duration
+        },
+        "clinical_context": request.clinical_context
+    }
+
+def parse_batch_item(raw: Any) -> Any:
+    """解析流式批量中的一个病例，失败时返回异常实例（由推理引擎转换为该序号的错误结果）"""
+    try:
+        if isinstance(raw, (bytes, str)):
+            raw = json.loads(raw)
+        if not isinstance(raw, dict):
+            raise ValueError("病例必须是JSON对象")
+        return build_analysis_input(AnalysisRequest(**raw))
+    except Exception as e:
+        return ValueError(f"病例解析失败: {str(e)}")
+
+async def spool_request_body(raw_request: Request) -> tempfile.SpooledTemporaryFile:
+    """将请求体写入临时文件（超过 BATCH_SPOOL_MAX_MEMORY 后落盘）
+    
+    StreamingResponse 在输出期间会占用ASGI receive监听客户端断开，请求体需在开始输出前读完，
+    因此首个结果在上传完成后才开始输出。落盘后的写入是阻塞的文件I/O，在线程池中执行。
+    """
+    body_file = tempfile.SpooledTemporaryFile(max_size=BATCH_SPOOL_MAX_MEMORY)
+    async for chunk in raw_request.stream():
+        await run_in_threadpool(body_file.write, chunk)
+    await run_in_threadpool(body_file.seek, 0)
+    return body_file
+
+async def aiter_batch_items(body_file) -> AsyncIterator[Any]:
+    """iter_batch_items 的异步版本：读取与解析在线程池中执行，不阻塞事件循环"""
+    items = iter_batch_items(body_file)
+    try:
+        async for item in iterate_in_threadpool(items):
+            yield item
+    finally:
+        # 提前结束（如客户端断开）时关闭生成器，随之关闭临时文件
+        items.close()
+
+def iter_batch_items(body_file) -> Iterator[Any]:
+    """逐个读取批量请求体中的病例
+    
+    请求体以 `[` 开头时按JSON数组增量解析（见 iter_json_array），否则按NDJSON逐行解析，
+    两种格式都只在内存中保留当前病例，不整体载入请求体。
+    """
+    try:
+        while True:
+            first = body_file.read(1)
+            if not first or not first.isspace():
+                break
+        if not first:
+            return
+        if first == b"[":
+            try:
+                for item in iter_json_array(body_file):
+                    yield parse_batch_item(item)
+            except ValueError as e:
+                yield ValueError(f"JSON数组解析失败: {str(e)}")
+            return
+        
+        yield parse_batch_item(first + body_file.readline())
+        for line in body_file:
+            if line.strip():
+                yield parse_batch_item(line)
+    finally:
+        body_file.close()
+
+def iter_json_array(body_file, read_size: int = BATCH_ARRAY_READ_SIZE) -> Iterator[Any]:
+    """增量解析JSON数组的元素（开头的 `[` 已读取）
+    
+    按块读取并用 JSONDecoder.raw_decode 逐个解码元素，缓冲区只保留未解析的部分。
+    
+    Raises:
+        ValueError: 数组格式错误或不完整（之前的元素已逐个产出）
+    """
+    decoder = json.JSONDecoder()
+    utf8 = codecs.getincrementaldecoder("utf-8")()
+    buffer, pos, eof = "", 0, False
+    expecting = "first"  # first: 元素或 ]；value: 元素；separator: , 或 ]
+    
+    def fill():
+        nonlocal buffer, pos, eof
+        chunk = body_file.read(read_size)
+        eof = not chunk
+        buffer = buffer[pos:] + utf8.decode(chunk, final=eof)
+        pos = 0
+    
+    while True:
+        while pos < len(buffer) and buffer[pos].isspace():
+            pos += 1
+        if pos >= len(buffer):
+            if eof:
+                raise ValueError("JSON数组不完整")
+            fill()
+            continue
+        
+        char = buffer[pos]
+        if expecting in ("first", "separator") and char == "]":
+            pos += 1
+            break
+        if expecting == "separator":
+            if char != ",":
+                raise ValueError(f"期望 ',' 或 ']'，实际为 {char!r}")
+            pos += 1
+            expecting = "value"
+            continue
+        
+        try:
+            item, end = decoder.raw_decode(buffer, pos)
+        except json.JSONDecodeError as e:
+            if eof:
+                raise ValueError(str(e)) from None
+            fill()
+            continue
+        if end == len(buffer) and not eof:
+            # 元素恰好止于缓冲区末尾时可能被截断（如数字），读入更多后重新解码
+            fill()
+            continue
+        pos = end
+        expecting = "separator"
+        yield item
+    
+    # 数组之后只允许空白
+    while True:
+        if buffer[pos:].strip():
+            raise ValueError("JSON数组之后存在多余内容")
+        if eof:
+            return
+        buffer, pos = "", 0
+        fill()
+
+def format_sse(event: str, data: Dict[str, Any]) -> str:
+    """编码一条Server-Sent Events消息"""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False, default=str)}\n\n"
+
+async def run_until_disconnect(raw_request: Request, coro):
+    """执行分析协程，客户端断开连接时取消任务
+    
+    取消会沿调用链传递到正在进行的ES/LLM请求，避免为已离开的客户端继续消耗LLM配额。
+    """
+    task = asyncio.ensure_future(coro)
+    try:
+        while True:
+            done, _ = await asyncio.wait({task}, timeout=DISCONNECT_POLL_INTERVAL)
+            if done:
+                return task.result()
+            if await raw_request.is_disconnected():
+                task.cancel()
+                logger.warning("客户端已断开连接，已取消分析任务")
+                raise HTTPException(status_code=499, detail="客户端已断开连接")
+    finally:
+        if not task.done():
+            task.cancel()
+
 # ==================== API 端点 ====================
 
 @app.get("/", tags=["系统"])
@@ -164,7 +384,7 @@ async def root():
 async def health_check():
     """健康检查"""
     try:
-        es_status = "connected" if es_client and es_client.ping() else "disconnected"
+        es_status = "connected" if es_client and await es_client.ping() else "disconnected"
         
         return HealthResponse(
             status="healthy" if es_status == "connected" else "unhealthy",
@@ -179,47 +399,42 @@ async def health_check():
             detail=str(e)
         )
 
+@app.get("/api/v1/metrics", tags=["系统"])
+async def get_metrics():
+    """运行指标（缓存命中率等）"""
+    if engine is None:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="推理引擎未初始化"
+        )
+    return engine.get_stats()
+
+@app.post("/api/v1/name-resolver/reload", tags=["系统"])
+async def reload_name_resolver():
+    """重新加载名称解析器（从drugs/diseases索引重新导出名称）"""
+    if engine is None or engine.name_resolver is None:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="名称解析器未启用"
+        )
+    await asyncio.to_thread(engine.name_resolver.reload)
+    return engine.name_resolver.stats()
+
 @app.post("/api/v1/analyze", tags=["分析"])
-async def analyze_offlabel(request: AnalysisRequest):
+async def analyze_offlabel(request: AnalysisRequest, raw_request: Request):
     """
     超适应症用药分析
     
     分析处方药品对于患者诊断疾病的适用性，判断是否为合理超适应症用药。
     """
     try:
-        # 构造描述
-        description = f"患者{request.patient.age}岁{request.patient.gender}性，诊断为{request.patient.diagnosis}"
-        if request.patient.medical_history:
-            description += f"，{request.patient.medical_history}"
-        description += f"。处方{request.prescription.drug_name}"
-        if request.prescription.dosage:
-            description += f" {request.prescription.dosage}"
-        if request.prescription.frequency:
-            description += f" {request.prescription.frequency}"
-        if request.clinical_context:
-            description += f"。{request.clinical_context}"
-        
-        # 构造输入数据
-        input_data = {
-            "description": description,
-            "patient_info": {
-                "age": request.patient.age,
-                "gender": request.patient.gender,
-                "diagnosis": request.patient.diagnosis,
-                "medical_history": request.patient.medical_history
-            },
-            "prescription": {
-                "drug_name": request.prescription.drug_name,
-                "dosage": request.prescription.dosage,
-                "frequency": request.prescription.frequency,
-                "duration": request.prescription.duration
-            },
-            "clinical_context": request.clinical_context
-        }
+        input_data = build_analysis_input(request)
         
         # 执行分析
         logger.info(f"开始分析: {request.prescription.drug_name} → {request.patient.diagnosis}")
-        result = process_case(input_data)
+        result = await run_until_disconnect(
+            raw_request, engine.analyze(input_data, deadline_ms=request.deadline_ms)
+        )
         
         return {
             "success": True,
@@ -227,6 +442,14 @@ async def analyze_offlabel(request: AnalysisRequest):
             "timestamp": datetime.now().isoformat()
         }
         
+    except HTTPException:
+        raise
+    except DeadlineExceededError as e:
+        logger.warning(f"分析超时: {str(e)}")
+        raise HTTPException(
+            status_code=status.HTTP_504_GATEWAY_TIMEOUT,
+            detail=f"分析超时: {str(e)}"
+        )
     except Exception as e:
         logger.error(f"分析失败: {str(e)}")
         raise HTTPException(
@@ -234,8 +457,35 @@ async def analyze_offlabel(request: AnalysisRequest):
             detail=f"分析失败: {str(e)}"
         )
 
+@app.post("/api/v1/analyze/stream", tags=["分析"])
+async def analyze_offlabel_stream(request: AnalysisRequest):
+    """
+    超适应症用药分析（Server-Sent Events流式）
+    
+    各阶段完成时立即推送事件：entities（实体对齐）、evidence（知识检索）、
+    rules（规则结论，通常毫秒级到达）、llm_token（LLM推理片段）、result（最终结果，与 /api/v1/analyze 的data相同）；
+    出错时推送 error 事件。客户端断开时取消分析任务。
+    """
+    if engine is None:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="推理引擎未初始化"
+        )
+    input_data = build_analysis_input(request)
+    logger.info(f"开始流式分析: {request.prescription.drug_name} → {request.patient.diagnosis}")
+    
+    async def events():
+        async for event, data in engine.analyze_stream(input_data, request.deadline_ms):
+            yield format_sse(event, data)
+    
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
 @app.post("/api/v1/analyze/batch", tags=["分析"])
-async def batch_analyze_offlabel(request: BatchAnalysisRequest):
+async def batch_analyze_offlabel(request: BatchAnalysisRequest, raw_request: Request):
     """
     批量超适应症用药分析
     
@@ -264,7 +514,7 @@ async def batch_analyze_offlabel(request: BatchAnalysisRequest):
         
         # 批量执行分析
         logger.info(f"开始批量分析: {len(input_data_list)} 个病例")
-        results = batch_process(input_data_list)
+        results = await run_until_disconnect(raw_request, engine.analyze_batch(input_data_list))
         
         return {
             "success": True,
@@ -273,6 +523,8 @@ async def batch_analyze_offlabel(request: BatchAnalysisRequest):
             "timestamp": datetime.now().isoformat()
         }
         
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"批量分析失败: {str(e)}")
         raise HTTPException(
@@ -280,6 +532,103 @@ async def batch_analyze_offlabel(request: BatchAnalysisRequest):
             detail=f"批量分析失败: {str(e)}"
         )
 
+@app.post("/api/v1/analyze/batch/stream", tags=["分析"])
+async def batch_analyze_offlabel_stream(raw_request: Request):
+    """
+    流式批量超适应症用药分析（NDJSON）
+    
+    请求体为病例的JSON数组，或NDJSON（每行一个病例，格式同 /api/v1/analyze 的请求体）。
+    每个病例完成后立即输出一行JSON：`{"index": 输入序号, "success": ..., "data": 结果}`，
+    失败时为 `{"index": ..., "success": false, "error": ...}`；行的顺序为完成顺序。
+    请求体先完整暂存到临时文件，上传完成后才开始分析并输出结果（首个结果的等待时间随请求体大小增加）；
+    之后服务端只保留进行中的病例，内存占用与批量大小无关；客户端断开时取消剩余病例。
+    """
+    if engine is None:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="推理引擎未初始化"
+        )
+    body_file = await spool_request_body(raw_request)
+    logger.info("开始流式批量分析")
+    
+    async def lines():
+        async for idx, result in engine.analyze_batch_stream(aiter_batch_items(body_file)):
+            if "error" in result:
+                line = {"index": idx, "success": False, "error": result["error"]}
+            else:
+                line = {"index": idx, "success": True, "data": result}
+            yield json.dumps(line, ensure_ascii=False, default=str) + "\n"
+    
+    return StreamingResponse(lines(), media_type="application/x-ndjson")
+
+async def get_job_or_404(job_id: str) -> Dict[str, Any]:
+    """查询任务（在线程中读取任务库），任务队列未启用时返回503，任务不存在时返回404"""
+    if job_queue is None:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="任务队列未启用"
+        )
+    job = await asyncio.to_thread(job_queue.store.get_job, job_id)
+    if job is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"任务不存在: {job_id}"
+        )
+    return job
+
+@app.post("/api/v1/jobs", status_code=status.HTTP_202_ACCEPTED, tags=["任务"])
+async def submit_job(request: BatchAnalysisRequest):
+    """
+    提交批量分析任务
+    
+    病例写入任务库后立即返回任务ID，由后台worker分析；进度与结果持久化，服务重启后继续处理。
+    """
+    if job_queue is None:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="任务队列未启用"
+        )
+    inputs = [build_analysis_input(case) for case in request.cases]
+    job_id = await asyncio.to_thread(job_queue.submit, inputs)
+    return {
+        "success": True,
+        "data": await asyncio.to_thread(job_queue.store.get_job, job_id),
+        "timestamp": datetime.now().isoformat()
+    }
+
+@app.get("/api/v1/jobs/{job_id}", tags=["任务"])
+async def get_job(job_id: str):
+    """查询任务状态与进度（total/done/failed/progress）"""
+    return {
+        "success": True,
+        "data": await get_job_or_404(job_id),
+        "timestamp": datetime.now().isoformat()
+    }
+
+@app.get("/api/v1/jobs/{job_id}/results", tags=["任务"])
+async def download_job_results(job_id: str, status_filter: Optional[str] = None):
+    """
+    下载任务结果（NDJSON，按输入序号）
+    
+    任务进行中也可下载已完成部分；`status_filter=failed` 只返回失败的病例，`done` 只返回成功的病例。
+    """
+    await get_job_or_404(job_id)
+    if status_filter not in (None, "done", "failed"):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="status_filter 可选值: done, failed"
+        )
+    
+    def lines():
+        for row in job_queue.store.iter_results(job_id, status_filter):
+            yield json.dumps(row, ensure_ascii=False) + "\n"
+    
+    return StreamingResponse(
+        lines(),
+        media_type="application/x-ndjson",
+        headers={"Content-Disposition": f'attachment; filename="{job_id}.jsonl"'}
+    )
+
 @app.post("/api/v1/entity/recognize", tags=["实体识别"])
 async def recognize_entities(request: EntityRecognitionRequest):
     """
@@ -288,15 +637,13 @@ async def recognize_entities(request: EntityRecognitionRequest):
     从文本中识别药品和疾病实体。
     """
     try:
-        recognizer = EntityRecognizer(es=es_client)
-        
         input_data = {
             "text": request.text,
             "context": request.context
         }
         
         logger.info(f"开始实体识别: {request.text[:50]}...")
-        result = recognizer.recognize(input_data)
+        result = await engine.entity_recognizer.recognize(input_data)
         
         return {
             "success": True,
@@ -343,7 +690,7 @@ async def search_drugs(request: SearchRequest):
             for key, value in request.filters.items():
                 query_body["query"]["bool"]["filter"].append({"term": {key: value}})
         
-        result = es_client.search(index="drugs_index", body=query_body)
+        result = await es_client.search(index="drugs_index", body=query_body)
         
         drugs = [hit["_source"] for hit in result["hits"]["hits"]]
         
@@ -389,7 +736,7 @@ async def search_diseases(request: SearchRequest):
             for key, value in request.filters.items():
                 query_body["query"]["bool"]["filter"].append({"term": {key: value}})
         
-        result = es_client.search(index="diseases_index", body=query_body)
+        result = await es_client.search(index="diseases_index", body=query_body)
         
         diseases = [hit["_source"] for hit in result["hits"]["hits"]]
         
@@ -415,12 +762,12 @@ async def get_drug_detail(request: DrugDetailRequest):
     根据药品ID或名称获取完整的药品信息。
     """
     try:
-        enhancer = KnowledgeEnhancer(es=es_client)
+        enhancer = engine.indication_analyzer.knowledge_enhancer
         
         if request.drug_id:
-            drug_info = enhancer.get_drug_by_id(request.drug_id)
+            drug_info = await enhancer.get_drug_by_id(request.drug_id)
         elif request.drug_name:
-            drug_info = enhancer.get_drug_by_name(request.drug_name)
+            drug_info = await enhancer.get_drug_by_name(request.drug_name)
         else:
             raise HTTPException(
                 status_code=status.HTTP_400_BAD_REQUEST,
@@ -456,12 +803,12 @@ async def get_disease_detail(request: DiseaseDetailRequest):
     根据疾病ID或名称获取完整的疾病信息。
     """
     try:
-        enhancer = KnowledgeEnhancer(es=es_client)
+        enhancer = engine.indication_analyzer.knowledge_enhancer
         
         if request.disease_id:
-            disease_info = enhancer.get_disease_by_id(request.disease_id)
+            disease_info = await enhancer.get_disease_by_id(request.disease_id)
         elif request.disease_name:
-            disease_info = enhancer.get_disease_by_name(request.disease_name)
+            disease_info = await enhancer.get_disease_by_name(request.disease_name)
         else:
             raise HTTPException(
                 status_code=status.HTTP_400_BAD_REQUEST,
@@ -22,6 +22,12 @@
     import pandas as pd
     df = pd.read_csv("cases.csv")
     results = engine.analyze_batch(df.to_dict('records'))
+    
+    # 异步分析（FastAPI等事件循环环境）
+    from app.inference.engine import AsyncInferenceEngine
+    
+    async_engine = AsyncInferenceEngine()
+    result = await async_engine.analyze({...})
 """
 
 __all__ = []
@@ -0,0 +1,98 @@
+"""Aho-Corasick多模式匹配自动机（纯Python实现）
+
+一次线性扫描文本即可报告所有模式的命中位置，
+用于词典实体识别（entity_dictionary.py）和禁忌症扫描（contraindication_scanner.py）。
+自动机只包含列表和字典，可直接pickle。
+"""
+
+import unicodedata
+from collections import deque
+from typing import Any, Dict, Iterator, List, Tuple
+
+
+def fold_text(text: str) -> str:
+    """逐字符做全半角统一和小写，保持长度不变以便回溯原文位置"""
+    folded = []
+    for char in text:
+        normalized = unicodedata.normalize('NFKC', char).lower()
+        folded.append(normalized if len(normalized) == 1 else char)
+    return ''.join(folded)
+
+
+def is_ascii_word_char(char: str) -> bool:
+    return char.isascii() and char.isalnum()
+
+
+class AhoCorasick:
+    """Aho-Corasick多模式匹配自动机（纯Python实现，可pickle）"""
+
+    def __init__(self):
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        self._output: List[int] = [-1]       # 以该状态结尾的模式序号，-1表示无
+        self._dict_link: List[int] = [0]     # 沿失败链最近的有输出状态，0表示无
+        self.patterns: List[str] = []
+        self.payloads: List[Any] = []
+        self.finalized = False
+
+    def __len__(self) -> int:
+        return len(self.patterns)
+
+    def add(self, pattern: str, payload: Any) -> int:
+        """添加模式，重复添加同一模式时覆盖其payload
+
+        Returns:
+            int: 模式序号
+        """
+        if self.finalized:
+            raise RuntimeError("自动机已编译，不能再添加模式")
+        state = 0
+        for char in pattern:
+            next_state = self._goto[state].get(char)
+            if next_state is None:
+                next_state = len(self._goto)
+                self._goto[state][char] = next_state
+                self._goto.append({})
+                self._fail.append(0)
+                self._output.append(-1)
+                self._dict_link.append(0)
+            state = next_state
+
+        if self._output[state] >= 0:
+            self.payloads[self._output[state]] = payload
+            return self._output[state]
+        self._output[state] = len(self.patterns)
+        self.patterns.append(pattern)
+        self.payloads.append(payload)
+        return self._output[state]
+
+    def finalize(self):
+        """按BFS计算失败链与输出链"""
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, next_state in self._goto[state].items():
+                queue.append(next_state)
+                fail = self._fail[state]
+                while fail and char not in self._goto[fail]:
+                    fail = self._fail[fail]
+                fail = self._goto[fail].get(char, 0)
+                self._fail[next_state] = fail
+                self._dict_link[next_state] = fail if self._output[fail] >= 0 else self._dict_link[fail]
+        self.finalized = True
+
+    def iter_matches(self, text: str) -> Iterator[Tuple[int, int, int]]:
+        """扫描文本，产出所有命中 (起始位置, 结束位置, 模式序号)"""
+        if not self.finalized:
+            raise RuntimeError("自动机尚未编译")
+        goto, fail, output, dict_link = self._goto, self._fail, self._output, self._dict_link
+        state = 0
+        for i, char in enumerate(text):
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            match_state = state if output[state] >= 0 else dict_link[state]
+            while match_state:
+                pattern_id = output[match_state]
+                yield i + 1 - len(self.patterns[pattern_id]), i + 1, pattern_id
+                match_state = dict_link[match_state]
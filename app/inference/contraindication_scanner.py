@@ -0,0 +1,87 @@
+"""药品禁忌症扫描
+
+每个药品的禁忌症列表编译为一个Aho-Corasick自动机（首次用到时编译，按药品ID放入LRU），
+一次线性扫描即可报告诊断名称或病例描述中出现的全部禁忌症，
+替代逐条 `contraindication.lower() in text` 的 O(n·m) 循环。
+
+纯Python自动机逐字符推进，禁忌症条目很少时反而不如C实现的子串查找，
+因此条目数低于 min_patterns 时仍走逐条查找（见 scripts/benchmark_contraindication_scan.py）。
+"""
+
+from typing import Any, Dict, Hashable, List, Optional, Sequence
+
+from app.shared.cache import LRUCache
+from .aho_corasick import AhoCorasick
+
+
+class ContraindicationScanner:
+    """按药品缓存禁忌症自动机的扫描器（线程安全）"""
+
+    def __init__(self, maxsize: int = 2048, min_patterns: int = 128):
+        """初始化扫描器
+
+        Args:
+            maxsize: 最多缓存的药品自动机数
+            min_patterns: 使用自动机的最少禁忌症条目数，更少时逐条子串查找
+        """
+        self._automata = LRUCache(maxsize=maxsize)
+        self.min_patterns = min_patterns
+        self.compiled = 0
+
+    @staticmethod
+    def compile(contraindications: Sequence[str]) -> AhoCorasick:
+        """编译禁忌症自动机，payload为原始写法列表（小写后相同的禁忌症合并）"""
+        originals: Dict[str, List[str]] = {}
+        for contraindication in contraindications:
+            if contraindication:
+                originals.setdefault(contraindication.lower(), []).append(contraindication)
+        automaton = AhoCorasick()
+        for pattern, names in originals.items():
+            automaton.add(pattern, names)
+        automaton.finalize()
+        return automaton
+
+    def _automaton(self, drug_id: Optional[str], contraindications: Sequence[str]) -> AhoCorasick:
+        if not drug_id:
+            return self.compile(contraindications)
+        # 禁忌症内容参与缓存键，药品数据更新后自动换用新的自动机
+        key: Hashable = (drug_id, tuple(contraindications))
+        automaton = self._automata.get(key)
+        if automaton is None:
+            automaton = self.compile(contraindications)
+            self._automata.set(key, automaton)
+            self.compiled += 1
+        return automaton
+
+    def scan(self, drug_id: Optional[str], contraindications: Sequence[str], *texts: str) -> List[str]:
+        """扫描文本中出现的禁忌症
+
+        Args:
+            drug_id: 药品ID（为空时不缓存自动机）
+            contraindications: 药品的禁忌症列表
+            texts: 待扫描的文本（如诊断名称、病例描述）
+
+        Returns:
+            List[str]: 命中的禁忌症（原始写法，按禁忌症列表顺序，去重）
+        """
+        texts = [text for text in texts if text]
+        if not contraindications or not texts:
+            return []
+        if len(contraindications) < self.min_patterns:
+            folded = [text.lower() for text in texts]
+            return list(dict.fromkeys(
+                c for c in contraindications if c and any(c.lower() in text for text in folded)
+            ))
+        automaton = self._automaton(drug_id, contraindications)
+
+        matched = set()
+        for text in texts:
+            for _, _, pattern_id in automaton.iter_matches(text.lower()):
+                matched.add(pattern_id)
+        hits = {name for pattern_id in matched for name in automaton.payloads[pattern_id]}
+        return list(dict.fromkeys(c for c in contraindications if c in hits))
+
+    def stats(self) -> Dict[str, Any]:
+        stats = self._automata.stats()
+        stats["compiled"] = self.compiled
+        return stats
@@ -0,0 +1,118 @@
+"""单次分析的时间预算
+
+调用方为每个请求设置总预算（deadline_ms），各阶段的超时取
+min(阶段上限, 剩余总预算)：
+- entities：实体识别/对齐
+- knowledge：知识增强（药品文档与证据检索）
+- llm：适应症推理的LLM调用
+
+LLM阶段超时（或剩余预算不足 min_llm_ms）时，推理器返回规则分析结论并标记 degraded；
+知识增强超时时若内存适应症索引中有该药品，用索引数据做规则分析并降级，
+否则与实体识别超时一样无法给出结论，抛出 DeadlineExceededError。
+同步引擎的实体识别与知识增强无法中断，只记录耗时，超出的时间从LLM阶段的预算中扣除。
+未设置总预算时不限制任何阶段。
+"""
+
+import asyncio
+import time
+from contextlib import contextmanager
+from typing import Any, Awaitable, Dict, Optional, TypeVar
+
+T = TypeVar("T")
+
+STAGES = ("entities", "knowledge", "llm")
+
+
+class DeadlineExceededError(TimeoutError):
+    """某一阶段用尽时间预算"""
+
+    def __init__(self, stage: str, budget_ms: float):
+        super().__init__(f"{stage}阶段超出时间预算（总预算{budget_ms:.0f}ms）")
+        self.stage = stage
+
+
+class Deadline:
+    """请求级时间预算"""
+
+    def __init__(self, budget_ms: float, stage_budgets_ms: Optional[Dict[str, Optional[float]]] = None,
+                 min_llm_ms: float = 0):
+        """初始化
+
+        Args:
+            budget_ms: 总预算（毫秒），从创建时开始计时
+            stage_budgets_ms: 各阶段上限（毫秒），缺省或None表示仅受剩余总预算约束
+            min_llm_ms: LLM阶段的最小预算，剩余不足时不再调用LLM
+        """
+        self.budget_ms = budget_ms
+        self.stage_budgets_ms = stage_budgets_ms or {}
+        self.min_llm_ms = min_llm_ms
+        self._start = time.monotonic()
+        self.stage_elapsed_ms: Dict[str, float] = {}
+
+    @classmethod
+    def from_config(cls, budget_ms: Optional[float], config: Dict[str, Any]) -> Optional["Deadline"]:
+        """根据 inference.deadline 配置创建；budget_ms为None时使用 default_ms，仍为空则返回None（不限时）"""
+        if budget_ms is None:
+            budget_ms = config.get('default_ms')
+        if not budget_ms:
+            return None
+        stages = config.get('stages', {}) or {}
+        return cls(
+            budget_ms,
+            {stage: stages.get(f"{stage}_ms") for stage in STAGES},
+            min_llm_ms=config.get('min_llm_ms', 0)
+        )
+
+    def elapsed_ms(self) -> float:
+        return (time.monotonic() - self._start) * 1000
+
+    def remaining(self) -> float:
+        """剩余总预算（秒），不小于0"""
+        return max(0.0, (self.budget_ms - self.elapsed_ms()) / 1000)
+
+    def expired(self) -> bool:
+        return self.remaining() <= 0
+
+    def stage_timeout(self, stage: str) -> float:
+        """阶段超时（秒）"""
+        remaining = self.remaining()
+        stage_budget = self.stage_budgets_ms.get(stage)
+        return remaining if stage_budget is None else min(remaining, stage_budget / 1000)
+
+    def llm_budget_exhausted(self) -> bool:
+        """剩余预算不足以完成一次LLM调用"""
+        return self.stage_timeout("llm") * 1000 <= max(self.min_llm_ms, 0)
+
+    def record(self, stage: str, started: float):
+        """记录阶段耗时（started为 time.monotonic() 起点）"""
+        self.stage_elapsed_ms[stage] = round((time.monotonic() - started) * 1000, 1)
+
+    def summary(self) -> Dict[str, Any]:
+        """写入结果metadata的预算使用情况"""
+        return {
+            "budget_ms": self.budget_ms,
+            "elapsed_ms": round(self.elapsed_ms(), 1),
+            "stages_ms": dict(self.stage_elapsed_ms)
+        }
+
+
+@contextmanager
+def track_stage(deadline: Optional[Deadline], stage: str):
+    """记录同步阶段的耗时（同步调用无法中断，超时由后续阶段的剩余预算体现）"""
+    started = time.monotonic()
+    try:
+        yield
+    finally:
+        if deadline is not None:
+            deadline.record(stage, started)
+
+
+async def run_stage(deadline: Optional[Deadline], stage: str, awaitable: Awaitable[T]) -> T:
+    """在阶段超时内等待协程，超时时取消并抛出 DeadlineExceededError"""
+    if deadline is None:
+        return await awaitable
+    with track_stage(deadline, stage):
+        try:
+            return await asyncio.wait_for(awaitable, deadline.stage_timeout(stage))
+        except asyncio.TimeoutError:
+            raise DeadlineExceededError(stage, deadline.budget_ms) from None
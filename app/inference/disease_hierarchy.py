@@ -0,0 +1,84 @@
+"""疾病同义分组与上下位闭包
+
+IndicationIndex（按疾病ID）与编译的关系表 disease_relations（按规范化名称）共用同一套规则，
+保证无论加载哪份快照，规则分析的同义/层级判断一致：
+- 同义：normalize_disease_name 相同的疾病属于同一组
+- 上下位：疾病声明的 sub_diseases（规范化后）所在组的成员为其子疾病，
+  祖先集合为父->子有向图的传递闭包（容忍数据中的环）
+
+related_diseases 表示关联疾病而非同一疾病或上下位，不参与分组与层级。
+"""
+
+from collections import defaultdict
+from typing import Any, Dict, FrozenSet, Hashable, Iterable, Set, Tuple, TypeVar
+
+from .name_resolver import normalize_disease_name
+
+T = TypeVar("T", bound=Hashable)
+
+
+def disease_name_text(name: Any) -> str:
+    """疾病名原文（sub_diseases 等字段的元素可能是 {"name": ...}），合并多余空白"""
+    if isinstance(name, dict):
+        name = name.get('name', '')
+    return ' '.join(str(name or '').split())
+
+
+def disease_key(name: Any) -> str:
+    """疾病的同义分组键（规范化名称），名称为空时为空串"""
+    text = disease_name_text(name)
+    return normalize_disease_name(text) if text else ''
+
+
+def group_by_normalized_name(items: Iterable[Tuple[T, Any]]) -> Dict[str, Set[T]]:
+    """按规范化名称分组
+
+    Args:
+        items: (成员, 疾病名)，成员为疾病ID或名称写法
+
+    Returns:
+        Dict[str, Set]: 规范化名称 -> 成员集合
+    """
+    groups: Dict[str, Set[T]] = defaultdict(set)
+    for member, name in items:
+        key = disease_key(name)
+        if key:
+            groups[key].add(member)
+    return dict(groups)
+
+
+def sub_disease_parents(groups: Dict[str, Set[T]],
+                        declarations: Iterable[Tuple[T, Iterable[Any]]]) -> Dict[T, Set[T]]:
+    """由 sub_diseases 声明得到直接上级
+
+    Args:
+        groups: group_by_normalized_name 的结果，子疾病名按其规范化名称找到对应成员
+        declarations: (上级成员, sub_diseases)
+
+    Returns:
+        Dict: 成员 -> 直接上级成员集合
+    """
+    parents: Dict[T, Set[T]] = defaultdict(set)
+    for parent, sub_names in declarations:
+        for sub_name in sub_names or []:
+            for child in groups.get(disease_key(sub_name), ()):
+                if child != parent:
+                    parents[child].add(parent)
+    return dict(parents)
+
+
+def ancestor_closure(parents: Dict[T, Set[T]]) -> Dict[T, FrozenSet[T]]:
+    """直接上级的传递闭包（带访问集合，容忍环；不含自身，只返回有上级的成员）"""
+    ancestors: Dict[T, FrozenSet[T]] = {}
+    for child in parents:
+        seen = set()
+        stack = list(parents[child])
+        while stack:
+            parent = stack.pop()
+            if parent in seen or parent == child:
+                continue
+            seen.add(parent)
+            stack.extend(parents.get(parent, ()))
+        if seen:
+            ancestors[child] = frozenset(seen)
+    return ancestors
@@ -0,0 +1,101 @@
+"""疾病层级/模糊匹配表
+
+由NameResolver导出diseases索引时一并构建（不额外访问ES），
+用于原始名称和规范化名称都未命中的疾病：
+1. 层级匹配：输入是某疾病的 sub_diseases 之一时，返回该上级疾病
+2. 模糊匹配：疾病名n-gram索引召回候选，按Dice系数阈值与名称验证规则过滤
+3. 相关疾病：输入是某疾病的 related_diseases 之一时返回该疾病（默认关闭，
+   相关疾病并非同一适应症，开启前需确认对规则判断的影响）
+
+sub_diseases / related_diseases 字段由 DiseaseIndexer 从疾病抽取结果聚合写入。
+单次匹配为常数次哈希查找加一次有上界的n-gram召回，开销不随疾病数增长。
+"""
+
+from typing import Dict, Iterable, List, Tuple
+
+from .name_resolver import MAX_IDS_PER_NAME, normalize_disease_name
+from .ngram_index import NGramIndex
+
+# 各匹配方式的得分（模糊匹配为Dice系数）
+HIERARCHY_MATCH_SCORE = 0.9
+RELATED_MATCH_SCORE = 0.6
+
+MATCH_TYPES = ("hierarchy", "fuzzy", "related")
+
+
+class DiseaseMatcher:
+    """疾病层级/模糊匹配表（构建完成后只读）"""
+
+    def __init__(self, include_related: bool = False, min_fuzzy_score: float = 0.5,
+                 fuzzy_candidates: int = 10):
+        """初始化匹配表
+
+        Args:
+            include_related: 是否按related_diseases匹配
+            min_fuzzy_score: 模糊匹配的最低Dice系数
+            fuzzy_candidates: 模糊匹配参与验证的候选数
+        """
+        self.include_related = include_related
+        self.min_fuzzy_score = min_fuzzy_score
+        self.fuzzy_candidates = fuzzy_candidates
+
+        # 规范化子疾病名/相关疾病名 -> [(id, name), ...]
+        self._parents: Dict[str, List[Tuple[str, str]]] = {}
+        self._related: Dict[str, List[Tuple[str, str]]] = {}
+        self._ngrams = NGramIndex(clean=normalize_disease_name)
+
+    @staticmethod
+    def _add(table: Dict[str, list], names: Iterable[str], entry: Tuple[str, str]):
+        for name in names or []:
+            key = normalize_disease_name(name) if name else ''
+            if not key:
+                continue
+            bucket = table.setdefault(key, [])
+            if len(bucket) < MAX_IDS_PER_NAME and entry not in bucket:
+                bucket.append(entry)
+
+    def add(self, entity_id: str, name: str, sub_diseases: Iterable[str] = (),
+            related_diseases: Iterable[str] = ()):
+        """添加一个疾病及其子疾病、相关疾病"""
+        entry = (entity_id, name)
+        self._ngrams.add(entity_id, name)
+        self._add(self._parents, sub_diseases, entry)
+        if self.include_related:
+            self._add(self._related, related_diseases, entry)
+
+    @staticmethod
+    def _format(entries: List[Tuple[str, str]], score: float, match_type: str, unique: bool) -> List[Dict]:
+        return [
+            {'id': entity_id, 'name': entity_name, '_score': score, 'match_type': match_type}
+            for entity_id, entity_name in entries[:1 if unique else MAX_IDS_PER_NAME]
+        ]
+
+    def match(self, name: str, unique: bool = False) -> List[Dict]:
+        """层级 -> 模糊 -> 相关疾病依次匹配
+
+        Returns:
+            List[Dict]: 匹配列表（含match_type），未命中时为空列表
+        """
+        key = normalize_disease_name(name)
+        entries = self._parents.get(key)
+        if entries:
+            return self._format(entries, HIERARCHY_MATCH_SCORE, "hierarchy", unique)
+
+        matches = self._ngrams.match(name, k=self.fuzzy_candidates, unique=unique,
+                                     min_score=self.min_fuzzy_score)
+        if matches:
+            for match in matches:
+                match['match_type'] = "fuzzy"
+            return matches
+
+        entries = self._related.get(key)
+        if entries:
+            return self._format(entries, RELATED_MATCH_SCORE, "related", unique)
+        return []
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "diseases": len(self._ngrams),
+            "sub_diseases": len(self._parents),
+            "related_diseases": len(self._related)
+        }
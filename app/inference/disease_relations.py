@@ -0,0 +1,237 @@
+"""编译的疾病同义/层级关系表
+
+由 DiseaseIndexer 从疾病抽取批次聚合结果构建，保存为带版本号的二进制文件，
+推理进程启动时通过mmap映射，供 RuleAnalyzer 做同义词与上下位匹配：
+- 同义组：规范化名称相同的各种写法（小写），如 "高血压（原发性）" 与 "高血压"
+- 祖先集合：由 sub_diseases 得到的父->子有向图，预先计算传递闭包
+
+related_diseases 表示关联疾病而非同一疾病或上下位，不作为同义/层级边。
+
+文件格式（整数为本机字节序int32，段按4字节对齐）：
+    MAGIC(4) | format(uint32) | header_len(uint32) | header(JSON) | 对齐填充
+    variant_offsets[n_keys+1] | variant_ids[...]     同义组（CSR）
+    ancestor_offsets[n_keys+1] | ancestor_ids[...]   祖先闭包（CSR）
+    strings（UTF-8，换行分隔；前n_keys个为规范化名称，其后为各写法）
+"""
+
+import hashlib
+import json
+import logging
+import mmap
+import os
+import struct
+import sys
+import threading
+from array import array
+from datetime import datetime
+from typing import Any, Dict, FrozenSet, Iterable, List, Optional
+
+from app.shared import Config
+from .disease_hierarchy import (
+    ancestor_closure, disease_key, disease_name_text, group_by_normalized_name, sub_disease_parents
+)
+from .name_resolver import normalize_disease_name
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b"DREL"
+FORMAT_VERSION = 1
+_PREFIX = struct.Struct("<II")
+
+
+def compile_disease_relations(diseases: Iterable[Dict[str, Any]]) -> Dict[str, Any]:
+    """从聚合后的疾病数据编译同义组与祖先闭包（分组与闭包规则见 disease_hierarchy）
+
+    Args:
+        diseases: DiseaseIndexer.load_diseases_from_batches 的值（含 name/sub_diseases）
+
+    Returns:
+        Dict: keys（规范化名称）, variants（每个key的小写写法）, ancestors（每个key的祖先key序号）
+    """
+    diseases = [disease for disease in diseases if disease_key(disease.get('name'))]
+    variants = group_by_normalized_name(
+        (disease_name_text(raw).lower(), raw)
+        for disease in diseases
+        for raw in [disease.get('name'), *(disease.get('sub_diseases') or []),
+                    *(disease.get('related_diseases') or [])]
+    )
+
+    # 以规范化名称为节点
+    keys = sorted(variants)
+    positions = {key: i for i, key in enumerate(keys)}
+    parents = sub_disease_parents(
+        {key: {key} for key in keys},
+        ((disease_key(disease.get('name')), disease.get('sub_diseases')) for disease in diseases)
+    )
+    closure = ancestor_closure(parents)
+
+    return {
+        "keys": keys,
+        "variants": [sorted(variants[key]) for key in keys],
+        "ancestors": [sorted(positions[parent] for parent in closure.get(key, ())) for key in keys]
+    }
+
+
+def _csr(rows: List[List[int]]):
+    offsets = array('i', [0])
+    ids = array('i')
+    for row in rows:
+        ids.extend(row)
+        offsets.append(len(ids))
+    return offsets, ids
+
+
+def write_disease_relations(path: str, compiled: Dict[str, Any]) -> str:
+    """将编译结果写入文件
+
+    Returns:
+        str: 关系表版本（内容哈希）
+    """
+    keys, variants, ancestors = compiled["keys"], compiled["variants"], compiled["ancestors"]
+
+    strings = list(keys)
+    variant_rows = []
+    for key_variants in variants:
+        row = []
+        for variant in key_variants:
+            row.append(len(strings))
+            strings.append(variant)
+        variant_rows.append(row)
+    blob = '\n'.join(strings).encode('utf-8')
+
+    sections = list(_csr(variant_rows)) + list(_csr(ancestors))
+    version = hashlib.sha256(blob + b''.join(section.tobytes() for section in sections)).hexdigest()[:16]
+
+    names = ["variant_offsets", "variant_ids", "ancestor_offsets", "ancestor_ids"]
+    layout = {}
+    offset = 0
+    for name, section in zip(names, sections):
+        layout[name] = [offset, len(section)]
+        offset += len(section) * section.itemsize
+    layout["strings"] = [offset, len(blob)]
+
+    header = json.dumps({
+        "version": version,
+        "built_at": datetime.now().isoformat(),
+        "byteorder": sys.byteorder,
+        "keys": len(keys),
+        "strings": len(strings),
+        "sections": layout
+    }).encode('utf-8')
+    prefix = MAGIC + _PREFIX.pack(FORMAT_VERSION, len(header)) + header
+    prefix += b'\0' * (-len(prefix) % 4)
+
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(prefix)
+        for section in sections:
+            f.write(section.tobytes())
+        f.write(blob)
+    os.replace(tmp_path, path)
+    return version
+
+
+class DiseaseRelations:
+    """mmap映射的疾病关系表（只读，查找为常数次哈希与切片）"""
+
+    def __init__(self, path: str):
+        """映射关系表文件
+
+        Raises:
+            ValueError: 文件格式或版本不匹配
+        """
+        self.path = path
+        with open(path, 'rb') as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        view = memoryview(self._mmap)
+        if bytes(view[:4]) != MAGIC:
+            raise ValueError(f"不是疾病关系表文件: {path}")
+        format_version, header_len = _PREFIX.unpack_from(self._mmap, 4)
+        if format_version != FORMAT_VERSION:
+            raise ValueError(f"疾病关系表格式版本不匹配: {format_version} (期望 {FORMAT_VERSION})")
+        header_end = 4 + _PREFIX.size + header_len
+        self.header = json.loads(bytes(view[4 + _PREFIX.size:header_end]))
+        if self.header["byteorder"] != sys.byteorder:
+            raise ValueError(f"疾病关系表字节序不匹配: {self.header['byteorder']}")
+        self.version = self.header["version"]
+
+        base = header_end + (-header_end % 4)
+        sections = self.header["sections"]
+
+        def int_section(name):
+            start, count = sections[name]
+            return view[base + start:base + start + count * 4].cast('i')
+
+        self._variant_offsets = int_section("variant_offsets")
+        self._variant_ids = int_section("variant_ids")
+        self._ancestor_offsets = int_section("ancestor_offsets")
+        self._ancestor_ids = int_section("ancestor_ids")
+
+        start, length = sections["strings"]
+        self._strings = bytes(view[base + start:base + start + length]).decode('utf-8').split('\n')
+        self._positions = {key: i for i, key in enumerate(self._strings[:self.header["keys"]])}
+        self.lookups = 0
+
+    def _position(self, name: str) -> Optional[int]:
+        self.lookups += 1
+        return self._positions.get(normalize_disease_name(name)) if name else None
+
+    def synonyms(self, name: str) -> FrozenSet[str]:
+        """同义组中的各种写法（小写，不含输入本身）"""
+        i = self._position(name)
+        if i is None:
+            return frozenset()
+        ids = self._variant_ids[self._variant_offsets[i]:self._variant_offsets[i + 1]]
+        return frozenset(self._strings[j] for j in ids) - {name.lower()}
+
+    def synonym_key(self, name: str) -> Optional[str]:
+        """同义组的规范化名称（与 ancestors 同为规范化键），不在关系表中时返回None
+
+        同义组即规范化名称相同的写法，适应症规范化后等于该键即为同义。
+        """
+        i = self._position(name)
+        return self._strings[i] if i is not None else None
+
+    def ancestors(self, name: str) -> FrozenSet[str]:
+        """所有上级疾病的规范化名称"""
+        i = self._position(name)
+        if i is None:
+            return frozenset()
+        ids = self._ancestor_ids[self._ancestor_offsets[i]:self._ancestor_offsets[i + 1]]
+        return frozenset(self._strings[j] for j in ids)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "version": self.version,
+            "built_at": self.header.get("built_at"),
+            "diseases": self.header["keys"],
+            "ancestor_links": len(self._ancestor_ids),
+            "lookups": self.lookups
+        }
+
+
+_disease_relations: Optional[DiseaseRelations] = None
+_disease_relations_loaded = False
+_disease_relations_lock = threading.Lock()
+
+
+def get_disease_relations() -> Optional[DiseaseRelations]:
+    """获取进程级共享的疾病关系表（inference.disease_relations），未启用或文件不存在时返回None"""
+    global _disease_relations, _disease_relations_loaded
+    with _disease_relations_lock:
+        if not _disease_relations_loaded:
+            _disease_relations_loaded = True
+            config = Config.get_inference_config().get('disease_relations', {})
+            path = config.get('path')
+            if config.get('enabled', False) and path:
+                if os.path.exists(path):
+                    try:
+                        _disease_relations = DiseaseRelations(path)
+                        logger.info(f"疾病关系表已加载: {path} {_disease_relations.stats()}")
+                    except Exception as e:
+                        logger.warning(f"加载疾病关系表失败: {str(e)}")
+                else:
+                    logger.warning(f"疾病关系表不存在: {path}（运行 python -m app.pipeline.disease_indexer --relations-only 生成）")
+        return _disease_relations
@@ -1,29 +1,103 @@
 """推理引擎 - 超适应症分析的主入口"""
 
+import asyncio
+import copy
 import logging
-from typing import Dict, Any, List
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from dataclasses import asdict
+from typing import AsyncIterable, AsyncIterator, Dict, Any, Iterable, List, Optional, Callable, Tuple, Union
 from datetime import datetime
+from openai import OpenAI, AsyncOpenAI, APIConnectionError
+from elasticsearch import Elasticsearch, AsyncElasticsearch, ConnectionError as ESConnectionError
 
-from app.shared import setup_logging, Config
-from .entity_matcher import EntityRecognizer
-from .llm_reasoner import IndicationAnalyzer
+from app.shared import (
+    setup_logging, Config, get_es_client, get_async_es_client,
+    get_llm_client, get_async_llm_client, load_env, llm_transport_stats,
+    get_llm_rate_limiter, get_llm_hedger
+)
+from app.shared.rate_limiter import THROTTLED, TIMEOUT, classify_exception
+from app.shared.singleflight import SingleFlight, AsyncSingleFlight
+from .entity_matcher import EntityRecognizer, AsyncEntityRecognizer
+from .llm_reasoner import IndicationAnalyzer, AsyncIndicationAnalyzer, EventCallback
+from .deadline import Deadline, run_stage, track_stage
 from .result_generator import ResultGenerator
+from .result_cache import ResultCache, AsyncResultCache
+from .indication_index import IndicationIndex
+from .name_resolver import NameResolver, normalize_name
+from .entity_dictionary import EntityDictionary
 from .models import Case
 
 logger = setup_logging("inference_engine")
 
+# 批量分析进度回调: (已完成数, 总数, 序号, 结果)
+ProgressCallback = Callable[[int, int, int, Dict[str, Any]], None]
+
+
+def is_transient_error(error: Exception) -> bool:
+    """是否为可重试的临时错误：超时、限流、ES/LLM连接错误与服务端5xx"""
+    if classify_exception(error) in (TIMEOUT, THROTTLED):
+        return True
+    if isinstance(error, (APIConnectionError, ESConnectionError)):
+        return True
+    status = getattr(error, "status_code", None)
+    return isinstance(status, int) and status >= 500
+
+
+async def _aiter(items: Union[Iterable, AsyncIterable]) -> AsyncIterator:
+    """将同步或异步可迭代对象统一为异步迭代"""
+    if hasattr(items, '__aiter__'):
+        async for item in items:
+            yield item
+    else:
+        for item in items:
+            yield item
+
 
 class InferenceEngine:
-    """推理引擎 - 协调所有分析步骤"""
+    """推理引擎 - 协调所有分析步骤
     
-    def __init__(self, skip_entity_recognition: bool = None):
+    引擎本身不保存请求级状态，ES客户端与LLM客户端均为线程安全的连接池，
+    因此一个实例可以在多个线程（如API的线程池）之间共享复用。
+    """
+    
+    def __init__(self, skip_entity_recognition: bool = None,
+                 es: Elasticsearch = None, llm_client: OpenAI = None):
         """初始化推理引擎
         
         Args:
             skip_entity_recognition: 是否跳过LLM实体识别
                                    None=从config读取，True/False=直接指定
+            es: 共享的Elasticsearch客户端，None则新建一个
+            llm_client: 共享的LLM客户端，None则新建一个
         """
-        # 从config读取配置
+        self._load_config(skip_entity_recognition)
+        
+        # 所有组件共享同一个ES连接池和LLM HTTP客户端
+        if llm_client is None:
+            load_env()
+            llm_client = get_llm_client()
+        self.es = es or get_es_client()
+        self.llm_client = llm_client
+        
+        # 统一使用EntityRecognizer（快速模式和完整模式都需要它的严格匹配逻辑）
+        self.indication_index = IndicationIndex.from_config(self.es, self.indication_index_config)
+        self.name_resolver = NameResolver.from_config(self.es, self.name_resolver_config)
+        self.entity_dictionary = EntityDictionary.from_config(self.es, self.entity_dictionary_config)
+        self.entity_recognizer = EntityRecognizer(
+            es=self.es, client=self.llm_client, name_resolver=self.name_resolver,
+            entity_dictionary=self.entity_dictionary
+        )
+        self.indication_analyzer = IndicationAnalyzer(
+            es=self.es, client=self.llm_client, indication_index=self.indication_index
+        )
+        self.result_generator = ResultGenerator()
+        self.result_cache = ResultCache.from_config(self.es, self.result_cache_config)
+        self.singleflight = SingleFlight() if self.singleflight_enabled else None
+        logger.info(f"推理引擎初始化完成 (快速模式: {self.skip_entity_recognition})")
+    
+    def _load_config(self, skip_entity_recognition: Optional[bool]):
+        """从config读取引擎配置"""
         inference_config = Config.get_inference_config()
         
         # skip_entity_recognition优先使用参数，其次使用config
@@ -32,13 +106,43 @@ class InferenceEngine:
         else:
             self.skip_entity_recognition = skip_entity_recognition
         
-        # 统一使用EntityRecognizer（快速模式和完整模式都需要它的严格匹配逻辑）
-        self.entity_recognizer = EntityRecognizer()
-        self.indication_analyzer = IndicationAnalyzer()
-        self.result_generator = ResultGenerator()
-        logger.info(f"推理引擎初始化完成 (快速模式: {self.skip_entity_recognition})")
+        # 批量分析的最大并发数（1=顺序执行）
+        batch_config = inference_config.get('batch', {})
+        self.batch_max_concurrency = max(1, int(batch_config.get('max_concurrency', 1)))
+        
+        self.result_cache_config = inference_config.get('result_cache', {})
+        self.indication_index_config = inference_config.get('indication_index', {})
+        self.name_resolver_config = inference_config.get('name_resolver', {})
+        self.entity_dictionary_config = inference_config.get('entity_dictionary', {})
+        
+        # 相同药品-疾病对的并发请求合并为一次计算
+        self.singleflight_enabled = inference_config.get('singleflight', {}).get('enabled', False)
+        
+        # 请求级时间预算（默认预算与各阶段上限）
+        self.deadline_config = inference_config.get('deadline', {})
     
-    def analyze(self, input_data: Dict[str, Any]) -> Dict[str, Any]:
+    def get_stats(self) -> Dict[str, Any]:
+        """运行统计（LLM响应缓存命中情况等）"""
+        llm_cache = self.indication_analyzer.llm_cache
+        disease_relations = self.indication_analyzer.rule_analyzer.disease_relations
+        rate_limiter = get_llm_rate_limiter()
+        circuit_breaker = self.indication_analyzer.circuit_breaker
+        hedger = get_llm_hedger()
+        return {
+            "llm_cache": llm_cache.stats() if llm_cache else None,
+            "result_cache": self.result_cache.stats() if self.result_cache else None,
+            "indication_index": self.indication_index.stats() if self.indication_index else None,
+            "name_resolver": self.name_resolver.stats() if self.name_resolver else None,
+            "entity_dictionary": self.entity_dictionary.stats() if self.entity_dictionary else None,
+            "disease_relations": disease_relations.stats() if disease_relations else None,
+            "singleflight": self.singleflight.stats() if self.singleflight else None,
+            "llm_transport": llm_transport_stats(),
+            "rate_limiter": rate_limiter.stats() if rate_limiter else None,
+            "circuit_breaker": circuit_breaker.stats() if circuit_breaker else None,
+            "hedging": hedger.stats() if hedger else None
+        }
+    
+    def analyze(self, input_data: Dict[str, Any], deadline_ms: Optional[float] = None) -> Dict[str, Any]:
         """单例分析
         
         Args:
@@ -48,20 +152,25 @@ class InferenceEngine:
                     "disease_name": "心力衰竭",
                     "patient": {...}  # 可选
                 }
+            deadline_ms: 时间预算（毫秒），None使用 inference.deadline.default_ms；
+                         LLM阶段超时时返回规则结论，metadata.degraded 为True
         
         Returns:
             Dict: 分析结果
         """
         try:
+            deadline = self._make_deadline(deadline_ms)
+            
             # 检查是否可以跳过实体识别（快速模式）
             if self.skip_entity_recognition and 'drug_name' in input_data and 'disease_name' in input_data:
                 logger.info("使用快速模式（跳过实体识别）...")
-                return self.analyze_fast(input_data)
+                return self.analyze_fast(input_data, deadline)
             
             # 正常流程：包含实体识别
             # 1. 实体识别
             logger.info("开始实体识别...")
-            recognized_entities = self.entity_recognizer.recognize(input_data)
+            with track_stage(deadline, "entities"):
+                recognized_entities = self.entity_recognizer.recognize(input_data)
             
             # 2. 创建病例对象
             case = Case(
@@ -69,92 +178,180 @@ class InferenceEngine:
                 recognized_entities=recognized_entities
             )
             
-            # 3. 适应症分析（返回Dict结构）
-            logger.info("开始适应症分析...")
-            synthesis_result = self.indication_analyzer.analyze_indication(case)
-            
-            # 4. 生成最终结果（传入synthesis_result）
-            logger.info("生成分析结果...")
-            final_result = self.result_generator.generate(case, synthesis_result)
-            
-            return final_result
+            # 3. 适应症分析 + 生成最终结果
+            return self._analyze_case(case, deadline)
             
         except Exception as e:
             logger.error(f"处理病例时发生错误: {str(e)}")
             raise
     
-    def analyze_fast(self, input_data: Dict[str, Any]) -> Dict[str, Any]:
+    def analyze_fast(self, input_data: Dict[str, Any], deadline: Optional[Deadline] = None) -> Dict[str, Any]:
         """快速分析（跳过LLM实体识别，直接使用严格的ES匹配）
         
         Args:
             input_data: 包含drug_name和disease_name的输入数据
+            deadline: 可选的时间预算
             
         Returns:
             Dict: 分析结果
         """
-        from .models import (RecognizedEntities, RecognizedDrug, RecognizedDisease,
-                           DrugMatch, DiseaseMatch, Context)
-        
         drug_name = input_data['drug_name']
         disease_name = input_data['disease_name']
         
-        # 直接使用统一的EntityRecognizer实例进行严格匹配
-        drug_matches = self.entity_recognizer._search_drug(drug_name, unique=True)
-        disease_matches = self.entity_recognizer._search_disease(disease_name, unique=True)
+        # 直接使用统一的EntityRecognizer实例进行严格匹配（药品与疾病一次_msearch对齐）
+        with track_stage(deadline, "entities"):
+            (drug_matches,), (disease_matches,) = self.entity_recognizer.resolve_entities(
+                [drug_name], [disease_name], unique=True
+            )
         
-        # 构建RecognizedEntities
-        drugs = []
-        if drug_matches:
-            drugs.append(RecognizedDrug(
-                name=drug_name,
-                matches=[DrugMatch(
-                    id=match['id'],
-                    standard_name=match['name'],
-                    score=match['_score']
-                ) for match in drug_matches]
-            ))
-        else:
-            # 药品未匹配：返回带警告的结果
-            logger.warning(f"药品'{drug_name}'在数据库中未找到匹配")
-            return {
-                "case_id": input_data.get('id', str(datetime.now().timestamp())),
+        if not drug_matches:
+            return self._drug_not_found_result(input_data, bool(disease_matches))
+        
+        case = self._build_fast_case(input_data, drug_matches, disease_matches)
+        
+        # 适应症分析 + 生成结果
+        return self._analyze_case(case, deadline)
+    
+    def _make_deadline(self, deadline_ms: Optional[float]) -> Optional[Deadline]:
+        """创建请求级时间预算，未设置预算时返回None"""
+        return Deadline.from_config(deadline_ms, self.deadline_config)
+    
+    def _analyze_case(self, case: Case, deadline: Optional[Deadline] = None) -> Dict[str, Any]:
+        """适应症分析并生成最终结果
+        
+        相同药品-疾病对命中结果缓存时直接返回；正在由其它请求计算时等待并共享其结果。
+        带时间预算的请求不参与合并（leader的耗时不受其预算约束）。
+        """
+        flight_key = self._flight_key(case) if self.singleflight is not None and deadline is None else None
+        if flight_key is None:
+            return self._compute_case(case, deadline)
+        result, shared = self.singleflight.do(flight_key, lambda: self._compute_case(case))
+        return self._coalesced_result(case, result) if shared else result
+    
+    def _compute_case(self, case: Case, deadline: Optional[Deadline] = None) -> Dict[str, Any]:
+        cache_key = None
+        if self.result_cache is not None:
+            cache_key = self._result_cache_key(case, self.result_cache.index_version())
+            cached = self.result_cache.get(cache_key) if cache_key else None
+            if cached is not None:
+                return self._cached_result(case, cached)
+        
+        logger.info("开始适应症分析...")
+        synthesis_result = self.indication_analyzer.analyze_indication(case, deadline)
+        
+        logger.info("生成分析结果...")
+        final_result = self.result_generator.generate(case, synthesis_result)
+        return self._store_result(cache_key, final_result, deadline)
+    
+    def _flight_key(self, case: Case):
+        """合并键（药品ID + 规范化疾病名，与结果缓存同粒度），药品未对齐时返回None（不合并）"""
+        drugs = case.recognized_entities.drugs
+        diseases = case.recognized_entities.diseases
+        if not drugs or not drugs[0].matches or not diseases:
+            return None
+        return (drugs[0].matches[0].id, normalize_name(diseases[0].name))
+    
+    def _coalesced_result(self, case: Case, result: Dict[str, Any]) -> Dict[str, Any]:
+        """复制leader的结果，并用当前病例的ID和原始名称填充"""
+        logger.info("合并到进行中的相同分析")
+        result = self._apply_case_identity(case, copy.deepcopy(result))
+        result["metadata"]["coalesced"] = True
+        return result
+    
+    def _result_cache_key(self, case: Case, index_version: Optional[str]):
+        """结果缓存键，药品未对齐或索引版本未知时返回None（不缓存）"""
+        drugs = case.recognized_entities.drugs
+        diseases = case.recognized_entities.diseases
+        if not index_version or not drugs or not drugs[0].matches or not diseases:
+            return None
+        return self.result_cache.make_key(drugs[0].matches[0].id, diseases[0].name, index_version)
+    
+    def _cached_result(self, case: Case, cached: Dict[str, Any]) -> Dict[str, Any]:
+        """用当前病例的ID和原始名称填充缓存结果"""
+        logger.info("命中结果缓存")
+        cached = self._apply_case_identity(case, cached)
+        cached["metadata"]["cache_hit"] = True
+        return cached
+    
+    def _apply_case_identity(self, case: Case, result: Dict[str, Any]) -> Dict[str, Any]:
+        result["case_id"] = case.id
+        result["drug_info"]["name"] = case.recognized_entities.drugs[0].name
+        result["disease_info"]["name"] = case.recognized_entities.diseases[0].name
+        return result
+    
+    def _store_result(self, cache_key, final_result: Dict[str, Any],
+                      deadline: Optional[Deadline] = None) -> Dict[str, Any]:
+        """标记结果来源并写入结果缓存（降级结果不缓存）"""
+        final_result["metadata"]["cache_hit"] = False
+        if cache_key is not None and not final_result["metadata"].get("degraded"):
+            self.result_cache.set(cache_key, final_result)
+        if deadline is not None:
+            final_result["metadata"]["deadline"] = deadline.summary()
+        return final_result
+    
+    def _drug_not_found_result(self, input_data: Dict[str, Any], disease_matched: bool) -> Dict[str, Any]:
+        """药品未匹配：返回带警告的结果"""
+        drug_name = input_data['drug_name']
+        disease_name = input_data['disease_name']
+        logger.warning(f"药品'{drug_name}'在数据库中未找到匹配")
+        return {
+            "case_id": input_data.get('id', str(datetime.now().timestamp())),
+            "analysis_time": datetime.now().isoformat(),
+            "drug_info": {
+                "id": None,
+                "name": drug_name,
+                "standard_name": None,
+                "match_status": "not_found"
+            },
+            "disease_info": {
+                "id": None,
+                "name": disease_name,
+                "standard_name": None
+            },
+            "is_offlabel": None,
+            "analysis_details": {
+                "error": "药品信息缺失",
+                "message": f"药品'{drug_name}'在数据库中未找到匹配，可能原因：1) 药品名称不标准 2) 数据库中无此药品 3) 药品类别名而非具体药品",
+                "suggestion": "请检查药品名称是否正确，或使用具体的药品名称而非类别名"
+            },
+            "metadata": {
                 "analysis_time": datetime.now().isoformat(),
-                "drug_info": {
-                    "id": None,
-                    "name": drug_name,
-                    "standard_name": None,
-                    "match_status": "not_found"
-                },
-                "disease_info": {
-                    "id": None,
-                    "name": disease_name,
-                    "standard_name": None
-                },
-                "is_offlabel": None,
-                "analysis_details": {
-                    "error": "药品信息缺失",
-                    "message": f"药品'{drug_name}'在数据库中未找到匹配，可能原因：1) 药品名称不标准 2) 数据库中无此药品 3) 药品类别名而非具体药品",
-                    "suggestion": "请检查药品名称是否正确，或使用具体的药品名称而非类别名"
-                },
-                "metadata": {
-                    "analysis_time": datetime.now().isoformat(),
-                    "mode": "fast",
-                    "data_availability": {
-                        "drug_matched": False,
-                        "disease_matched": bool(disease_matches)
-                    }
+                "mode": "fast",
+                "data_availability": {
+                    "drug_matched": False,
+                    "disease_matched": disease_matched
                 }
             }
+        }
+    
+    def _build_fast_case(self, input_data: Dict[str, Any],
+                         drug_matches: List[Dict], disease_matches: List[Dict]) -> Case:
+        """根据快速模式的ES匹配结果构建病例对象"""
+        from .models import (RecognizedEntities, RecognizedDrug, RecognizedDisease,
+                           DrugMatch, DiseaseMatch, Context)
+        
+        drug_name = input_data['drug_name']
+        disease_name = input_data['disease_name']
+        
+        # 构建RecognizedEntities
+        drugs = [RecognizedDrug(
+            name=drug_name,
+            matches=[DrugMatch(
+                id=match['id'],
+                standard_name=match['name'],
+                score=match['_score']
+            ) for match in drug_matches]
+        )]
         
-        diseases = []
-        diseases.append(RecognizedDisease(
+        diseases = [RecognizedDisease(
             name=disease_name,
             matches=[DiseaseMatch(
                 id=match['id'],
                 standard_name=match['name'],
-                score=match['_score']
+                score=match['_score'],
+                match_type=match.get('match_type', 'exact')
             ) for match in disease_matches] if disease_matches else []
-        ))
+        )]
         
         recognized_entities = RecognizedEntities(
             drugs=drugs,
@@ -166,59 +363,354 @@ class InferenceEngine:
         )
         
         # 创建病例对象
-        case = Case(
+        return Case(
             id=input_data.get('id', str(datetime.now().timestamp())),
             recognized_entities=recognized_entities
         )
-        
-        # 适应症分析
-        synthesis_result = self.indication_analyzer.analyze_indication(case)
-        
-        # 生成结果
-        final_result = self.result_generator.generate(case, synthesis_result)
-        
-        return final_result
     
-    def analyze_batch(self, input_data_list: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    def analyze_batch(self, input_data_list: List[Dict[str, Any]],
+                      max_concurrency: int = None,
+                      progress_callback: ProgressCallback = None) -> List[Dict[str, Any]]:
         """批量分析
         
+        批量耗时主要受ES与LLM网络延迟限制，因此使用线程池并发执行；
+        单个病例失败不影响其他病例，结果顺序与输入顺序一致。
+        
         Args:
             input_data_list: 输入数据列表
+            max_concurrency: 最大并发数，None=从config读取（inference.batch.max_concurrency）
+            progress_callback: 每完成一个病例调用一次 (已完成数, 总数, 序号, 结果)
         
         Returns:
             List[Dict]: 分析结果列表
         """
-        results = []
         total = len(input_data_list)
+        max_concurrency = max(1, max_concurrency or self.batch_max_concurrency)
+        results: List[Optional[Dict[str, Any]]] = [None] * total
+        
+        logger.info(f"开始批量分析: {total} 个病例 (并发数: {max_concurrency})")
+        
+        def record(idx: int, result: Dict[str, Any], completed: int):
+            results[idx] = result
+            if progress_callback:
+                progress_callback(completed, total, idx, result)
+        
+        if max_concurrency == 1:
+            for idx, input_data in enumerate(input_data_list):
+                record(idx, self._analyze_isolated(idx, total, input_data), idx + 1)
+        else:
+            with ThreadPoolExecutor(max_workers=min(max_concurrency, total or 1)) as executor:
+                futures = {
+                    executor.submit(self._analyze_isolated, idx, total, input_data): idx
+                    for idx, input_data in enumerate(input_data_list)
+                }
+                for completed, future in enumerate(as_completed(futures), 1):
+                    record(futures[future], future.result(), completed)
+        
+        logger.info(f"批量分析完成: 成功 {len([r for r in results if 'error' not in r])}/{total}")
+        return results
+    
+    def _analyze_isolated(self, idx: int, total: int, input_data: Dict[str, Any]) -> Dict[str, Any]:
+        """分析单个病例，异常转换为错误结果（批量分析中的错误隔离）"""
+        try:
+            logger.info(f"处理 {idx + 1}/{total}: {input_data.get('drug_name', 'unknown')} - {input_data.get('disease_name', 'unknown')}")
+            return self.analyze(input_data)
+        except Exception as e:
+            return self._batch_error_result(input_data, e)
+    
+    def _batch_error_result(self, input_data: Dict[str, Any], error: Exception) -> Dict[str, Any]:
+        """构建批量分析中单个病例的错误结果"""
+        logger.error(f"处理病例 {input_data.get('id', 'unknown')} 时发生错误: {str(error)}")
+        return {
+            "id": input_data.get('id', 'unknown'),
+            "error": str(error),
+            "retryable": is_transient_error(error),
+            "input": input_data
+        }
+
+
+class AsyncInferenceEngine(InferenceEngine):
+    """异步推理引擎 - 与InferenceEngine流程一致，ES与LLM调用全程异步
+    
+    供FastAPI等事件循环环境使用：单个worker即可同时挂起大量LLM请求，
+    取消analyze任务会一并取消正在进行的ES/LLM请求。
+    """
+    
+    def __init__(self, skip_entity_recognition: bool = None,
+                 es: AsyncElasticsearch = None, llm_client: AsyncOpenAI = None):
+        """初始化异步推理引擎
+        
+        Args:
+            skip_entity_recognition: 是否跳过LLM实体识别
+                                   None=从config读取，True/False=直接指定
+            es: 共享的AsyncElasticsearch客户端，None则新建一个
+            llm_client: 共享的异步LLM客户端，None则新建一个
+        """
+        self._load_config(skip_entity_recognition)
+        
+        if llm_client is None:
+            load_env()
+            llm_client = get_async_llm_client()
+        self.es = es or get_async_es_client()
+        self.llm_client = llm_client
+        
+        # 内存快照的导出与刷新在后台线程中进行，使用单独的同步ES客户端
+        snapshot_es = None
+        snapshot_configs = (self.indication_index_config, self.name_resolver_config, self.entity_dictionary_config)
+        if any(config.get('enabled', False) for config in snapshot_configs):
+            snapshot_es = get_es_client()
+        self.indication_index = IndicationIndex.from_config(snapshot_es, self.indication_index_config)
+        self.name_resolver = NameResolver.from_config(snapshot_es, self.name_resolver_config)
+        self.entity_dictionary = EntityDictionary.from_config(snapshot_es, self.entity_dictionary_config)
+        self.entity_recognizer = AsyncEntityRecognizer(
+            es=self.es, client=self.llm_client, name_resolver=self.name_resolver,
+            entity_dictionary=self.entity_dictionary
+        )
+        self.indication_analyzer = AsyncIndicationAnalyzer(
+            es=self.es, client=self.llm_client, indication_index=self.indication_index
+        )
+        self.result_generator = ResultGenerator()
+        self.result_cache = AsyncResultCache.from_config(self.es, self.result_cache_config)
+        self.singleflight = AsyncSingleFlight() if self.singleflight_enabled else None
+        logger.info(f"异步推理引擎初始化完成 (快速模式: {self.skip_entity_recognition})")
+    
+    async def analyze(self, input_data: Dict[str, Any], emit: Optional[EventCallback] = None,
+                      deadline_ms: Optional[float] = None) -> Dict[str, Any]:
+        """单例分析（异步版）
+        
+        Args:
+            input_data: 输入数据
+            emit: 可选的阶段事件回调（entities、evidence、rules、llm_token），见 analyze_stream
+            deadline_ms: 时间预算（毫秒），各阶段按 inference.deadline 的上限超时；
+                         LLM阶段超时时返回规则结论（metadata.degraded），实体识别超时抛出 DeadlineExceededError
+        """
+        try:
+            deadline = self._make_deadline(deadline_ms)
+            if self.skip_entity_recognition and 'drug_name' in input_data and 'disease_name' in input_data:
+                logger.info("使用快速模式（跳过实体识别）...")
+                return await self.analyze_fast(input_data, emit, deadline)
+            
+            logger.info("开始实体识别...")
+            recognized_entities = await run_stage(deadline, "entities", self.entity_recognizer.recognize(input_data))
+            
+            case = Case(
+                id=input_data.get('id', str(datetime.now().timestamp())),
+                recognized_entities=recognized_entities
+            )
+            
+            return await self._analyze_case(case, emit, deadline)
+            
+        except Exception as e:
+            logger.error(f"处理病例时发生错误: {str(e)}")
+            raise
+    
+    async def analyze_fast(self, input_data: Dict[str, Any], emit: Optional[EventCallback] = None,
+                           deadline: Optional[Deadline] = None) -> Dict[str, Any]:
+        """快速分析（异步版）"""
+        drug_name = input_data['drug_name']
+        disease_name = input_data['disease_name']
+        
+        (drug_matches,), (disease_matches,) = await run_stage(
+            deadline, "entities", self.entity_recognizer.resolve_entities([drug_name], [disease_name], unique=True)
+        )
+        
+        if not drug_matches:
+            return self._drug_not_found_result(input_data, bool(disease_matches))
         
-        logger.info(f"开始批量分析: {total} 个病例")
+        case = self._build_fast_case(input_data, drug_matches, disease_matches)
+        return await self._analyze_case(case, emit, deadline)
+    
+    async def _analyze_case(self, case: Case, emit: Optional[EventCallback] = None,
+                            deadline: Optional[Deadline] = None) -> Dict[str, Any]:
+        """适应症分析并生成最终结果（异步版）
+        
+        流式请求（emit不为空）需要各阶段事件，带时间预算的请求受自身预算约束，均不参与合并。
+        """
+        if emit:
+            entities = case.recognized_entities
+            emit("entities", {
+                "drugs": [asdict(drug) for drug in entities.drugs],
+                "diseases": [asdict(disease) for disease in entities.diseases]
+            })
+        
+        coalescible = self.singleflight is not None and emit is None and deadline is None
+        flight_key = self._flight_key(case) if coalescible else None
+        if flight_key is None:
+            return await self._compute_case(case, emit, deadline)
+        result, shared = await self.singleflight.do(flight_key, lambda: self._compute_case(case))
+        return self._coalesced_result(case, result) if shared else result
+    
+    async def _compute_case(self, case: Case, emit: Optional[EventCallback] = None,
+                            deadline: Optional[Deadline] = None) -> Dict[str, Any]:
+        cache_key = None
+        if self.result_cache is not None:
+            cache_key = self._result_cache_key(case, await self.result_cache.index_version())
+            cached = self.result_cache.get(cache_key) if cache_key else None
+            if cached is not None:
+                return self._cached_result(case, cached)
+        
+        logger.info("开始适应症分析...")
+        synthesis_result = await self.indication_analyzer.analyze_indication(case, emit, deadline)
+        
+        logger.info("生成分析结果...")
+        final_result = self.result_generator.generate(case, synthesis_result)
+        return self._store_result(cache_key, final_result, deadline)
+    
+    async def analyze_stream(self, input_data: Dict[str, Any],
+                             deadline_ms: Optional[float] = None) -> AsyncIterator[Tuple[str, Dict[str, Any]]]:
+        """流式分析：各阶段完成时立即产出事件
+        
+        事件依次为 entities（实体对齐）、evidence（知识检索）、rules（规则结论）、
+        llm_token（LLM流式输出片段，可能多次）、result（最终结果）；
+        命中结果缓存或规则已有定论时会跳过中间事件，出错时以 error 事件结束。
+        关闭生成器（如客户端断开）会取消正在进行的分析任务。
         
-        for idx, input_data in enumerate(input_data_list, 1):
+        Yields:
+            Tuple[str, Dict]: (事件名, 数据)
+        """
+        queue: asyncio.Queue = asyncio.Queue()
+        
+        def emit(event: str, data: Dict[str, Any]):
+            queue.put_nowait((event, data))
+        
+        async def run():
             try:
-                logger.info(f"处理 {idx}/{total}: {input_data.get('drug_name', 'unknown')} - {input_data.get('disease_name', 'unknown')}")
-                result = self.analyze(input_data)
-                results.append(result)
-                
+                emit("result", await self.analyze(input_data, emit, deadline_ms))
             except Exception as e:
-                logger.error(f"处理病例 {input_data.get('id', 'unknown')} 时发生错误: {str(e)}")
-                results.append({
-                    "id": input_data.get('id', 'unknown'),
-                    "error": str(e),
-                    "input": input_data
-                })
+                emit("error", {"error": str(e)})
+            finally:
+                queue.put_nowait(None)
+        
+        task = asyncio.ensure_future(run())
+        try:
+            while True:
+                item = await queue.get()
+                if item is None:
+                    break
+                yield item
+        finally:
+            if not task.done():
+                task.cancel()
+    
+    async def analyze_batch(self, input_data_list: List[Dict[str, Any]],
+                            max_concurrency: int = None,
+                            progress_callback: ProgressCallback = None) -> List[Dict[str, Any]]:
+        """批量分析（异步版，使用信号量限制同时进行的病例数）"""
+        total = len(input_data_list)
+        max_concurrency = max(1, max_concurrency or self.batch_max_concurrency)
+        semaphore = asyncio.Semaphore(max_concurrency)
+        completed = 0
+        
+        logger.info(f"开始批量分析: {total} 个病例 (并发数: {max_concurrency})")
+        
+        async def run(idx: int, input_data: Dict[str, Any]) -> Dict[str, Any]:
+            nonlocal completed
+            async with semaphore:
+                result = await self._analyze_isolated(idx, total, input_data)
+            completed += 1
+            if progress_callback:
+                progress_callback(completed, total, idx, result)
+            return result
+        
+        results = await asyncio.gather(*[
+            run(idx, input_data) for idx, input_data in enumerate(input_data_list)
+        ])
         
         logger.info(f"批量分析完成: 成功 {len([r for r in results if 'error' not in r])}/{total}")
-        return results
+        return list(results)
+    
+    async def analyze_batch_stream(self, inputs: Union[Iterable, AsyncIterable],
+                                   max_concurrency: int = None) -> AsyncIterator[Tuple[int, Dict[str, Any]]]:
+        """流式批量分析：按完成顺序产出 (输入序号, 结果)
+        
+        输入逐个拉取，同时最多只持有max_concurrency个进行中的病例，
+        结果产出后即释放，内存占用与批量大小无关。关闭生成器会取消进行中的病例。
+        
+        Args:
+            inputs: 输入数据的同步或异步可迭代对象；元素为异常实例时（如调用方解析失败的行）
+                直接产出对应的错误结果
+            max_concurrency: 最大并发数，None时使用配置的batch_max_concurrency
+        
+        Yields:
+            Tuple[int, Dict]: (输入序号, 分析结果或错误结果)
+        """
+        max_concurrency = max(1, max_concurrency or self.batch_max_concurrency)
+        pending: Dict[asyncio.Future, int] = {}
+        items = _aiter(inputs)
+        exhausted = False
+        total = succeeded = 0
+        
+        logger.info(f"开始流式批量分析 (并发数: {max_concurrency})")
+        try:
+            while True:
+                while not exhausted and len(pending) < max_concurrency:
+                    try:
+                        input_data = await items.__anext__()
+                    except StopAsyncIteration:
+                        exhausted = True
+                        break
+                    pending[asyncio.ensure_future(self._analyze_streamed(total, input_data))] = total
+                    total += 1
+                if not pending:
+                    break
+                done, _ = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    result = task.result()
+                    succeeded += 'error' not in result
+                    yield pending.pop(task), result
+        finally:
+            for task in pending:
+                task.cancel()
+            logger.info(f"流式批量分析结束: 成功 {succeeded}/{total}")
+    
+    async def _analyze_streamed(self, idx: int, input_data: Any) -> Dict[str, Any]:
+        """流式批量中的单个病例，输入本身是异常时直接转换为错误结果"""
+        if isinstance(input_data, Exception):
+            logger.error(f"病例 {idx} 输入无效: {str(input_data)}")
+            return {"id": "unknown", "error": str(input_data)}
+        try:
+            logger.info(f"处理 #{idx + 1}: {input_data.get('drug_name', 'unknown')} - {input_data.get('disease_name', 'unknown')}")
+            return await self.analyze(input_data)
+        except Exception as e:
+            return self._batch_error_result(input_data, e)
+    
+    async def _analyze_isolated(self, idx: int, total: int, input_data: Dict[str, Any]) -> Dict[str, Any]:
+        """分析单个病例，异常转换为错误结果（异步版）"""
+        try:
+            logger.info(f"处理 {idx + 1}/{total}: {input_data.get('drug_name', 'unknown')} - {input_data.get('disease_name', 'unknown')}")
+            return await self.analyze(input_data)
+        except Exception as e:
+            return self._batch_error_result(input_data, e)
+    
+    async def close(self):
+        """关闭ES与LLM客户端连接"""
+        for snapshot in (self.indication_index, self.name_resolver, self.entity_dictionary):
+            if snapshot is not None:
+                snapshot.stop()
+        await self.llm_client.close()
+        await self.es.close()
+
+
+_shared_engine: Optional[InferenceEngine] = None
+_shared_engine_lock = threading.Lock()
+
+
+def get_shared_engine() -> InferenceEngine:
+    """获取进程内共享的推理引擎（首次调用时创建）"""
+    global _shared_engine
+    if _shared_engine is None:
+        with _shared_engine_lock:
+            if _shared_engine is None:
+                _shared_engine = InferenceEngine()
+    return _shared_engine
 
 
 # 保持向后兼容的函数接口
 def process_case(input_data: Dict[str, Any]) -> Dict[str, Any]:
-    """处理单个病例 (向后兼容接口)"""
-    engine = InferenceEngine()
-    return engine.analyze(input_data)
+    """处理单个病例 (向后兼容接口，复用共享引擎)"""
+    return get_shared_engine().analyze(input_data)
 
 
 def batch_process(input_data_list: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
-    """批量处理 (向后兼容接口)"""
-    engine = InferenceEngine()
-    return engine.analyze_batch(input_data_list)
+    """批量处理 (向后兼容接口，复用共享引擎)"""
+    return get_shared_engine().analyze_batch(input_data_list)
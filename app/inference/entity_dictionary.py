@@ -0,0 +1,211 @@
+"""基于词典的药品/疾病实体识别
+
+用drugs、diseases索引中的全部名称编译Aho-Corasick自动机，线性时间扫描病例描述，
+取最长且互不重叠的命中作为实体。命中结果明确时（恰好一个药品、一个疾病，
+且没有既是药品名又是疾病名的片段）直接作为初步识别结果，不再调用LLM；
+未命中或存在歧义时返回None，由调用方回退到LLM实体识别。
+
+药品除原始名称外另加入去掉剂型后缀的名称（描述中常写"美托洛尔"而不是"美托洛尔片"）。
+编译好的自动机连同索引版本序列化到磁盘，索引未变化时启动直接加载，无需重新导出名称。
+"""
+
+import logging
+import os
+import pickle
+from typing import Any, Dict, List, Optional
+
+from elasticsearch import Elasticsearch
+
+from app.shared import get_index_version, iter_index_docs
+from .aho_corasick import AhoCorasick, fold_text, is_ascii_word_char
+from .index_snapshot import IndexSnapshot
+from .name_resolver import ENTITY_KINDS, normalize_name
+
+logger = logging.getLogger(__name__)
+
+# 参与匹配的最短名称（单字名称在描述中误命中过多）
+MIN_PATTERN_LENGTH = 2
+
+# 磁盘缓存格式版本，自动机结构变化时递增
+CACHE_FORMAT_VERSION = 1
+
+
+class EntityDictionary(IndexSnapshot):
+    """药品/疾病名称词典（自动机构建完成后只读）"""
+
+    name = "实体词典"
+
+    def __init__(self, es: Elasticsearch = None, drugs_index: str = 'drugs', diseases_index: str = 'diseases',
+                 refresh_interval: float = 300.0, page_size: int = 5000, cache_path: Optional[str] = None):
+        """初始化词典（不立即加载）
+
+        Args:
+            es: 同步ES客户端
+            drugs_index: 药品索引名
+            diseases_index: 疾病索引名
+            refresh_interval: 后台检查索引版本的间隔（秒）
+            page_size: 导出时每页条数
+            cache_path: 自动机的磁盘缓存路径，None表示不缓存
+        """
+        super().__init__(es, [drugs_index, diseases_index], refresh_interval, page_size)
+        self.index_names = {"drug": drugs_index, "disease": diseases_index}
+        self.cache_path = cache_path
+        self._automaton: Optional[AhoCorasick] = None
+        self.counters = {"scans": 0, "decisive": 0, "no_match": 0, "ambiguous": 0}
+
+    @classmethod
+    def from_config(cls, es: Elasticsearch, config: Dict[str, Any]):
+        """根据配置创建并启动后台加载，未启用时返回None"""
+        if not config.get('enabled', False):
+            return None
+        dictionary = cls(
+            es,
+            refresh_interval=config.get('refresh_interval', 300.0),
+            page_size=config.get('page_size', 5000),
+            cache_path=config.get('cache_path')
+        )
+        dictionary.start_background_refresh()
+        return dictionary
+
+    def _build(self):
+        """优先从磁盘缓存加载与当前索引版本一致的自动机，否则导出名称重新编译"""
+        version = get_index_version(self.es, self.indices)
+        automaton = self._load_cached(version)
+        if automaton is None:
+            automaton = self._compile()
+            self._save_cached(automaton, version)
+        self._automaton = automaton
+
+    def _compile(self) -> AhoCorasick:
+        """导出全部名称并编译自动机"""
+        surfaces: Dict[str, Dict[str, set]] = {}
+        for kind in ENTITY_KINDS:
+            for hit in iter_index_docs(self.es, self.index_names[kind], source=['name'],
+                                       page_size=self.page_size):
+                name = hit['_source'].get('name')
+                if not name:
+                    continue
+                patterns = {fold_text(name)}
+                if kind == "drug":
+                    patterns.add(normalize_name(name, strip_dosage_form=True))
+                for pattern in patterns:
+                    if len(pattern) >= MIN_PATTERN_LENGTH:
+                        surfaces.setdefault(pattern, {}).setdefault(kind, set()).add(name)
+
+        automaton = AhoCorasick()
+        for pattern, kinds in surfaces.items():
+            automaton.add(pattern, {kind: tuple(sorted(names)) for kind, names in kinds.items()})
+        automaton.finalize()
+        logger.info(f"{self.name}: 编译完成, 模式 {len(automaton)} 个, 状态 {len(automaton._goto)} 个")
+        return automaton
+
+    def _load_cached(self, version: str) -> Optional[AhoCorasick]:
+        if not self.cache_path or not os.path.exists(self.cache_path):
+            return None
+        try:
+            with open(self.cache_path, 'rb') as f:
+                cached = pickle.load(f)
+        except Exception as e:
+            logger.warning(f"读取{self.name}缓存失败: {str(e)}")
+            return None
+        if cached.get('format') != CACHE_FORMAT_VERSION or cached.get('version') != version:
+            logger.info(f"{self.name}缓存已过期 (缓存版本 {cached.get('version')})")
+            return None
+        logger.info(f"{self.name}: 从缓存加载 {self.cache_path}")
+        return cached['automaton']
+
+    def _save_cached(self, automaton: AhoCorasick, version: str):
+        if not self.cache_path:
+            return
+        try:
+            os.makedirs(os.path.dirname(self.cache_path) or '.', exist_ok=True)
+            tmp_path = f"{self.cache_path}.tmp"
+            with open(tmp_path, 'wb') as f:
+                pickle.dump({'format': CACHE_FORMAT_VERSION, 'version': version, 'automaton': automaton},
+                            f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_path, self.cache_path)
+        except Exception as e:
+            logger.warning(f"写入{self.name}缓存失败: {str(e)}")
+
+    def scan(self, text: str) -> List[Dict[str, Any]]:
+        """扫描文本，返回最长且互不重叠的命中
+
+        Returns:
+            List[Dict]: 按出现位置排序的命中，每项含 start/end/text/kinds（kind -> 标准名称）
+        """
+        automaton = self._automaton
+        if automaton is None or not text:
+            return []
+        folded = fold_text(text)
+
+        candidates = []
+        for start, end, pattern_id in automaton.iter_matches(folded):
+            # 英文/数字名称要求词边界，避免 "ACE" 命中 "PACE"
+            if is_ascii_word_char(folded[start]) and start > 0 and is_ascii_word_char(folded[start - 1]):
+                continue
+            if is_ascii_word_char(folded[end - 1]) and end < len(folded) and is_ascii_word_char(folded[end]):
+                continue
+            candidates.append((start, end, pattern_id))
+
+        # 长的优先，等长时靠前的优先
+        candidates.sort(key=lambda item: (item[0] - item[1], item[0]))
+        occupied = [False] * len(folded)
+        selected = []
+        for start, end, pattern_id in candidates:
+            if any(occupied[start:end]):
+                continue
+            for i in range(start, end):
+                occupied[i] = True
+            selected.append({
+                "start": start,
+                "end": end,
+                "text": text[start:end],
+                "kinds": automaton.payloads[pattern_id]
+            })
+        selected.sort(key=lambda item: item["start"])
+        return selected
+
+    def recognize(self, description: str) -> Optional[Dict[str, Any]]:
+        """从描述中识别药品和疾病
+
+        Returns:
+            Optional[Dict]: 与LLM实体识别相同格式的初步结果
+                {"drugs": [{"name"}], "diseases": [{"name"}], "context": {"description"}}；
+                词典未就绪、未命中或有歧义时返回None
+        """
+        if not self.ready:
+            return None
+        self.counters["scans"] += 1
+        spans = self.scan(description)
+
+        drugs, diseases = [], []
+        for span in spans:
+            kinds = span["kinds"]
+            if len(kinds) > 1:
+                # 既是药品名又是疾病名
+                self.counters["ambiguous"] += 1
+                return None
+            target = drugs if "drug" in kinds else diseases
+            if fold_text(span["text"]) not in [fold_text(name) for name in target]:
+                target.append(span["text"])
+
+        if not drugs or not diseases:
+            self.counters["no_match"] += 1
+            return None
+        if len(drugs) > 1 or len(diseases) > 1:
+            self.counters["ambiguous"] += 1
+            logger.debug(f"词典识别有歧义: 药品 {drugs}, 疾病 {diseases}")
+            return None
+
+        self.counters["decisive"] += 1
+        return {
+            "drugs": [{"name": drugs[0]}],
+            "diseases": [{"name": diseases[0]}],
+            "context": {"description": description}
+        }
+
+    def stats(self) -> Dict[str, Any]:
+        stats = super().stats()
+        stats.update(self.counters)
+        stats["patterns"] = len(self._automaton) if self._automaton else 0
+        return stats
@@ -1,21 +1,24 @@
 """实体识别模块"""
 
-import os
 import json
 import logging
 import re
 from datetime import datetime
 from typing import Dict, Any, Optional, List, Tuple
-from openai import OpenAI
-from elasticsearch import Elasticsearch
+from openai import OpenAI, AsyncOpenAI
+from elasticsearch import Elasticsearch, AsyncElasticsearch
 
-from app.shared import get_es_client, load_env
+from app.shared import (
+    get_es_client, get_async_es_client, get_llm_client, get_async_llm_client, load_env,
+    create_chat_completion, create_chat_completion_async, LLMResponseCache, get_llm_cache
+)
 from .models import (
     RecognizedEntities, RecognizedDrug as Drug, 
     RecognizedDisease as Disease, Context, 
     DrugMatch, DiseaseMatch
 )
 from .prompt import create_entity_recognition_prompt
+from .name_resolver import strip_dosage_forms, names_similar
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -23,11 +26,16 @@ logger = logging.getLogger(__name__)
 class EntityRecognizer:
     """实体识别器 - 识别输入中的药品和疾病实体并与数据库对齐"""
     
-    def __init__(self, es: Elasticsearch = None):
+    def __init__(self, es: Elasticsearch = None, client: OpenAI = None,
+                 llm_cache: LLMResponseCache = None, name_resolver=None, entity_dictionary=None):
         """初始化识别器
         
         Args:
-            es: Elasticsearch客户端实例
+            es: Elasticsearch客户端实例（传入时复用其连接池）
+            client: LLM客户端实例（传入时复用其HTTP连接池）
+            llm_cache: LLM响应缓存（默认使用config.yaml配置的进程级缓存）
+            name_resolver: 可选的NameResolver，名称在本地命中时不访问ES
+            entity_dictionary: 可选的EntityDictionary，词典识别结果明确时不调用LLM
         """
         # Elasticsearch设置
         self.es = es or get_es_client()
@@ -35,12 +43,14 @@ class EntityRecognizer:
         self.diseases_index = 'diseases'
         
         # DeepSeek API 设置
-        load_env()
-        self.client = OpenAI(
-            api_key=os.getenv("DEEPSEEK_API_KEY"),
-            base_url="https://api.deepseek.com"
-        )
+        if client is None:
+            load_env()
+            client = get_llm_client()
+        self.client = client
         self.model = "deepseek-chat"
+        self.llm_cache = llm_cache or get_llm_cache()
+        self.name_resolver = name_resolver
+        self.entity_dictionary = entity_dictionary
     
     def _clean_json_string(self, json_str: str) -> str:
         """清理JSON字符串，移除无效字符
@@ -88,6 +98,99 @@ class EntityRecognizer:
         # 清理JSON字符串
         return think_content, self._clean_json_string(json_str)
     
+    def _build_exact_drug_query(self, name: str, unique: bool = False) -> Dict:
+        """构建药品精确匹配查询（term + match_phrase）"""
+        return {
+            "query": {
+                "bool": {
+                    "should": [
+                        {"term": {"name.keyword": name}},  # 完全相等
+                        {"match_phrase": {"name": name}}   # 短语匹配
+                    ],
+                    "minimum_should_match": 1
+                }
+            },
+            "size": 1 if unique else 3
+        }
+    
+    def _build_fuzzy_drug_query(self, name: str) -> Dict:
+        """构建药品严格模糊匹配查询（只匹配name字段，不匹配details）"""
+        # 使用 match 并设置最小相似度
+        return {
+            "query": {
+                "match": {
+                    "name": {
+                        "query": name,
+                        "minimum_should_match": "75%"  # 至少75%的词匹配
+                    }
+                }
+            },
+            "size": 10  # 多取一些候选，后面会过滤
+        }
+    
+    def _validate_exact_drug_hits(self, name: str, hits: List[Dict]) -> List[Dict]:
+        """验证精确匹配结果的名称相似度"""
+        validated_exact_results = []
+        for hit in hits:
+            matched_name = hit['_source'].get('name', '')
+            score = hit.get('_score', 0)
+            
+            # 即使是精确匹配的结果，也要验证相似度
+            # 避免 match_phrase 匹配到不相关的结果
+            is_valid = (
+                name == matched_name or  # 完全相同
+                name in matched_name or  # 查询名是匹配名的子串
+                matched_name in name or  # 匹配名是查询名的子串
+                self._check_name_similarity(name, matched_name)
+            )
+            
+            if is_valid:
+                validated_exact_results.append({
+                    'id': hit['_source'].get('id', ''),
+                    'name': matched_name,
+                    '_score': score
+                })
+            else:
+                logger.debug(f"药品'{name}'精确匹配'{matched_name}'但相似度不足，跳过")
+        
+        if validated_exact_results:
+            logger.info(f"药品'{name}'精确匹配: {[r['name'] for r in validated_exact_results]}")
+        return validated_exact_results
+    
+    def _validate_fuzzy_drug_hits(self, name: str, hits: List[Dict], unique: bool = False) -> List[Dict]:
+        """验证模糊匹配结果的名称相似度"""
+        validated_results = []
+        for hit in hits:
+            matched_name = hit['_source'].get('name', '')
+            score = hit.get('_score', 0)
+            
+            # 验证逻辑：
+            # 1. 查询名称必须是匹配名称的子串，或反之
+            # 2. 或者匹配名称包含查询名称的所有主要字符
+            is_valid = (
+                name in matched_name or 
+                matched_name in name or
+                self._check_name_similarity(name, matched_name)
+            )
+            
+            if is_valid:
+                validated_results.append({
+                    'id': hit['_source'].get('id', ''),
+                    'name': matched_name,
+                    '_score': score
+                })
+                if unique:
+                    break
+            else:
+                logger.debug(f"药品'{name}'与'{matched_name}'不相似，跳过")
+        
+        if validated_results:
+            logger.info(f"药品'{name}'模糊匹配: {[r['name'] for r in validated_results[:3]]}")
+        else:
+            logger.warning(f"药品'{name}'未找到匹配结果")
+        
+        return validated_results[:5] if not unique else validated_results[:1]
+    
     def _search_drug(self, name: str, unique: bool = False) -> List[Dict]:
         """在ES中搜索药品 - 严格匹配策略
         
@@ -102,100 +205,29 @@ class EntityRecognizer:
         Returns:
             List[Dict]: 匹配的药品信息列表
         """
+        local_matches = self._resolve_locally("drug", name, unique)
+        if local_matches is not None:
+            return local_matches
+        
         try:
             # 第一步：精确匹配（term + match_phrase）
-            exact_query = {
-                "query": {
-                    "bool": {
-                        "should": [
-                            {"term": {"name.keyword": name}},  # 完全相等
-                            {"match_phrase": {"name": name}}   # 短语匹配
-                        ],
-                        "minimum_should_match": 1
-                    }
-                },
-                "size": 1 if unique else 3
-            }
-            result = self.es.search(index=self.drugs_index, body=exact_query)
+            result = self.es.search(index=self.drugs_index, body=self._build_exact_drug_query(name, unique))
             hits = result['hits']['hits']
             
             # 如果有精确匹配结果，也需要验证相似度
             if hits:
-                validated_exact_results = []
-                for hit in hits:
-                    matched_name = hit['_source'].get('name', '')
-                    score = hit.get('_score', 0)
-                    
-                    # 即使是精确匹配的结果，也要验证相似度
-                    # 避免 match_phrase 匹配到不相关的结果
-                    is_valid = (
-                        name == matched_name or  # 完全相同
-                        name in matched_name or  # 查询名是匹配名的子串
-                        matched_name in name or  # 匹配名是查询名的子串
-                        self._check_name_similarity(name, matched_name)
-                    )
-                    
-                    if is_valid:
-                        validated_exact_results.append({
-                            'id': hit['_source'].get('id', ''),
-                            'name': matched_name,
-                            '_score': score
-                        })
-                    else:
-                        logger.debug(f"药品'{name}'精确匹配'{matched_name}'但相似度不足，跳过")
-                
+                validated_exact_results = self._validate_exact_drug_hits(name, hits)
                 if validated_exact_results:
-                    logger.info(f"药品'{name}'精确匹配: {[r['name'] for r in validated_exact_results]}")
                     return validated_exact_results
             
-            # 第二步：严格的模糊匹配（只匹配name字段，不匹配details）
-            # 使用 match 并设置最小相似度
-            fuzzy_query = {
-                "query": {
-                    "match": {
-                        "name": {
-                            "query": name,
-                            "minimum_should_match": "75%"  # 至少75%的词匹配
-                        }
-                    }
-                },
-                "size": 10  # 多取一些候选，后面会过滤
-            }
-            result = self.es.search(index=self.drugs_index, body=fuzzy_query)
-            hits = result['hits']['hits']
+            # 第二步：严格的模糊匹配（n-gram索引可用时在本地完成）
+            local_fuzzy = self._fuzzy_resolve_locally(name, unique)
+            if local_fuzzy is not None:
+                return local_fuzzy
+            result = self.es.search(index=self.drugs_index, body=self._build_fuzzy_drug_query(name))
             
             # 第三步：验证匹配结果的名称相似度
-            validated_results = []
-            for hit in hits:
-                matched_name = hit['_source'].get('name', '')
-                score = hit.get('_score', 0)
-                
-                # 验证逻辑：
-                # 1. 查询名称必须是匹配名称的子串，或反之
-                # 2. 或者匹配名称包含查询名称的所有主要字符
-                is_valid = (
-                    name in matched_name or 
-                    matched_name in name or
-                    self._check_name_similarity(name, matched_name)
-                )
-                
-                if is_valid:
-                    validated_results.append({
-                        'id': hit['_source'].get('id', ''),
-                        'name': matched_name,
-                        '_score': score
-                    })
-                    if unique:
-                        break
-                else:
-                    logger.debug(f"药品'{name}'与'{matched_name}'不相似，跳过")
-            
-            if validated_results:
-                logger.info(f"药品'{name}'模糊匹配: {[r['name'] for r in validated_results[:3]]}")
-            else:
-                logger.warning(f"药品'{name}'未找到匹配结果")
-            
-            return validated_results[:5] if not unique else validated_results[:1]
+            return self._validate_fuzzy_drug_hits(name, result['hits']['hits'], unique)
             
         except Exception as e:
             logger.error(f"搜索药品'{name}'时发生错误: {str(e)}")
@@ -216,49 +248,36 @@ class EntityRecognizer:
         Returns:
             bool: 是否相似
         """
-        # 移除常见的药品剂型后缀
-        suffixes = ['片', '胶囊', '颗粒', '注射液', '口服液', '软膏', '乳膏', '栓', '丸', '散', '缓释片', '肠溶片']
-        clean1 = name1
-        clean2 = name2
-        for suffix in suffixes:
-            clean1 = clean1.replace(suffix, '')
-            clean2 = clean2.replace(suffix, '')
-        
-        # 策略1：如果清理后的名称相互包含，认为相似
-        if clean1 in clean2 or clean2 in clean1:
-            return True
-        
-        # 策略2：检查字符顺序是否匹配
-        # 短名称的所有字符必须在长名称中按顺序出现
-        shorter, longer = (clean1, clean2) if len(clean1) <= len(clean2) else (clean2, clean1)
-        
-        # 如果短名称的字符能在长名称中按顺序找到，才可能相似
-        pos = 0
-        for char in shorter:
-            found = longer.find(char, pos)
-            if found == -1:
-                # 有字符找不到，不相似
-                return False
-            pos = found + 1
-        
-        # 策略3：严格的字符重叠度检查
-        # 需要至少85%的字符重叠（比之前的70%更严格）
-        set1 = set(clean1)
-        set2 = set(clean2)
-        overlap = len(set1 & set2)
-        min_len = min(len(set1), len(set2))
-        
-        if min_len > 0 and overlap / min_len >= 0.85:
-            # 额外检查：长名称不能比短名称长太多
-            # 避免 "艾塞那肽" 匹配 "聚乙二醇洛塞那肽" 这种情况
-            max_len = max(len(clean1), len(clean2))
-            length_ratio = min_len / max_len
-            
-            # 长度比例至少要达到60%
-            if length_ratio >= 0.6:
-                return True
-        
-        return False
+        clean1 = strip_dosage_forms(name1)
+        clean2 = strip_dosage_forms(name2)
+        return names_similar(clean1, set(clean1), clean2, set(clean2))
+    
+    def _build_disease_query(self, name: str, unique: bool = False) -> Dict:
+        """构建疾病精确匹配查询"""
+        # 只使用term精确匹配，不进行模糊匹配
+        # 宁可匹配不上，也不要错误匹配
+        return {
+            "query": {
+                "bool": {
+                    "should": [
+                        {"term": {"name.keyword": name}},  # keyword字段精确匹配
+                        {"match_phrase": {"name": name}}   # 短语完全匹配
+                    ]
+                }
+            },
+            "size": 1 if unique else 3
+        }
+    
+    def _format_disease_hits(self, hits: List[Dict]) -> List[Dict]:
+        """将疾病检索结果转换为匹配列表"""
+        return [
+            {
+                'id': hit['_source'].get('id', ''),
+                'name': hit['_source'].get('name', ''),
+                '_score': hit.get('_score', 0)
+            }
+            for hit in hits
+        ]
     
     def _search_disease(self, name: str, unique: bool = False) -> List[Dict]:
         """在ES中搜索疾病 - 精确term匹配
@@ -272,36 +291,209 @@ class EntityRecognizer:
         Returns:
             List[Dict]: 匹配的疾病信息列表
         """
+        local_matches = self._resolve_locally("disease", name, unique)
+        if local_matches is not None:
+            return local_matches
+        
         try:
-            # 只使用term精确匹配，不进行模糊匹配
-            # 宁可匹配不上，也不要错误匹配
-            query = {
-                "query": {
-                    "bool": {
-                        "should": [
-                            {"term": {"name.keyword": name}},  # keyword字段精确匹配
-                            {"match_phrase": {"name": name}}   # 短语完全匹配
-                        ]
-                    }
-                },
-                "size": 1 if unique else 3
-            }
-            result = self.es.search(index=self.diseases_index, body=query)
-            hits = result['hits']['hits']
-            
+            result = self.es.search(index=self.diseases_index, body=self._build_disease_query(name, unique))
             # 返回所有匹配结果（如果有的话）
-            return [
-                {
-                    'id': hit['_source'].get('id', ''),
-                    'name': hit['_source'].get('name', ''),
-                    '_score': hit.get('_score', 0)
-                }
-                for hit in hits
-            ]
+            return self._format_disease_hits(result['hits']['hits'])
         except Exception as e:
             logger.error(f"搜索疾病时发生错误: {str(e)}")
             raise
     
+    def _resolve_locally(self, kind: str, name: str, unique: bool = False) -> Optional[List[Dict]]:
+        """通过NameResolver在本地解析名称，未配置或未命中时返回None"""
+        if self.name_resolver is None:
+            return None
+        return self.name_resolver.resolve(kind, name, unique)
+    
+    def _fuzzy_resolve_locally(self, name: str, unique: bool = False) -> Optional[List[Dict]]:
+        """通过NameResolver的n-gram索引模糊匹配药品，索引不可用时返回None"""
+        if self.name_resolver is None:
+            return None
+        return self.name_resolver.fuzzy_resolve(name, unique)
+    
+    @property
+    def local_fuzzy_ready(self) -> bool:
+        """药品模糊匹配是否可在本地完成"""
+        return self.name_resolver is not None and self.name_resolver.fuzzy_ready
+    
+    def _split_local_matches(self, drug_names: List[str], disease_names: List[str], unique: bool = False):
+        """先在本地解析所有名称，返回本地结果（未命中为None）和需要查询ES的名称"""
+        drug_local = [self._resolve_locally("drug", name, unique) for name in drug_names]
+        disease_local = [self._resolve_locally("disease", name, unique) for name in disease_names]
+        pending_drugs = [name for name, matches in zip(drug_names, drug_local) if matches is None]
+        pending_diseases = [name for name, matches in zip(disease_names, disease_local) if matches is None]
+        return drug_local, disease_local, pending_drugs, pending_diseases
+    
+    @staticmethod
+    def _merge_matches(local_matches: List[Optional[List[Dict]]], remote_matches: List[List[Dict]]) -> List[List[Dict]]:
+        """按原顺序合并本地结果与ES结果"""
+        remote = iter(remote_matches)
+        return [matches if matches is not None else next(remote) for matches in local_matches]
+    
+    def _build_resolution_searches(self, drug_names: List[str], disease_names: List[str],
+                                   unique: bool = False, include_fuzzy: bool = True) -> List[Dict]:
+        """构建批量实体对齐的_msearch请求体
+        
+        每个药品依次包含精确查询和模糊查询（模糊查询预先发出，
+        精确匹配通过验证时其结果直接丢弃），每个疾病一个精确查询。
+        include_fuzzy=False 时不发模糊查询（由本地n-gram索引完成）。
+        """
+        searches = []
+        for name in drug_names:
+            searches.append({"index": self.drugs_index})
+            searches.append(self._build_exact_drug_query(name, unique))
+            if include_fuzzy:
+                searches.append({"index": self.drugs_index})
+                searches.append(self._build_fuzzy_drug_query(name))
+        for name in disease_names:
+            searches.append({"index": self.diseases_index})
+            searches.append(self._build_disease_query(name, unique))
+        return searches
+    
+    def _response_hits(self, response: Dict) -> List[Dict]:
+        """取出_msearch单个子响应的命中，子查询失败时抛出异常"""
+        if 'error' in response:
+            raise RuntimeError(f"ES子查询失败: {response['error']}")
+        return response['hits']['hits']
+    
+    def _parse_resolution_responses(self, drug_names: List[str], disease_names: List[str],
+                                    responses: List[Dict], unique: bool = False, include_fuzzy: bool = True
+                                    ) -> Tuple[List[List[Dict]], List[List[Dict]]]:
+        """对_msearch结果应用与_search_drug/_search_disease相同的验证逻辑"""
+        stride = 2 if include_fuzzy else 1
+        drug_matches_list = []
+        for i, name in enumerate(drug_names):
+            exact_hits = self._response_hits(responses[stride * i])
+            validated = self._validate_exact_drug_hits(name, exact_hits) if exact_hits else []
+            if not validated:
+                if include_fuzzy:
+                    validated = self._validate_fuzzy_drug_hits(
+                        name, self._response_hits(responses[stride * i + 1]), unique
+                    )
+                else:
+                    validated = self._fuzzy_resolve_locally(name, unique) or []
+            drug_matches_list.append(validated)
+        
+        offset = stride * len(drug_names)
+        disease_matches_list = [
+            self._format_disease_hits(self._response_hits(responses[offset + i]))
+            for i in range(len(disease_names))
+        ]
+        return drug_matches_list, disease_matches_list
+    
+    def resolve_entities(self, drug_names: List[str], disease_names: List[str],
+                         unique: bool = False) -> Tuple[List[List[Dict]], List[List[Dict]]]:
+        """一次_msearch完成所有药品与疾病的对齐（本地已解析的名称不再查询ES）
+        
+        Args:
+            drug_names: 药品名称列表
+            disease_names: 疾病名称列表
+            unique: 是否只返回唯一结果
+            
+        Returns:
+            Tuple: (各药品的匹配列表, 各疾病的匹配列表)，顺序与输入一致
+        """
+        drug_local, disease_local, pending_drugs, pending_diseases = self._split_local_matches(
+            drug_names, disease_names, unique
+        )
+        if not pending_drugs and not pending_diseases:
+            return drug_local, disease_local
+        try:
+            include_fuzzy = not self.local_fuzzy_ready
+            searches = self._build_resolution_searches(pending_drugs, pending_diseases, unique, include_fuzzy)
+            result = self.es.msearch(searches=searches)
+            drug_remote, disease_remote = self._parse_resolution_responses(
+                pending_drugs, pending_diseases, result['responses'], unique, include_fuzzy
+            )
+            return self._merge_matches(drug_local, drug_remote), self._merge_matches(disease_local, disease_remote)
+        except Exception as e:
+            logger.error(f"批量实体对齐时发生错误: {str(e)}")
+            raise
+    
+    def _recognize_from_dictionary(self, input_data: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """用实体词典识别描述中的药品和疾病，词典不可用、未命中或有歧义时返回None"""
+        if self.entity_dictionary is None:
+            return None
+        initial_entities = self.entity_dictionary.recognize(input_data["description"])
+        if initial_entities is not None:
+            logger.info(f"词典识别实体: 药品 {initial_entities['drugs'][0]['name']}, "
+                        f"疾病 {initial_entities['diseases'][0]['name']}（跳过LLM）")
+        return initial_entities
+    
+    def _parse_recognition_response(self, response: str) -> Tuple[Optional[str], Dict[str, Any]]:
+        """解析实体识别的LLM响应
+        
+        Returns:
+            tuple[Optional[str], Dict]: (think内容, 初步识别的实体)
+        """
+        think_content, json_str = self._extract_json_from_response(response)
+        try:
+            return think_content, json.loads(json_str)
+        except json.JSONDecodeError as e:
+            logger.error(f"JSON解析错误: {str(e)}")
+            logger.error(f"JSON字符串: {json_str}")
+            raise
+    
+    def _build_recognized_entities(
+        self,
+        input_data: Dict[str, Any],
+        initial_entities: Dict[str, Any],
+        think_content: Optional[str],
+        drug_matches_list: List[List[Dict]],
+        disease_matches_list: List[List[Dict]]
+    ) -> RecognizedEntities:
+        """将LLM初步识别结果与ES匹配结果组装为标准化实体"""
+        drugs = []
+        for drug_entity, drug_matches in zip(initial_entities.get('drugs', []), drug_matches_list):
+            if drug_matches:  # 只有在找到匹配时才添加
+                drug = Drug(
+                    name=drug_entity['name'],
+                    matches=[
+                        DrugMatch(
+                            id=match['id'],
+                            standard_name=match['name'],
+                            score=match['_score']
+                        )
+                        for match in drug_matches
+                    ]
+                )
+                drugs.append(drug)
+        
+        diseases = []
+        for disease_entity, disease_matches in zip(initial_entities.get('diseases', []), disease_matches_list):
+            # 保留LLM识别的疾病，即使ES没有匹配
+            # 这样可以用LLM抽取的疾病名来做适应症判断
+            disease = Disease(
+                name=disease_entity['name'],
+                matches=[
+                    DiseaseMatch(
+                        id=match['id'],
+                        standard_name=match['name'],
+                        score=match['_score'],
+                        match_type=match.get('match_type', 'exact')
+                    )
+                    for match in disease_matches
+                ] if disease_matches else []  # 如果ES没匹配，matches为空列表
+            )
+            diseases.append(disease)
+        
+        # 构建上下文
+        context = Context(
+            description=initial_entities['context']['description'],
+            raw_data=input_data
+        )
+        
+        return RecognizedEntities(
+            drugs=drugs,
+            diseases=diseases,
+            context=context,
+            additional_info={"think": think_content or ""}  # 确保think内容始终是字符串
+        )
+    
     def recognize(self, input_data: Dict[str, Any], unique_results: bool = True) -> RecognizedEntities:
         """识别输入数据中的实体并与数据库对齐
         
@@ -317,77 +509,158 @@ class EntityRecognizer:
             if not input_data.get("description"):
                 raise ValueError("输入数据必须包含非空的description字段")
 
-            # 1. 使用LLM进行初步实体识别
-            prompt = create_entity_recognition_prompt(input_data)
+            # 1. 初步实体识别：词典结果明确时直接使用，否则调用LLM
+            think_content = None
+            initial_entities = self._recognize_from_dictionary(input_data)
+            if initial_entities is None:
+                prompt = create_entity_recognition_prompt(input_data)
+                
+                response = create_chat_completion(
+                    self.client,
+                    model=self.model,
+                    messages=[
+                        {"role": "user", "content": prompt}
+                    ],
+                    cache=self.llm_cache
+                )
+                
+                # 解析响应
+                think_content, initial_entities = self._parse_recognition_response(response)
             
-            completion = self.client.chat.completions.create(
-                model=self.model,
-                messages=[
-                    {"role": "user", "content": prompt}
-                ]
+            # 2. 在数据库中查找匹配的标准实体（一次_msearch）
+            drug_matches_list, disease_matches_list = self.resolve_entities(
+                [drug_entity['name'] for drug_entity in initial_entities.get('drugs', [])],
+                [disease_entity['name'] for disease_entity in initial_entities.get('diseases', [])],
+                unique_results
             )
             
-            response = completion.choices[0].message.content
+            # 3. 返回标准化的实体
+            return self._build_recognized_entities(
+                input_data, initial_entities, think_content,
+                drug_matches_list, disease_matches_list
+            )
+                
+        except Exception as e:
+            logger.error(f"识别实体时发生错误: {str(e)}")
+            raise
+
+
+class AsyncEntityRecognizer(EntityRecognizer):
+    """异步实体识别器 - 使用AsyncElasticsearch和异步LLM客户端，不阻塞事件循环"""
+    
+    def __init__(self, es: AsyncElasticsearch = None, client: AsyncOpenAI = None,
+                 llm_cache: LLMResponseCache = None, name_resolver=None, entity_dictionary=None):
+        """初始化异步识别器
+        
+        Args:
+            es: AsyncElasticsearch客户端实例
+            client: 异步LLM客户端实例
+            llm_cache: LLM响应缓存（默认使用config.yaml配置的进程级缓存）
+            name_resolver: 可选的NameResolver，名称在本地命中时不访问ES
+            entity_dictionary: 可选的EntityDictionary，词典识别结果明确时不调用LLM
+        """
+        self.es = es or get_async_es_client()
+        self.drugs_index = 'drugs'
+        self.diseases_index = 'diseases'
+        
+        if client is None:
+            load_env()
+            client = get_async_llm_client()
+        self.client = client
+        self.model = "deepseek-chat"
+        self.llm_cache = llm_cache or get_llm_cache()
+        self.name_resolver = name_resolver
+        self.entity_dictionary = entity_dictionary
+    
+    async def _search_drug(self, name: str, unique: bool = False) -> List[Dict]:
+        """在ES中搜索药品 - 严格匹配策略（异步版）"""
+        local_matches = self._resolve_locally("drug", name, unique)
+        if local_matches is not None:
+            return local_matches
+        
+        try:
+            result = await self.es.search(index=self.drugs_index, body=self._build_exact_drug_query(name, unique))
+            hits = result['hits']['hits']
+            
+            if hits:
+                validated_exact_results = self._validate_exact_drug_hits(name, hits)
+                if validated_exact_results:
+                    return validated_exact_results
             
-            # 解析响应
-            think_content, json_str = self._extract_json_from_response(response)
-            try:
-                initial_entities = json.loads(json_str)
-            except json.JSONDecodeError as e:
-                logger.error(f"JSON解析错误: {str(e)}")
-                logger.error(f"JSON字符串: {json_str}")
-                raise
+            local_fuzzy = self._fuzzy_resolve_locally(name, unique)
+            if local_fuzzy is not None:
+                return local_fuzzy
+            result = await self.es.search(index=self.drugs_index, body=self._build_fuzzy_drug_query(name))
+            return self._validate_fuzzy_drug_hits(name, result['hits']['hits'], unique)
             
-            # 2. 在数据库中查找匹配的标准实体
-            drugs = []
-            for drug_entity in initial_entities.get('drugs', []):
-                drug_matches = self._search_drug(drug_entity['name'], unique_results)
-                if drug_matches:  # 只有在找到匹配时才添加
-                    drug = Drug(
-                        name=drug_entity['name'],
-                        matches=[
-                            DrugMatch(
-                                id=match['id'],
-                                standard_name=match['name'],
-                                score=match['_score']
-                            )
-                            for match in drug_matches
-                        ]
-                    )
-                    drugs.append(drug)
+        except Exception as e:
+            logger.error(f"搜索药品'{name}'时发生错误: {str(e)}")
+            raise
+    
+    async def _search_disease(self, name: str, unique: bool = False) -> List[Dict]:
+        """在ES中搜索疾病 - 精确term匹配（异步版）"""
+        local_matches = self._resolve_locally("disease", name, unique)
+        if local_matches is not None:
+            return local_matches
+        
+        try:
+            result = await self.es.search(index=self.diseases_index, body=self._build_disease_query(name, unique))
+            return self._format_disease_hits(result['hits']['hits'])
+        except Exception as e:
+            logger.error(f"搜索疾病时发生错误: {str(e)}")
+            raise
+    
+    async def resolve_entities(self, drug_names: List[str], disease_names: List[str],
+                               unique: bool = False) -> Tuple[List[List[Dict]], List[List[Dict]]]:
+        """一次_msearch完成所有药品与疾病的对齐（异步版）"""
+        drug_local, disease_local, pending_drugs, pending_diseases = self._split_local_matches(
+            drug_names, disease_names, unique
+        )
+        if not pending_drugs and not pending_diseases:
+            return drug_local, disease_local
+        try:
+            include_fuzzy = not self.local_fuzzy_ready
+            searches = self._build_resolution_searches(pending_drugs, pending_diseases, unique, include_fuzzy)
+            result = await self.es.msearch(searches=searches)
+            drug_remote, disease_remote = self._parse_resolution_responses(
+                pending_drugs, pending_diseases, result['responses'], unique, include_fuzzy
+            )
+            return self._merge_matches(drug_local, drug_remote), self._merge_matches(disease_local, disease_remote)
+        except Exception as e:
+            logger.error(f"批量实体对齐时发生错误: {str(e)}")
+            raise
+    
+    async def recognize(self, input_data: Dict[str, Any], unique_results: bool = True) -> RecognizedEntities:
+        """识别输入数据中的实体并与数据库对齐（异步版）"""
+        try:
+            if not input_data.get("description"):
+                raise ValueError("输入数据必须包含非空的description字段")
             
-            diseases = []
-            for disease_entity in initial_entities.get('diseases', []):
-                disease_matches = self._search_disease(disease_entity['name'], unique_results)
-                # 保留LLM识别的疾病，即使ES没有匹配
-                # 这样可以用LLM抽取的疾病名来做适应症判断
-                disease = Disease(
-                    name=disease_entity['name'],
-                    matches=[
-                        DiseaseMatch(
-                            id=match['id'],
-                            standard_name=match['name'],
-                            score=match['_score']
-                        )
-                        for match in disease_matches
-                    ] if disease_matches else []  # 如果ES没匹配，matches为空列表
+            think_content = None
+            initial_entities = self._recognize_from_dictionary(input_data)
+            if initial_entities is None:
+                prompt = create_entity_recognition_prompt(input_data)
+                response = await create_chat_completion_async(
+                    self.client,
+                    model=self.model,
+                    messages=[
+                        {"role": "user", "content": prompt}
+                    ],
+                    cache=self.llm_cache
                 )
-                diseases.append(disease)
+                think_content, initial_entities = self._parse_recognition_response(response)
             
-            # 构建上下文
-            context = Context(
-                description=initial_entities['context']['description'],
-                raw_data=input_data
+            drug_matches_list, disease_matches_list = await self.resolve_entities(
+                [drug_entity['name'] for drug_entity in initial_entities.get('drugs', [])],
+                [disease_entity['name'] for disease_entity in initial_entities.get('diseases', [])],
+                unique_results
             )
             
-            # 3. 返回标准化的实体
-            return RecognizedEntities(
-                drugs=drugs,
-                diseases=diseases,
-                context=context,
-                additional_info={"think": think_content or ""}  # 确保think内容始终是字符串
+            return self._build_recognized_entities(
+                input_data, initial_entities, think_content,
+                drug_matches_list, disease_matches_list
             )
-                
+        
         except Exception as e:
             logger.error(f"识别实体时发生错误: {str(e)}")
             raise
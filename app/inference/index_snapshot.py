@@ -0,0 +1,120 @@
+"""ES索引的进程内快照基类
+
+子类实现 _build() 从ES导出数据构建内存结构；基类负责：
+- 记录快照对应的索引版本（各具体索引的uuid）
+- 后台线程首次加载，之后按refresh_interval检查索引版本，变化时重新加载
+- 加载完成前 ready=False，调用方应回退到ES查询
+"""
+
+import logging
+import threading
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+from elasticsearch import Elasticsearch
+
+from app.shared import get_es_client, get_index_version
+
+logger = logging.getLogger(__name__)
+
+
+class IndexSnapshot:
+    """ES索引快照（读操作无锁，重新加载时整体替换）"""
+
+    name = "index_snapshot"
+
+    def __init__(self, es: Elasticsearch = None, indices: List[str] = None,
+                 refresh_interval: float = 300.0, page_size: int = 1000):
+        """初始化快照（不立即加载）
+
+        Args:
+            es: 同步ES客户端（导出文档与版本检查使用）
+            indices: 快照依赖的索引，任一索引版本变化都会触发重新加载
+            refresh_interval: 后台检查索引版本的间隔（秒）
+            page_size: 导出时每页条数
+        """
+        self.es = es or get_es_client()
+        self.indices = list(indices or [])
+        self.refresh_interval = refresh_interval
+        self.page_size = page_size
+
+        self.version: Optional[str] = None
+        self.loaded_at: Optional[str] = None
+
+        self._load_lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def ready(self) -> bool:
+        """是否已完成首次加载"""
+        return self.version is not None
+
+    @classmethod
+    def from_config(cls, es: Elasticsearch, config: Dict[str, Any]):
+        """根据配置创建并启动后台加载，未启用时返回None"""
+        if not config.get('enabled', False):
+            return None
+        snapshot = cls(
+            es,
+            refresh_interval=config.get('refresh_interval', 300.0),
+            page_size=config.get('page_size', 1000)
+        )
+        snapshot.start_background_refresh()
+        return snapshot
+
+    def _build(self):
+        """从ES导出数据并替换内存结构（子类实现）"""
+        raise NotImplementedError
+
+    def load(self):
+        """加载当前版本的索引数据"""
+        with self._load_lock:
+            version = get_index_version(self.es, self.indices)
+            logger.info(f"开始加载{self.name} (版本 {version})")
+            self._build()
+            self.version = version
+            self.loaded_at = datetime.now().isoformat()
+
+    reload = load
+
+    def refresh_if_changed(self) -> bool:
+        """索引版本变化（或尚未加载）时重新加载
+
+        Returns:
+            bool: 是否重新加载
+        """
+        if self.ready and get_index_version(self.es, self.indices) == self.version:
+            return False
+        self.load()
+        return True
+
+    def start_background_refresh(self):
+        """启动后台线程：首次加载，之后按refresh_interval检查索引版本"""
+        if self._thread is not None:
+            return
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._refresh_loop, name=f"{self.name}-refresh", daemon=True)
+        self._thread.start()
+
+    def _refresh_loop(self):
+        while not self._stop_event.is_set():
+            try:
+                self.refresh_if_changed()
+            except Exception as e:
+                logger.warning(f"刷新{self.name}失败: {str(e)}")
+            self._stop_event.wait(self.refresh_interval)
+
+    def stop(self):
+        """停止后台刷新线程"""
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "ready": self.ready,
+            "version": self.version,
+            "loaded_at": self.loaded_at
+        }
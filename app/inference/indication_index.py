@@ -0,0 +1,192 @@
+"""药品适应症内存索引
+
+启动时通过 PIT + search_after 从drugs索引导出带 indications_list 的药品，
+从diseases索引导出疾病名称与子疾病，在进程内维护：
+- 药品ID -> 小写适应症集合、适应症疾病ID集合（及原始适应症、禁忌症列表）
+- 小写适应症 -> 药品ID集合（反向索引）
+- 疾病ID -> 同义疾病ID集合（规范化名称相同的疾病）、祖先疾病ID集合（由sub_diseases传递闭包得到）
+
+规则分析据此即可用集合查找完成精确/同义/层级匹配，无需每个请求访问ES。
+后台线程定期检查索引版本，索引重建后自动重新加载。
+"""
+
+import logging
+from collections import defaultdict
+from dataclasses import dataclass
+from typing import Any, Dict, FrozenSet, List, Optional, Tuple
+
+from elasticsearch import Elasticsearch
+
+from app.shared import iter_index_docs
+from .disease_hierarchy import ancestor_closure, group_by_normalized_name, sub_disease_parents
+from .index_snapshot import IndexSnapshot
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class IndexedDrug:
+    """索引中的药品条目"""
+    id: str
+    name: Optional[str]
+    standard_name: Optional[str]
+    indications: Tuple[str, ...]          # 原始适应症（indications_list）
+    indication_set: FrozenSet[str]        # 小写适应症，用于精确匹配
+    contraindications: Tuple[str, ...]
+    indication_ids: FrozenSet[str] = frozenset()  # 适应症对应的疾病ID（indication_disease_ids）
+
+
+class IndicationIndex(IndexSnapshot):
+    """药品适应症内存索引"""
+
+    name = "适应症索引"
+    SOURCE_FIELDS = ['id', 'name', 'standard_name', 'indications_list', 'indication_disease_ids', 'contraindications']
+    DISEASE_SOURCE_FIELDS = ['id', 'name', 'sub_diseases']
+
+    def __init__(self, es: Elasticsearch = None, index: str = 'drugs', diseases_index: Optional[str] = 'diseases',
+                 refresh_interval: float = 300.0, page_size: int = 1000):
+        """初始化索引（不立即加载）
+
+        Args:
+            es: 同步ES客户端（导出文档与版本检查使用）
+            index: 药品索引名
+            diseases_index: 疾病索引名（同义/层级关系来源），None表示不加载疾病关系
+            refresh_interval: 后台检查索引版本的间隔（秒）
+            page_size: 导出时每页条数
+        """
+        super().__init__(es, [index] + ([diseases_index] if diseases_index else []), refresh_interval, page_size)
+        self.index = index
+        self.diseases_index = diseases_index
+
+        self._drugs: Dict[str, IndexedDrug] = {}
+        self._by_indication: Dict[str, FrozenSet[str]] = {}
+        self._disease_names: Dict[str, str] = {}
+        self._synonyms: Dict[str, FrozenSet[str]] = {}
+        self._ancestors: Dict[str, FrozenSet[str]] = {}
+        self.lookups = 0
+        self.hits = 0
+
+    def _build(self):
+        """从ES导出药品适应症并整体替换当前索引"""
+        drugs: Dict[str, IndexedDrug] = {}
+        by_indication = defaultdict(set)
+        for hit in iter_index_docs(
+            self.es, self.index,
+            query={"exists": {"field": "indications_list"}},
+            source=self.SOURCE_FIELDS,
+            page_size=self.page_size
+        ):
+            entry = self._build_entry(hit)
+            drugs[entry.id] = entry
+            for indication in entry.indication_set:
+                by_indication[indication].add(entry.id)
+
+        disease_names, synonyms, ancestors = self._build_disease_relations() if self.diseases_index else ({}, {}, {})
+
+        # 整体替换，读取方始终看到完整的一份数据
+        self._drugs = drugs
+        self._by_indication = {k: frozenset(v) for k, v in by_indication.items()}
+        self._disease_names = disease_names
+        self._synonyms = synonyms
+        self._ancestors = ancestors
+        logger.info(f"适应症索引加载完成: {len(drugs)} 个药品, {len(self._by_indication)} 个适应症, "
+                    f"{len(disease_names)} 个疾病 (同义 {len(synonyms)}, 有上级 {len(ancestors)})")
+
+    def _build_disease_relations(self):
+        """导出疾病并计算同义疾病集合与祖先疾病集合
+
+        Returns:
+            Tuple: (疾病ID -> 名称, 疾病ID -> 同义疾病ID集合, 疾病ID -> 祖先疾病ID集合)
+        """
+        disease_names: Dict[str, str] = {}
+        sub_names: Dict[str, List[Any]] = {}
+        for hit in iter_index_docs(self.es, self.diseases_index, source=self.DISEASE_SOURCE_FIELDS,
+                                   page_size=self.page_size):
+            source = hit['_source']
+            name = source.get('name')
+            if not name:
+                continue
+            disease_id = source.get('id') or hit['_id']
+            disease_names[disease_id] = name
+            if source.get('sub_diseases'):
+                sub_names[disease_id] = source['sub_diseases']
+
+        # 分组与闭包规则与编译的关系表（disease_relations）共用
+        by_normalized = group_by_normalized_name(disease_names.items())
+        synonyms = {}
+        for ids in by_normalized.values():
+            if len(ids) > 1:
+                for disease_id in ids:
+                    synonyms[disease_id] = frozenset(ids - {disease_id})
+
+        ancestors = ancestor_closure(sub_disease_parents(by_normalized, sub_names.items()))
+        return disease_names, synonyms, ancestors
+
+    def _build_entry(self, hit: Dict[str, Any]) -> IndexedDrug:
+        source = hit['_source']
+        indications = tuple(i for i in source.get('indications_list') or [] if i)
+        contraindications = source.get('contraindications') or []
+        if isinstance(contraindications, str):
+            contraindications = [contraindications]
+        return IndexedDrug(
+            id=source.get('id') or hit['_id'],
+            name=source.get('name'),
+            standard_name=source.get('standard_name') or source.get('name'),
+            indications=indications,
+            indication_set=frozenset(i.lower() for i in indications),
+            contraindications=tuple(contraindications),
+            indication_ids=frozenset(i for i in source.get('indication_disease_ids') or [] if i)
+        )
+
+    def get(self, drug_id: str) -> Optional[IndexedDrug]:
+        """获取药品条目，不在索引中时返回None"""
+        self.lookups += 1
+        entry = self._drugs.get(drug_id)
+        if entry is not None:
+            self.hits += 1
+        return entry
+
+    def indications(self, drug_id: str) -> FrozenSet[str]:
+        """药品的小写适应症集合"""
+        entry = self._drugs.get(drug_id)
+        return entry.indication_set if entry else frozenset()
+
+    def drugs_for_indication(self, indication: str) -> FrozenSet[str]:
+        """具有该适应症的药品ID集合"""
+        return self._by_indication.get(indication.lower(), frozenset())
+
+    def match_indication(self, drug_id: str, disease_name: str) -> str:
+        """疾病名与药品适应症精确匹配时返回该适应症（原始写法），否则返回空串"""
+        entry = self._drugs.get(drug_id)
+        if entry is None or not disease_name:
+            return ""
+        disease_name_lower = disease_name.lower()
+        if disease_name_lower not in entry.indication_set:
+            return ""
+        for indication in entry.indications:
+            if indication.lower() == disease_name_lower:
+                return indication
+        return ""
+
+    def disease_name(self, disease_id: str) -> Optional[str]:
+        """疾病ID对应的名称"""
+        return self._disease_names.get(disease_id)
+
+    def synonyms(self, disease_id: str) -> FrozenSet[str]:
+        """与该疾病同义的疾病ID集合（不含自身）"""
+        return self._synonyms.get(disease_id, frozenset())
+
+    def ancestors(self, disease_id: str) -> FrozenSet[str]:
+        """该疾病的所有上级疾病ID集合"""
+        return self._ancestors.get(disease_id, frozenset())
+
+    def stats(self) -> Dict[str, Any]:
+        stats = super().stats()
+        stats.update({
+            "drugs": len(self._drugs),
+            "indications": len(self._by_indication),
+            "diseases": len(self._disease_names),
+            "lookups": self.lookups,
+            "hits": self.hits
+        })
+        return stats
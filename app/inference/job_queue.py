@@ -0,0 +1,336 @@
+"""持久化的批量分析任务队列
+
+大批量（数千病例）的审核不适合走同步HTTP请求：任务提交后立即返回任务ID，
+由后台worker通过推理引擎逐个分析，进度、每个病例的结果与失败信息写入SQLite。
+进程重启后未完成的任务从未完成的病例处继续（中断时正在分析的病例会重新分析）。
+
+任务状态：queued（排队）→ running（进行中）→ completed（全部病例已处理，含失败的病例）
+病例状态：pending（待分析）/ done（成功）/ failed（失败）
+
+临时错误（结果中 retryable 为真：ES/LLM超时、限流、连接错误等）不直接记为失败：
+病例保持pending并累计尝试次数，本轮处理完后间隔 retry_delay 秒重新分析，
+达到 max_attempts 次仍失败才记为failed。
+
+数据库读写在线程中执行，不阻塞API所在的事件循环。
+"""
+
+import asyncio
+import json
+import logging
+import sqlite3
+import threading
+import time
+import uuid
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional
+
+logger = logging.getLogger(__name__)
+
+JOB_STATUSES = ("queued", "running", "completed")
+
+
+class JobStore:
+    """任务与病例结果的SQLite存储（线程安全）"""
+
+    def __init__(self, path: str):
+        """打开（或创建）任务数据库
+
+        Args:
+            path: SQLite数据库文件路径
+        """
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.path), check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS jobs ("
+            "id TEXT PRIMARY KEY, status TEXT NOT NULL, total INTEGER NOT NULL, "
+            "done INTEGER NOT NULL DEFAULT 0, failed INTEGER NOT NULL DEFAULT 0, "
+            "created_at REAL NOT NULL, started_at REAL, finished_at REAL)"
+        )
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS job_items ("
+            "job_id TEXT NOT NULL, idx INTEGER NOT NULL, status TEXT NOT NULL, "
+            "input TEXT NOT NULL, result TEXT, error TEXT, finished_at REAL, "
+            "attempts INTEGER NOT NULL DEFAULT 0, "
+            "PRIMARY KEY (job_id, idx))"
+        )
+        # 旧版本创建的数据库没有attempts列
+        columns = {row[1] for row in self._conn.execute("PRAGMA table_info(job_items)")}
+        if "attempts" not in columns:
+            self._conn.execute("ALTER TABLE job_items ADD COLUMN attempts INTEGER NOT NULL DEFAULT 0")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs(status, created_at)")
+        self._conn.commit()
+
+    def create_job(self, inputs: List[Dict[str, Any]]) -> str:
+        """创建任务并写入全部病例
+
+        Returns:
+            str: 任务ID
+        """
+        job_id = uuid.uuid4().hex
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO jobs (id, status, total, created_at) VALUES (?, 'queued', ?, ?)",
+                (job_id, len(inputs), time.time())
+            )
+            self._conn.executemany(
+                "INSERT INTO job_items (job_id, idx, status, input) VALUES (?, ?, 'pending', ?)",
+                ((job_id, idx, json.dumps(input_data, ensure_ascii=False)) for idx, input_data in enumerate(inputs))
+            )
+            self._conn.commit()
+        return job_id
+
+    def get_job(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """任务状态与进度，不存在时返回None"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT id, status, total, done, failed, created_at, started_at, finished_at "
+                "FROM jobs WHERE id = ?", (job_id,)
+            ).fetchone()
+        if row is None:
+            return None
+        job = dict(zip(("id", "status", "total", "done", "failed", "created_at", "started_at", "finished_at"), row))
+        job["progress"] = (job["done"] + job["failed"]) / job["total"] if job["total"] else 1.0
+        return job
+
+    def next_job(self) -> Optional[str]:
+        """下一个待处理的任务（中断的running任务优先，其次最早提交的queued任务）"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT id FROM jobs WHERE status IN ('running', 'queued') "
+                "ORDER BY status = 'queued', created_at LIMIT 1"
+            ).fetchone()
+        return row[0] if row else None
+
+    def mark_running(self, job_id: str):
+        with self._lock:
+            self._conn.execute(
+                "UPDATE jobs SET status = 'running', started_at = COALESCE(started_at, ?) WHERE id = ?",
+                (time.time(), job_id)
+            )
+            self._conn.commit()
+
+    def pending_page(self, job_id: str, after_idx: int = -1, page_size: int = 100) -> List[Dict[str, Any]]:
+        """读取一页序号大于after_idx的待分析病例（按序号），每项为 {"idx", "input"}"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT idx, input FROM job_items WHERE job_id = ? AND status = 'pending' AND idx > ? "
+                "ORDER BY idx LIMIT ?", (job_id, after_idx, page_size)
+            ).fetchall()
+        return [{"idx": idx, "input": json.loads(input_json)} for idx, input_json in rows]
+
+    def iter_pending(self, job_id: str, page_size: int = 100) -> Iterator[Dict[str, Any]]:
+        """分页读取待分析的病例（按序号），每项为 {"idx", "input"}"""
+        last_idx = -1
+        while True:
+            rows = self.pending_page(job_id, last_idx, page_size)
+            if not rows:
+                return
+            yield from rows
+            last_idx = rows[-1]["idx"]
+
+    def record_result(self, job_id: str, idx: int, result: Dict[str, Any], max_attempts: int = 1):
+        """保存一个病例的结果并更新任务进度
+
+        含 error 字段的结果记为失败；其中 retryable 的临时错误在尝试次数未达到max_attempts时
+        保持pending（记录错误与尝试次数），等待重新分析。
+        """
+        failed = "error" in result
+        with self._lock:
+            if failed and result.get("retryable"):
+                cursor = self._conn.execute(
+                    "UPDATE job_items SET attempts = attempts + 1, error = ? "
+                    "WHERE job_id = ? AND idx = ? AND status = 'pending' AND attempts + 1 < ?",
+                    (str(result["error"]), job_id, idx, max_attempts)
+                )
+                if cursor.rowcount:
+                    self._conn.commit()
+                    return
+            cursor = self._conn.execute(
+                "UPDATE job_items SET status = ?, result = ?, error = ?, finished_at = ?, attempts = attempts + 1 "
+                "WHERE job_id = ? AND idx = ? AND status = 'pending'",
+                ("failed" if failed else "done",
+                 None if failed else json.dumps(result, ensure_ascii=False, default=str),
+                 str(result["error"]) if failed else None,
+                 time.time(), job_id, idx)
+            )
+            if cursor.rowcount:
+                column = "failed" if failed else "done"
+                self._conn.execute(f"UPDATE jobs SET {column} = {column} + 1 WHERE id = ?", (job_id,))
+            self._conn.commit()
+
+    def finish_job(self, job_id: str) -> bool:
+        """所有病例都已处理时将任务标记为completed
+
+        Returns:
+            bool: 是否已完成
+        """
+        with self._lock:
+            pending = self._conn.execute(
+                "SELECT COUNT(*) FROM job_items WHERE job_id = ? AND status = 'pending'", (job_id,)
+            ).fetchone()[0]
+            if pending:
+                return False
+            self._conn.execute(
+                "UPDATE jobs SET status = 'completed', finished_at = ? WHERE id = ?", (time.time(), job_id)
+            )
+            self._conn.commit()
+        return True
+
+    def iter_results(self, job_id: str, status: Optional[str] = None,
+                     page_size: int = 500) -> Iterator[Dict[str, Any]]:
+        """分页读取已处理病例的结果（按序号）
+
+        Args:
+            job_id: 任务ID
+            status: 只返回 done 或 failed 的病例，None表示两者都返回
+        """
+        statuses = (status,) if status else ("done", "failed")
+        placeholders = ", ".join("?" * len(statuses))
+        last_idx = -1
+        while True:
+            with self._lock:
+                rows = self._conn.execute(
+                    f"SELECT idx, status, result, error FROM job_items WHERE job_id = ? AND idx > ? "
+                    f"AND status IN ({placeholders}) ORDER BY idx LIMIT ?",
+                    (job_id, last_idx, *statuses, page_size)
+                ).fetchall()
+            if not rows:
+                return
+            for idx, item_status, result_json, error in rows:
+                if item_status == "done":
+                    yield {"index": idx, "success": True, "data": json.loads(result_json)}
+                else:
+                    yield {"index": idx, "success": False, "error": error}
+            last_idx = rows[-1][0]
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            rows = self._conn.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall()
+        return {status: count for status, count in rows}
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+class JobQueue:
+    """在事件循环中依次处理任务的后台worker
+
+    每次处理一个任务，任务内的病例通过 AsyncInferenceEngine.analyze_batch_stream 并发分析，
+    并发数独立于交互请求的批量并发数配置。
+    """
+
+    def __init__(self, engine, store: JobStore, max_concurrency: int = 4, page_size: int = 100,
+                 max_attempts: int = 3, retry_delay: float = 30.0):
+        """初始化任务队列（不立即启动）
+
+        Args:
+            engine: AsyncInferenceEngine实例
+            store: 任务存储
+            max_concurrency: 单个任务内同时分析的病例数
+            page_size: 从数据库读取待分析病例的每页条数
+            max_attempts: 临时错误的病例最多分析次数（含首次）
+            retry_delay: 一轮处理后仍有待重试的病例时，重新分析前等待的秒数
+        """
+        self.engine = engine
+        self.store = store
+        self.max_concurrency = max(1, max_concurrency)
+        self.page_size = page_size
+        self.max_attempts = max(1, max_attempts)
+        self.retry_delay = retry_delay
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+
+    @classmethod
+    def from_config(cls, engine, config: Dict[str, Any]) -> Optional["JobQueue"]:
+        """根据 inference.jobs 配置创建，未启用时返回None"""
+        if not config.get('enabled', False):
+            return None
+        return cls(
+            engine,
+            JobStore(config.get('path', 'data/cache/jobs.sqlite')),
+            max_concurrency=config.get('max_concurrency', 4),
+            page_size=config.get('page_size', 100),
+            max_attempts=config.get('max_attempts', 3),
+            retry_delay=config.get('retry_delay', 30.0)
+        )
+
+    def start(self):
+        """在当前事件循环中启动worker（继续处理重启前未完成的任务）"""
+        if self._task is None:
+            self._task = asyncio.ensure_future(self._run())
+            logger.info(f"任务队列已启动 (并发数: {self.max_concurrency}, 任务: {self.store.stats()})")
+
+    async def stop(self):
+        """停止worker，正在分析的病例保持pending，下次启动时重新分析"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        self.store.close()
+
+    def submit(self, inputs: List[Dict[str, Any]]) -> str:
+        """提交任务
+
+        Returns:
+            str: 任务ID
+        """
+        job_id = self.store.create_job(inputs)
+        logger.info(f"任务已提交: {job_id} ({len(inputs)} 个病例)")
+        self._wakeup.set()
+        return job_id
+
+    async def _run(self):
+        while True:
+            self._wakeup.clear()
+            job_id = await asyncio.to_thread(self.store.next_job)
+            if job_id is None:
+                await self._wakeup.wait()
+                continue
+            try:
+                if not await self.process_job(job_id):
+                    # 仍有临时错误待重试的病例，稍后重新分析
+                    await asyncio.sleep(self.retry_delay)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                # 单个任务的意外错误不影响后续任务，稍后重试
+                logger.error(f"处理任务 {job_id} 时发生错误: {str(e)}")
+                await asyncio.sleep(1)
+
+    async def process_job(self, job_id: str) -> bool:
+        """分析任务中所有待处理的病例（每个病例一轮一次），结果逐个持久化
+
+        Returns:
+            bool: 任务是否已完成（False表示仍有临时错误待重试的病例）
+        """
+        await asyncio.to_thread(self.store.mark_running, job_id)
+        positions: Dict[int, int] = {}
+
+        async def inputs():
+            position, last_idx = 0, -1
+            while True:
+                page = await asyncio.to_thread(self.store.pending_page, job_id, last_idx, self.page_size)
+                if not page:
+                    return
+                for item in page:
+                    positions[position] = item["idx"]
+                    position += 1
+                    yield item["input"]
+                last_idx = page[-1]["idx"]
+
+        logger.info(f"开始处理任务 {job_id}: {await asyncio.to_thread(self.store.get_job, job_id)}")
+        async for position, result in self.engine.analyze_batch_stream(inputs(), self.max_concurrency):
+            await asyncio.to_thread(
+                self.store.record_result, job_id, positions.pop(position), result, self.max_attempts
+            )
+        if await asyncio.to_thread(self.store.finish_job, job_id):
+            logger.info(f"任务完成: {await asyncio.to_thread(self.store.get_job, job_id)}")
+            return True
+        return False
@@ -1,17 +1,40 @@
 """知识增强模块"""
 
 import logging
-from typing import Dict, List, Any
-from elasticsearch import Elasticsearch, NotFoundError
-from app.shared import get_es_client, Config
+from typing import Dict, List, Any, Optional
+from elasticsearch import Elasticsearch, AsyncElasticsearch
+from app.shared import get_es_client, get_async_es_client, Config
 from .models import Case, EnhancedCase
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 class KnowledgeEnhancer:
-    def __init__(self, es: Elasticsearch = None):
+    # 知识增强与提示词实际使用的字段（details等大字段不在请求路径上传输）
+    DRUG_SOURCE_FIELDS = [
+        'id', 'name', 'standard_name', 'indications_list', 'indication_disease_ids', 'indications',
+        'contraindications', 'precautions', 'pharmacology'
+    ]
+    DISEASE_SOURCE_FIELDS = ['id', 'name', 'standard_name', 'description', 'icd_code']
+    # 证据文档写入提示词和结果的字段（ResultSynthesizer按 recommendation_level / study_type 计分），不取全文
+    EVIDENCE_SOURCE_FIELDS = {
+        "clinical_guidelines": ['title', 'source', 'publish_year', 'recommendation', 'recommendation_level', 'summary'],
+        "expert_consensus": ['title', 'source', 'publish_year', 'recommendation', 'summary'],
+        "research_papers": ['title', 'journal', 'publish_year', 'study_type', 'conclusion', 'summary'],
+    }
+
+    def __init__(self, es: Elasticsearch = None, indication_index=None):
+        """
+        Args:
+            es: Elasticsearch客户端实例
+            indication_index: 可选的IndicationIndex，用于无需ES的规则分析
+        """
         self.es = es or get_es_client()
+        self.indication_index = indication_index
+        self._init_indices()
+    
+    def _init_indices(self):
+        """初始化索引名称和证据检索配置"""
         self.drugs_index = 'drugs'
         self.diseases_index = 'diseases'
         self.clinical_guidelines_index = 'clinical_guidelines' # TODO
@@ -24,29 +47,102 @@ class KnowledgeEnhancer:
         self.enable_expert_consensus = inference_config.get('enable_expert_consensus', False)
         self.enable_research_papers = inference_config.get('enable_research_papers', False)
 
+    @property
+    def evidence_enabled(self) -> bool:
+        """是否启用了任一证据源"""
+        return self.enable_clinical_guidelines or self.enable_expert_consensus or self.enable_research_papers
+
+    def enhance_case_from_index(self, case: Case) -> Optional[EnhancedCase]:
+        """仅用内存适应症索引增强病例（不访问ES）
+
+        只填充规则分析所需的药品适应症/禁忌症和已对齐的疾病名称，
+        不包含药理、注意事项和证据；药品不在索引中时返回None。
+        """
+        if self.indication_index is None or not self.indication_index.ready:
+            return None
+        if not case.recognized_entities.drugs or not case.recognized_entities.drugs[0].matches:
+            return None
+        entry = self.indication_index.get(case.recognized_entities.drugs[0].matches[0].id)
+        if entry is None:
+            return None
+
+        enhanced_case = EnhancedCase(case)
+        enhanced_case.drug.id = entry.id
+        enhanced_case.drug.name = entry.name
+        enhanced_case.drug.standard_name = entry.standard_name
+        enhanced_case.drug.indications = list(entry.indications)
+        enhanced_case.drug.indication_ids = list(entry.indication_ids)
+        enhanced_case.drug.contraindications = list(entry.contraindications)
+
+        diseases = case.recognized_entities.diseases
+        if diseases and diseases[0].matches:
+            enhanced_case.disease.id = diseases[0].matches[0].id
+            enhanced_case.disease.name = diseases[0].matches[0].standard_name
+            enhanced_case.disease.standard_name = diseases[0].matches[0].standard_name
+        return enhanced_case
+
     def enhance_case(self, case: Case) -> EnhancedCase:
-        """增强病例信息"""
+        """增强病例信息（药品/疾病文档一次mget，证据一次_msearch）"""
         enhanced_case = EnhancedCase(case)
+        drug_id, disease_id = self._matched_ids(case)
         
-        # 获取药品信息
-        if case.recognized_entities.drugs:
-            drug = case.recognized_entities.drugs[0]
-            if drug.matches:
-                drug_info = self.get_drug_by_id(drug.matches[0].id)
-                self._update_drug_info(enhanced_case.drug, drug_info)
-        
-        # 获取疾病信息
-        if case.recognized_entities.diseases:
-            disease = case.recognized_entities.diseases[0]
-            if disease.matches:
-                disease_info = self.get_disease_by_id(disease.matches[0].id)
-                self._update_disease_info(enhanced_case.disease, disease_info)
+        # 获取药品与疾病信息
+        if drug_id or disease_id:
+            try:
+                result = self.es.mget(docs=self._build_entity_docs(drug_id, disease_id))
+                drug_info, disease_info = self._parse_entity_docs(drug_id, disease_id, result['docs'])
+            except Exception as e:
+                logger.warning(f"获取药品/疾病信息失败: {str(e)}")
+                drug_info, disease_info = {}, {}
+            self._apply_entity_docs(enhanced_case, drug_id, disease_id, drug_info, disease_info)
         
         # 获取证据信息
         self._gather_evidence(enhanced_case)
         
         return enhanced_case
 
+    def _matched_ids(self, case: Case):
+        """病例中已对齐的药品ID与疾病ID（未对齐时为None）"""
+        drug_id = None
+        if case.recognized_entities.drugs and case.recognized_entities.drugs[0].matches:
+            drug_id = case.recognized_entities.drugs[0].matches[0].id
+        disease_id = None
+        if case.recognized_entities.diseases and case.recognized_entities.diseases[0].matches:
+            disease_id = case.recognized_entities.diseases[0].matches[0].id
+        return drug_id, disease_id
+
+    def _build_entity_docs(self, drug_id: Optional[str], disease_id: Optional[str]) -> List[Dict]:
+        """构建跨索引mget请求"""
+        docs = []
+        if drug_id:
+            docs.append({"_index": self.drugs_index, "_id": drug_id, "_source": self.DRUG_SOURCE_FIELDS})
+        if disease_id:
+            docs.append({"_index": self.diseases_index, "_id": disease_id, "_source": self.DISEASE_SOURCE_FIELDS})
+        return docs
+
+    def _parse_entity_docs(self, drug_id: Optional[str], disease_id: Optional[str], docs: List[Dict]):
+        """拆分mget结果，未找到的文档返回空字典"""
+        found = iter(docs)
+        drug_info = disease_info = {}
+        if drug_id:
+            doc = next(found)
+            drug_info = doc.get('_source', {}) if doc.get('found') else {}
+            if not drug_info:
+                logger.warning(f"获取药品信息失败: {drug_id} 不存在")
+        if disease_id:
+            doc = next(found)
+            disease_info = doc.get('_source', {}) if doc.get('found') else {}
+            if not disease_info:
+                logger.warning(f"获取疾病信息失败: {disease_id} 不存在")
+        return drug_info, disease_info
+
+    def _apply_entity_docs(self, enhanced_case: EnhancedCase, drug_id: Optional[str], disease_id: Optional[str],
+                           drug_info: Dict, disease_info: Dict):
+        if drug_id:
+            self._update_drug_info(enhanced_case.drug, drug_info)
+        if disease_id:
+            self._update_disease_info(enhanced_case.disease, disease_info)
+
     def get_drug_by_id(self, drug_id: str) -> Dict:
         """根据ID获取药品信息"""
         try:
@@ -56,21 +152,24 @@ class KnowledgeEnhancer:
             logger.warning(f"获取药品信息失败: {str(e)}")
             return {}
 
+    def _build_name_query(self, name: str) -> Dict:
+        """构建按名称检索实体的查询"""
+        return {
+            "query": {
+                "bool": {
+                    "should": [
+                        {"match": {"name": name}},
+                        {"match": {"standard_name": name}},
+                        {"match": {"aliases": name}}
+                    ]
+                }
+            }
+        }
+
     def get_drug_by_name(self, drug_name: str) -> Dict:
         """根据名称获取药品信息"""
         try:
-            query = {
-                "query": {
-                    "bool": {
-                        "should": [
-                            {"match": {"name": drug_name}},
-                            {"match": {"standard_name": drug_name}},
-                            {"match": {"aliases": drug_name}}
-                        ]
-                    }
-                }
-            }
-            result = self.es.search(index=self.drugs_index, body=query)
+            result = self.es.search(index=self.drugs_index, body=self._build_name_query(drug_name))
             hits = result['hits']['hits']
             return hits[0]['_source'] if hits else {}
         except Exception as e:
@@ -89,121 +188,74 @@ class KnowledgeEnhancer:
     def get_disease_by_name(self, disease_name: str) -> Dict:
         """根据名称获取疾病信息"""
         try:
-            query = {
-                "query": {
-                    "bool": {
-                        "should": [
-                            {"match": {"name": disease_name}},
-                            {"match": {"standard_name": disease_name}},
-                            {"match": {"aliases": disease_name}}
-                        ]
-                    }
-                }
-            }
-            result = self.es.search(index=self.diseases_index, body=query)
+            result = self.es.search(index=self.diseases_index, body=self._build_name_query(disease_name))
             hits = result['hits']['hits']
             return hits[0]['_source'] if hits else {}
         except Exception as e:
             logger.warning(f"获取疾病信息失败: {str(e)}")
             return {}
 
-    def _gather_evidence(self, enhanced_case: EnhancedCase):
-        """收集相关证据（根据环境变量控制）"""
-        drug_id = enhanced_case.drug.id
-        disease_id = enhanced_case.disease.id
-        
-        # 获取临床指南（可通过环境变量禁用）
-        if self.enable_clinical_guidelines:
-            enhanced_case.evidence.clinical_guidelines = self._get_clinical_guidelines(
-                drug_id, disease_id
-            )
-        else:
-            enhanced_case.evidence.clinical_guidelines = []
-        
-        # 获取专家共识（可通过环境变量禁用）
-        if self.enable_expert_consensus:
-            enhanced_case.evidence.expert_consensus = self._get_expert_consensus(
-                drug_id, disease_id
-            )
-        else:
-            enhanced_case.evidence.expert_consensus = []
-        
-        # 获取研究文献（可通过环境变量禁用）
-        if self.enable_research_papers:
-            enhanced_case.evidence.research_papers = self._get_research_papers(
-                drug_id, disease_id
-            )
-        else:
-            enhanced_case.evidence.research_papers = []
+    def _evidence_sources(self) -> List[tuple]:
+        """已启用的证据源: (索引, 条数, EnhancedCase.Evidence属性, 名称)"""
+        sources = [
+            (self.enable_clinical_guidelines, self.clinical_guidelines_index, 5, "clinical_guidelines", "临床指南"),
+            (self.enable_expert_consensus, self.expert_consensus_index, 5, "expert_consensus", "专家共识"),
+            (self.enable_research_papers, self.research_papers_index, 10, "research_papers", "研究文献"),
+        ]
+        return [source[1:] for source in sources if source[0]]
 
-    def _get_clinical_guidelines(self, drug_id: str, disease_id: str) -> List[Dict]:
-        """获取相关的临床指南"""
-        try:
-            query = {
-                "query": {
-                    "bool": {
-                        "must": [
-                            {"term": {"drug_id": drug_id}},
-                            {"term": {"disease_id": disease_id}}
-                        ]
-                    }
-                },
-                "size": 5
-            }
-            result = self.es.search(index=self.clinical_guidelines_index, body=query)
-            return [hit['_source'] for hit in result['hits']['hits']]
-        except NotFoundError:
-            logger.warning(f"临床指南索引不存在: {self.clinical_guidelines_index}")
-            return []
-        except Exception as e:
-            logger.warning(f"获取临床指南失败: {str(e)}")
-            return []
+    def _build_evidence_searches(self, sources: List[tuple], drug_id: str, disease_id: str) -> List[Dict]:
+        """构建所有已启用证据源的_msearch请求体"""
+        searches = []
+        for index, size, attr, _ in sources:
+            searches.append({"index": index})
+            searches.append(self._build_evidence_query(drug_id, disease_id, size, self.EVIDENCE_SOURCE_FIELDS[attr]))
+        return searches
 
-    def _get_expert_consensus(self, drug_id: str, disease_id: str) -> List[Dict]:
-        """获取相关的专家共识"""
-        try:
-            query = {
-                "query": {
-                    "bool": {
-                        "must": [
-                            {"term": {"drug_id": drug_id}},
-                            {"term": {"disease_id": disease_id}}
-                        ]
-                    }
-                },
-                "size": 5
-            }
-            result = self.es.search(index=self.expert_consensus_index, body=query)
-            return [hit['_source'] for hit in result['hits']['hits']]
-        except NotFoundError:
-            logger.warning(f"专家共识索引不存在: {self.expert_consensus_index}")
-            return []
-        except Exception as e:
-            logger.warning(f"获取专家共识失败: {str(e)}")
-            return []
+    def _apply_evidence(self, enhanced_case: EnhancedCase, sources: List[tuple], responses: List[Dict]):
+        """将_msearch结果写入病例证据，单个证据源失败时记为空"""
+        enhanced_case.evidence.clinical_guidelines = []
+        enhanced_case.evidence.expert_consensus = []
+        enhanced_case.evidence.research_papers = []
+        for (index, _, attr, label), response in zip(sources, responses):
+            if 'error' in response:
+                error = response['error']
+                if isinstance(error, dict) and error.get('type') == 'index_not_found_exception':
+                    logger.warning(f"{label}索引不存在: {index}")
+                else:
+                    logger.warning(f"获取{label}失败: {error}")
+                continue
+            setattr(enhanced_case.evidence, attr, [hit['_source'] for hit in response['hits']['hits']])
 
-    def _get_research_papers(self, drug_id: str, disease_id: str) -> List[Dict]:
-        """获取相关的研究文献"""
-        try:
-            query = {
-                "query": {
-                    "bool": {
-                        "must": [
-                            {"term": {"drug_id": drug_id}},
-                            {"term": {"disease_id": disease_id}}
-                        ]
-                    }
-                },
-                "size": 10
-            }
-            result = self.es.search(index=self.research_papers_index, body=query)
-            return [hit['_source'] for hit in result['hits']['hits']]
-        except NotFoundError:
-            logger.warning(f"研究文献索引不存在: {self.research_papers_index}")
-            return []
-        except Exception as e:
-            logger.warning(f"获取研究文献失败: {str(e)}")
-            return []
+    def _gather_evidence(self, enhanced_case: EnhancedCase):
+        """收集相关证据（已启用的证据源合并为一次_msearch）"""
+        sources = self._evidence_sources()
+        responses = []
+        if sources:
+            try:
+                result = self.es.msearch(searches=self._build_evidence_searches(
+                    sources, enhanced_case.drug.id, enhanced_case.disease.id
+                ))
+                responses = result['responses']
+            except Exception as e:
+                logger.warning(f"获取证据失败: {str(e)}")
+        self._apply_evidence(enhanced_case, sources, responses)
+
+    def _build_evidence_query(self, drug_id: str, disease_id: str, size: int,
+                              source_fields: Optional[List[str]] = None) -> Dict:
+        """构建药品-疾病证据检索查询"""
+        return {
+            "query": {
+                "bool": {
+                    "must": [
+                        {"term": {"drug_id": drug_id}},
+                        {"term": {"disease_id": disease_id}}
+                    ]
+                }
+            },
+            "_source": source_fields if source_fields is not None else True,
+            "size": size
+        }
 
     def _update_drug_info(self, drug_info: EnhancedCase.DrugInfo, data: Dict):
         """更新药品信息"""
@@ -218,6 +270,7 @@ class KnowledgeEnhancer:
             drug_info.indications = indications_list
         else:
             drug_info.indications = data.get('indications', [])
+        drug_info.indication_ids = data.get('indication_disease_ids', [])
         
         drug_info.contraindications = data.get('contraindications', [])
         drug_info.precautions = data.get('precautions', [])
@@ -232,3 +285,83 @@ class KnowledgeEnhancer:
         disease_info.standard_name = data.get('standard_name') or data.get('name')
         disease_info.description = data.get('description')
         disease_info.icd_code = data.get('icd_code')
+
+
+
+class AsyncKnowledgeEnhancer(KnowledgeEnhancer):
+    """异步知识增强 - 使用AsyncElasticsearch，证据检索并发执行"""
+
+    def __init__(self, es: AsyncElasticsearch = None, indication_index=None):
+        self.es = es or get_async_es_client()
+        self.indication_index = indication_index
+        self._init_indices()
+
+    async def enhance_case(self, case: Case) -> EnhancedCase:
+        """增强病例信息（异步版）"""
+        enhanced_case = EnhancedCase(case)
+        drug_id, disease_id = self._matched_ids(case)
+
+        if drug_id or disease_id:
+            try:
+                result = await self.es.mget(docs=self._build_entity_docs(drug_id, disease_id))
+                drug_info, disease_info = self._parse_entity_docs(drug_id, disease_id, result['docs'])
+            except Exception as e:
+                logger.warning(f"获取药品/疾病信息失败: {str(e)}")
+                drug_info, disease_info = {}, {}
+            self._apply_entity_docs(enhanced_case, drug_id, disease_id, drug_info, disease_info)
+
+        await self._gather_evidence(enhanced_case)
+
+        return enhanced_case
+
+    async def get_drug_by_id(self, drug_id: str) -> Dict:
+        """根据ID获取药品信息"""
+        try:
+            result = await self.es.get(index=self.drugs_index, id=drug_id)
+            return result['_source']
+        except Exception as e:
+            logger.warning(f"获取药品信息失败: {str(e)}")
+            return {}
+
+    async def get_drug_by_name(self, drug_name: str) -> Dict:
+        """根据名称获取药品信息"""
+        try:
+            result = await self.es.search(index=self.drugs_index, body=self._build_name_query(drug_name))
+            hits = result['hits']['hits']
+            return hits[0]['_source'] if hits else {}
+        except Exception as e:
+            logger.warning(f"获取药品信息失败: {str(e)}")
+            return {}
+
+    async def get_disease_by_id(self, disease_id: str) -> Dict:
+        """根据ID获取疾病信息"""
+        try:
+            result = await self.es.get(index=self.diseases_index, id=disease_id)
+            return result['_source']
+        except Exception as e:
+            logger.warning(f"获取疾病信息失败: {str(e)}")
+            return {}
+
+    async def get_disease_by_name(self, disease_name: str) -> Dict:
+        """根据名称获取疾病信息"""
+        try:
+            result = await self.es.search(index=self.diseases_index, body=self._build_name_query(disease_name))
+            hits = result['hits']['hits']
+            return hits[0]['_source'] if hits else {}
+        except Exception as e:
+            logger.warning(f"获取疾病信息失败: {str(e)}")
+            return {}
+
+    async def _gather_evidence(self, enhanced_case: EnhancedCase):
+        """收集相关证据（异步版，已启用的证据源合并为一次_msearch）"""
+        sources = self._evidence_sources()
+        responses = []
+        if sources:
+            try:
+                result = await self.es.msearch(searches=self._build_evidence_searches(
+                    sources, enhanced_case.drug.id, enhanced_case.disease.id
+                ))
+                responses = result['responses']
+            except Exception as e:
+                logger.warning(f"获取证据失败: {str(e)}")
+        self._apply_evidence(enhanced_case, sources, responses)
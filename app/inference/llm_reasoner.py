@@ -1,17 +1,23 @@
 """适应症分析核心逻辑"""
 
-import os
 import json
 import re
 from datetime import datetime
-from typing import Dict, List, Any
-from openai import OpenAI
-from elasticsearch import Elasticsearch
+from typing import Callable, Dict, List, Any, Optional, Tuple
+from openai import OpenAI, AsyncOpenAI
+from elasticsearch import Elasticsearch, AsyncElasticsearch
 
-from app.shared import get_es_client, load_env
+from app.shared import (
+    get_es_client, get_async_es_client, get_llm_client, get_async_llm_client, load_env,
+    create_chat_completion, create_chat_completion_async, stream_chat_completion_async,
+    LLMResponseCache, get_llm_cache, get_llm_circuit_breaker, Config
+)
+from app.shared.rate_limiter import TIMEOUT, classify_exception
+from .deadline import Deadline, DeadlineExceededError, run_stage, track_stage
 from .models import Case, EnhancedCase
 from .rule_checker import RuleAnalyzer
-from .knowledge_retriever import KnowledgeEnhancer
+from .disease_relations import get_disease_relations
+from .knowledge_retriever import KnowledgeEnhancer, AsyncKnowledgeEnhancer
 from .result_synthesizer import ResultSynthesizer
 from .prompt import create_indication_analysis_prompt
 
@@ -19,30 +25,111 @@ import logging
 logging.basicConfig(level=logging.DEBUG, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
+# LLM调用策略：
+# always       - 每个病例都调用LLM
+# on_uncertain - 规则分析已有定论（适应症精确匹配或命中禁忌症）时直接返回规则结果
+# never        - 只使用规则分析
+LLM_POLICIES = ("always", "on_uncertain", "never")
+
+# 分析阶段事件回调: (事件名, 数据)，供流式接口在各阶段完成时推送
+EventCallback = Callable[[str, Dict[str, Any]], None]
+
 class IndicationAnalyzer:
     """适应症分析器 - 分析用药是否属于超适应症"""
     
-    def __init__(self, es: Elasticsearch = None):
+    def __init__(self, es: Elasticsearch = None, client: OpenAI = None,
+                 llm_cache: LLMResponseCache = None, indication_index=None):
         """初始化分析器
         
         Args:
-            es: Elasticsearch客户端实例
+            es: Elasticsearch客户端实例（传入时复用其连接池）
+            client: LLM客户端实例（传入时复用其HTTP连接池）
+            llm_cache: LLM响应缓存（默认使用config.yaml配置的进程级缓存）
+            indication_index: 可选的IndicationIndex，规则可直接定论时免去ES检索
         """
         self.es = es or get_es_client()
         
         # DeepSeek API 设置
-        load_env()
-        self.client = OpenAI(
-            api_key=os.getenv("DEEPSEEK_API_KEY"),
-            base_url="https://api.deepseek.com"
-        )
+        if client is None:
+            load_env()
+            client = get_llm_client()
+        self.client = client
         self.model = "deepseek-chat"
+        self.llm_cache = llm_cache or get_llm_cache()
+        self.llm_policy = self._load_llm_policy()
+        self.circuit_breaker = get_llm_circuit_breaker()
         
-        # 初始化其他模块
-        self.rule_analyzer = RuleAnalyzer()
-        self.knowledge_enhancer = KnowledgeEnhancer(es)
+        # 初始化其他模块（与本实例共享同一个ES客户端）
+        self.rule_analyzer = RuleAnalyzer(indication_index, get_disease_relations())
+        self.knowledge_enhancer = KnowledgeEnhancer(self.es, indication_index)
         self.result_synthesizer = ResultSynthesizer()
 
+    def _load_llm_policy(self) -> str:
+        """从config读取LLM调用策略（inference.llm_policy）"""
+        llm_policy = Config.get_inference_config().get('llm_policy', 'always')
+        if llm_policy not in LLM_POLICIES:
+            raise ValueError(f"无效的llm_policy: {llm_policy}，可选值: {', '.join(LLM_POLICIES)}")
+        return llm_policy
+    
+    def _rule_is_decisive(self, rule_result: Dict[str, Any]) -> bool:
+        """规则分析是否已有定论：适应症精确匹配（置信度1.0）或命中禁忌症
+        
+        病例描述中提及禁忌症（如合并症）但诊断本身未命中时，需LLM结合上下文判断。
+        """
+        if rule_result.get("contraindicated"):
+            return True
+        if rule_result.get("contraindication_mentions"):
+            return False
+        return rule_result.get("match_type") == "exact" and rule_result.get("confidence", 0) >= 1.0
+    
+    def _emit_rules(self, emit: Optional[EventCallback], analysis_context: Dict[str, Any]):
+        """推送规则分析结果，llm_required 表示是否还需等待LLM结论"""
+        if emit:
+            emit("rules", {
+                "disease_name": analysis_context["disease_name"],
+                "rule_result": analysis_context["rule_result"],
+                "llm_required": self._should_call_llm(analysis_context["rule_result"])
+            })
+    
+    def _llm_unavailable(self, deadline: Optional[Deadline]) -> Optional[str]:
+        """LLM阶段不可用的原因（剩余预算不足 / 熔断），None表示可以调用"""
+        if deadline is not None and deadline.llm_budget_exhausted():
+            return "deadline"
+        if self.circuit_breaker is not None and not self.circuit_breaker.allow():
+            return "circuit_open"
+        return None
+    
+    def _record_llm_outcome(self, error: Optional[Exception] = None):
+        if self.circuit_breaker is None:
+            return
+        if error is None:
+            self.circuit_breaker.record_success()
+        else:
+            self.circuit_breaker.record_failure()
+    
+    def _degrade_on_llm_error(self, analysis_context: Dict[str, Any], error: Exception,
+                              deadline: Optional[Deadline]) -> Dict[str, Any]:
+        """LLM调用失败：设置了时间预算且为超时时降级为规则结论，否则继续抛出
+        
+        预算引起的超时（DeadlineExceededError，或时间预算生效时以剩余预算为超时的请求超时）
+        反映的是调用方的预算而非服务健康状况，不计入熔断器；其余错误计为失败。
+        """
+        budget_timeout = isinstance(error, DeadlineExceededError) or (
+            deadline is not None and classify_exception(error) == TIMEOUT
+        )
+        if budget_timeout:
+            return self._finalize_degraded(analysis_context, "llm_timeout")
+        self._record_llm_outcome(error)
+        raise error
+    
+    def _should_call_llm(self, rule_result: Dict[str, Any]) -> bool:
+        """根据LLM调用策略和规则结果决定是否调用LLM"""
+        if self.llm_policy == "always":
+            return True
+        if self.llm_policy == "never":
+            return False
+        return not self._rule_is_decisive(rule_result)
+
     def _clean_json_response(self, response: str) -> str:
         """清理和格式化JSON响应
         
@@ -99,11 +186,255 @@ class IndicationAnalyzer:
             logger.error(f"原始响应: {response}")
             raise ValueError(f"无法解析JSON响应: {str(e)}")
 
-    def analyze_indication(self, case: Case) -> Dict[str, Any]:
+    def _run_rules(self, case: Case, enhanced_case: EnhancedCase) -> Tuple[str, Dict[str, Any]]:
+        """确定分析用的疾病名称并执行规则分析
+        
+        疾病经层级/模糊/相关匹配对齐到另一个疾病时（match_type不是exact），对齐结果是不同的疾病：
+        规则分析使用识别出的原始诊断名，对齐疾病与适应症的匹配至多按上下位关系处理（见 _apply_aligned_match）。
+        
+        Returns:
+            Tuple[str, Dict]: (疾病名称, 规则分析结果)
+        """
+        if not case.recognized_entities.diseases:
+            raise ValueError("未识别到疾病信息")
+        recognized_disease = case.recognized_entities.diseases[0]
+        disease_match = recognized_disease.matches[0] if recognized_disease.matches else None
+        aligned = disease_match is not None and disease_match.match_type != "exact"
+        
+        # 获取疾病名称：精确匹配时使用ES匹配的标准名，否则使用LLM识别的原始疾病名
+        if disease_match is not None and not aligned:
+            disease_name_for_analysis = enhanced_case.disease.name or recognized_disease.name
+        else:
+            disease_name_for_analysis = recognized_disease.name
+            if aligned:
+                logger.info(f"疾病'{recognized_disease.name}'经{disease_match.match_type}匹配对齐到"
+                            f"'{enhanced_case.disease.name}'，规则分析使用原始名称")
+            else:
+                logger.info(f"疾病未在ES中匹配，使用LLM识别的原始名称: {disease_name_for_analysis}")
+        
+        drug_info = {
+            "id": enhanced_case.drug.id,
+            "name": enhanced_case.drug.name,
+            "indications": enhanced_case.drug.indications,
+            "indication_ids": enhanced_case.drug.indication_ids,
+            "contraindications": enhanced_case.drug.contraindications,
+            "details": enhanced_case.drug.details
+        }
+        description = enhanced_case.context.description if enhanced_case.context else ""
+        
+        # 规则分析 - 使用确定的疾病名称（对齐到其它疾病时不使用其ID）
+        rule_result = self.rule_analyzer.analyze(drug_info, {
+            "id": enhanced_case.disease.id if enhanced_case.disease.id and not aligned else None,
+            "name": disease_name_for_analysis,
+            "description": description
+        })
+        if aligned and not rule_result.get("match_type") and enhanced_case.disease.name:
+            aligned_result = self.rule_analyzer.analyze(drug_info, {
+                "id": enhanced_case.disease.id,
+                "name": enhanced_case.disease.name,
+                "description": description
+            })
+            self._apply_aligned_match(rule_result, aligned_result, disease_match.match_type,
+                                      enhanced_case.disease.name)
+        logger.debug(f"Rule analysis result: {rule_result}")
+        return disease_name_for_analysis, rule_result
+    
+    @staticmethod
+    def _apply_aligned_match(rule_result: Dict[str, Any], aligned_result: Dict[str, Any],
+                             alignment: str, aligned_name: str):
+        """对齐疾病与适应症匹配时，按上下位关系（置信度0.8，不构成定论）写入规则结果"""
+        if not aligned_result.get("match_type"):
+            return
+        rule_result["match_type"] = "hierarchy"
+        rule_result["matched_indication"] = aligned_result["matched_indication"]
+        if not rule_result.get("contraindicated"):
+            rule_result["is_offlabel"] = False
+            rule_result["confidence"] = max(rule_result.get("confidence", 0.0), 0.8)
+        rule_result["reasoning"].append(
+            f"诊断经{alignment}匹配对齐到'{aligned_name}'，与药品适应症按上下位关系处理"
+        )
+        rule_result["evidence"].append(f"对齐疾病匹配: {aligned_result['matched_indication']}")
+    
+    def _try_rules_from_index(self, case: Case) -> Optional[Dict[str, Any]]:
+        """仅用内存适应症索引执行规则分析（不访问ES）
+        
+        llm_policy不是always、未启用证据源且药品在索引中时，若规则即可给出结论，
+        返回分析上下文；否则返回None，走完整的知识增强流程。
+        """
+        if self.llm_policy == "always" or self.knowledge_enhancer.evidence_enabled:
+            return None
+        enhanced_case = self.knowledge_enhancer.enhance_case_from_index(case)
+        if enhanced_case is None:
+            return None
+        disease_name, rule_result = self._run_rules(case, enhanced_case)
+        if self._should_call_llm(rule_result):
+            return None
+        return {
+            "enhanced_case": enhanced_case,
+            "disease_name": disease_name,
+            "rule_result": rule_result,
+            "clinical_guidelines": [],
+            "expert_consensus": [],
+            "research_papers": [],
+            "prompt": None
+        }
+    
+    def _prepare_analysis(self, case: Case, enhanced_case: EnhancedCase) -> Dict[str, Any]:
+        """在知识增强结果的基础上执行规则分析并构建LLM提示
+        
+        Args:
+            case: 包含实体识别结果的病例数据
+            enhanced_case: 知识增强后的病例
+            
+        Returns:
+            Dict: 分析上下文（规则结果、证据、提示词等），供LLM调用与结果综合使用
+        """
+        disease_name_for_analysis, rule_result = self._run_rules(case, enhanced_case)
+        
+        # 检查补充数据的可用性
+        clinical_guidelines = enhanced_case.evidence.clinical_guidelines
+        expert_consensus = enhanced_case.evidence.expert_consensus
+        research_papers = enhanced_case.evidence.research_papers
+        
+        # 构建数据状态说明
+        clinical_guidelines_status = "（数据不可用）" if not clinical_guidelines else ""
+        expert_consensus_status = "（数据不可用）" if not expert_consensus else ""
+        research_papers_status = "（数据不可用）" if not research_papers else ""
+        
+        # 构建分析提示 - 使用确定的疾病名称
+        prompt = create_indication_analysis_prompt(
+            drug_name=enhanced_case.drug.name,
+            indications=json.dumps(enhanced_case.drug.indications, ensure_ascii=False),
+            pharmacology=enhanced_case.drug.pharmacology or "无相关信息",
+            contraindications=json.dumps(enhanced_case.drug.contraindications, ensure_ascii=False),
+            precautions=json.dumps(enhanced_case.drug.precautions, ensure_ascii=False),
+            diagnosis=disease_name_for_analysis,  # 使用确定的疾病名称
+            description=enhanced_case.context.description if enhanced_case.context else "",
+            rule_analysis=json.dumps(rule_result, ensure_ascii=False),
+            clinical_guidelines_status=clinical_guidelines_status,
+            clinical_guidelines=json.dumps(clinical_guidelines or [], ensure_ascii=False),
+            expert_consensus_status=expert_consensus_status,
+            expert_consensus=json.dumps(expert_consensus or [], ensure_ascii=False),
+            research_papers_status=research_papers_status,
+            research_papers=json.dumps(research_papers or [], ensure_ascii=False)
+        )
+        logger.debug(f"Analysis prompt: {prompt}")
+        
+        return {
+            "enhanced_case": enhanced_case,
+            "disease_name": disease_name_for_analysis,
+            "rule_result": rule_result,
+            "clinical_guidelines": clinical_guidelines,
+            "expert_consensus": expert_consensus,
+            "research_papers": research_papers,
+            "prompt": prompt
+        }
+    
+    def _build_messages(self, prompt: str) -> List[Dict[str, str]]:
+        """构建适应症分析的对话消息"""
+        return [
+            {"role": "system", "content": "你是一个专业的医学分析助手，请严格按照要求的JSON格式返回分析结果，不要添加任何额外的说明或注释。"},
+            {"role": "user", "content": prompt}
+        ]
+    
+    def _finalize_analysis(self, analysis_context: Dict[str, Any], response: str) -> Dict[str, Any]:
+        """解析LLM响应并综合规则与证据，得到最终分析结果
+        
+        Args:
+            analysis_context: _prepare_analysis返回的分析上下文
+            response: LLM原始响应文本
+            
+        Returns:
+            Dict: 综合分析结果
+        """
+        logger.debug(f"Raw LLM response: {response}")
+        
+        # 解析响应
+        try:
+            # 清理和格式化响应
+            cleaned_response = self._clean_json_response(response)
+            logger.debug(f"Cleaned LLM response: {cleaned_response}")
+            
+            llm_result = json.loads(cleaned_response)
+            logger.debug(f"Parsed LLM result: {llm_result}")
+        except json.JSONDecodeError as e:
+            logger.error(f"解析模型响应时发生错误: {str(e)}")
+            logger.error(f"原始响应: {response}")
+            raise ValueError(f"无法解析模型响应: {str(e)}")
+        
+        return self._synthesize_result(analysis_context, llm_result, tier="llm")
+    
+    def _finalize_rule_only(self, analysis_context: Dict[str, Any]) -> Dict[str, Any]:
+        """不调用LLM，仅根据规则分析与证据得到最终分析结果"""
+        logger.info("规则分析已有定论，跳过LLM调用")
+        return self._synthesize_result(analysis_context, {}, tier="rules")
+    
+    def _finalize_degraded(self, analysis_context: Dict[str, Any], reason: str) -> Dict[str, Any]:
+        """LLM不可用（超时、预算不足或熔断）时返回规则分析结论，并标记为降级结果"""
+        logger.warning(f"LLM不可用（{reason}），返回规则分析结论")
+        final_result = self._synthesize_result(analysis_context, {}, tier="rules")
+        if "metadata" in final_result:
+            final_result["metadata"]["degraded"] = True
+            final_result["metadata"]["degraded_reason"] = reason
+        return final_result
+    
+    def _synthesize_result(self, analysis_context: Dict[str, Any], llm_result: Dict[str, Any],
+                           tier: str) -> Dict[str, Any]:
+        """综合规则、LLM与证据结果
+        
+        Args:
+            analysis_context: _prepare_analysis返回的分析上下文
+            llm_result: 解析后的LLM结果（规则层直接给出结论时为空）
+            tier: 给出结论的层级（rules / llm），记录在metadata中
+            
+        Returns:
+            Dict: 综合分析结果
+        """
+        enhanced_case = analysis_context["enhanced_case"]
+        rule_result = analysis_context["rule_result"]
+        clinical_guidelines = analysis_context["clinical_guidelines"]
+        expert_consensus = analysis_context["expert_consensus"]
+        research_papers = analysis_context["research_papers"]
+        
+        # 综合分析结果（result_synthesizer现在返回Dict）
+        # 传递完整的药品信息到knowledge_context
+        final_result = self.result_synthesizer.synthesize(
+            rule_result,
+            llm_result,
+            {
+                "clinical_guidelines": clinical_guidelines or [],
+                "expert_consensus": expert_consensus or [],
+                "research_papers": research_papers or [],
+                "drug_info": {
+                    "indications_list": enhanced_case.drug.indications if isinstance(enhanced_case.drug.indications, list) else [],
+                    "indications": enhanced_case.drug.indications if isinstance(enhanced_case.drug.indications, list) else [],
+                    "contraindications": enhanced_case.drug.contraindications or []
+                }
+            }
+        )
+        logger.debug(f"Final synthesized result: {final_result}")
+        
+        # 添加数据可用性信息到metadata
+        if "metadata" in final_result:
+            final_result["metadata"]["data_availability"] = {
+                "clinical_guidelines": bool(clinical_guidelines),
+                "expert_consensus": bool(expert_consensus),
+                "research_papers": bool(research_papers)
+            }
+            final_result["metadata"]["tier"] = tier
+            final_result["metadata"]["degraded"] = False
+        
+        # 直接返回Dict结果，在result_generator中转换为最终输出
+        # 这样可以保持更灵活的数据流
+        logger.debug(f"Returning synthesized result as Dict")
+        return final_result
+
+    def analyze_indication(self, case: Case, deadline: Optional[Deadline] = None) -> Dict[str, Any]:
         """分析用药适应症情况
         
         Args:
             case: 包含实体识别结果的病例数据
+            deadline: 可选的时间预算，LLM阶段超时或预算不足时返回降级的规则结论
             
         Returns:
             Dict: 分析结果（符合新的输出结构）
@@ -112,124 +443,43 @@ class IndicationAnalyzer:
             if not case.recognized_entities.drugs:
                 raise ValueError("未识别到药品信息")
             
+            # 内存适应症索引可直接定论时，无需ES检索与LLM调用
+            analysis_context = self._try_rules_from_index(case)
+            if analysis_context is not None:
+                return self._finalize_rule_only(analysis_context)
+            
             # 知识增强
-            enhanced_case = self.knowledge_enhancer.enhance_case(case)
+            with track_stage(deadline, "knowledge"):
+                enhanced_case = self.knowledge_enhancer.enhance_case(case)
             logger.debug(f"Enhanced case: {enhanced_case}")
             
-            # 获取疾病名称：优先使用ES匹配的，如果没有则使用LLM抽取的原始疾病名
-            if case.recognized_entities.diseases and case.recognized_entities.diseases[0].matches:
-                # 有ES匹配结果
-                disease_name_for_analysis = enhanced_case.disease.name or case.recognized_entities.diseases[0].name
-            elif case.recognized_entities.diseases:
-                # 没有ES匹配，但LLM识别出了疾病
-                disease_name_for_analysis = case.recognized_entities.diseases[0].name
-                logger.info(f"疾病未在ES中匹配，使用LLM识别的原始名称: {disease_name_for_analysis}")
-            else:
-                raise ValueError("未识别到疾病信息")
-            
-            # 规则分析 - 使用确定的疾病名称
-            rule_result = self.rule_analyzer.analyze(
-                {
-                    "id": enhanced_case.drug.id,
-                    "name": enhanced_case.drug.name,
-                    "indications": enhanced_case.drug.indications,
-                    "contraindications": enhanced_case.drug.contraindications,
-                    "details": enhanced_case.drug.details
-                },
-                {
-                    "id": enhanced_case.disease.id if enhanced_case.disease.id else None,
-                    "name": disease_name_for_analysis  # 使用确定的疾病名称
-                }
-            )
-            logger.debug(f"Rule analysis result: {rule_result}")
-            
-            # 检查补充数据的可用性
-            clinical_guidelines = enhanced_case.evidence.clinical_guidelines
-            expert_consensus = enhanced_case.evidence.expert_consensus
-            research_papers = enhanced_case.evidence.research_papers
-            
-            # 构建数据状态说明
-            clinical_guidelines_status = "（数据不可用）" if not clinical_guidelines else ""
-            expert_consensus_status = "（数据不可用）" if not expert_consensus else ""
-            research_papers_status = "（数据不可用）" if not research_papers else ""
-            
-            # 构建分析提示 - 使用确定的疾病名称
-            prompt = create_indication_analysis_prompt(
-                drug_name=enhanced_case.drug.name,
-                indications=json.dumps(enhanced_case.drug.indications, ensure_ascii=False),
-                pharmacology=enhanced_case.drug.pharmacology or "无相关信息",
-                contraindications=json.dumps(enhanced_case.drug.contraindications, ensure_ascii=False),
-                precautions=json.dumps(enhanced_case.drug.precautions, ensure_ascii=False),
-                diagnosis=disease_name_for_analysis,  # 使用确定的疾病名称
-                description=enhanced_case.context.description if enhanced_case.context else "",
-                rule_analysis=json.dumps(rule_result, ensure_ascii=False),
-                clinical_guidelines_status=clinical_guidelines_status,
-                clinical_guidelines=json.dumps(clinical_guidelines or [], ensure_ascii=False),
-                expert_consensus_status=expert_consensus_status,
-                expert_consensus=json.dumps(expert_consensus or [], ensure_ascii=False),
-                research_papers_status=research_papers_status,
-                research_papers=json.dumps(research_papers or [], ensure_ascii=False)
-            )
-            logger.debug(f"Analysis prompt: {prompt}")
-
-            # 调用模型
-            completion = self.client.chat.completions.create(
-                model=self.model,
-                messages=[
-                    {"role": "system", "content": "你是一个专业的医学分析助手，请严格按照要求的JSON格式返回分析结果，不要添加任何额外的说明或注释。"},
-                    {"role": "user", "content": prompt}
-                ],
-                temperature=0.1,
-                max_tokens=2000
-            )
+            # 规则分析 + 构建提示
+            analysis_context = self._prepare_analysis(case, enhanced_case)
             
-            response = completion.choices[0].message.content
-            logger.debug(f"Raw LLM response: {response}")
+            # 规则已有定论时不调用模型（取决于llm_policy）
+            if not self._should_call_llm(analysis_context["rule_result"]):
+                return self._finalize_rule_only(analysis_context)
             
-            # 解析响应
+            degraded_reason = self._llm_unavailable(deadline)
+            if degraded_reason:
+                return self._finalize_degraded(analysis_context, degraded_reason)
+
+            # 调用模型（设置了时间预算时，以剩余预算作为请求超时）
             try:
-                # 清理和格式化响应
-                cleaned_response = self._clean_json_response(response)
-                logger.debug(f"Cleaned LLM response: {cleaned_response}")
-                
-                llm_result = json.loads(cleaned_response)
-                logger.debug(f"Parsed LLM result: {llm_result}")
-                
-                # 综合分析结果（result_synthesizer现在返回Dict）
-                # 传递完整的药品信息到knowledge_context
-                final_result = self.result_synthesizer.synthesize(
-                    rule_result,
-                    llm_result,
-                    {
-                        "clinical_guidelines": clinical_guidelines or [],
-                        "expert_consensus": expert_consensus or [],
-                        "research_papers": research_papers or [],
-                        "drug_info": {
-                            "indications_list": enhanced_case.drug.indications if isinstance(enhanced_case.drug.indications, list) else [],
-                            "indications": enhanced_case.drug.indications if isinstance(enhanced_case.drug.indications, list) else [],
-                            "contraindications": enhanced_case.drug.contraindications or []
-                        }
-                    }
-                )
-                logger.debug(f"Final synthesized result: {final_result}")
-                
-                # 添加数据可用性信息到metadata
-                if "metadata" in final_result:
-                    final_result["metadata"]["data_availability"] = {
-                        "clinical_guidelines": bool(clinical_guidelines),
-                        "expert_consensus": bool(expert_consensus),
-                        "research_papers": bool(research_papers)
-                    }
-                
-                # 直接返回Dict结果，在result_generator中转换为最终输出
-                # 这样可以保持更灵活的数据流
-                logger.debug(f"Returning synthesized result as Dict")
-                return final_result
-                
-            except json.JSONDecodeError as e:
-                logger.error(f"解析模型响应时发生错误: {str(e)}")
-                logger.error(f"原始响应: {response}")
-                raise ValueError(f"无法解析模型响应: {str(e)}")
+                with track_stage(deadline, "llm"):
+                    response = create_chat_completion(
+                        self.client,
+                        model=self.model,
+                        messages=self._build_messages(analysis_context["prompt"]),
+                        cache=self.llm_cache,
+                        timeout=deadline.stage_timeout("llm") if deadline else None,
+                        temperature=0.1,
+                        max_tokens=2000
+                    )
+            except Exception as e:
+                return self._degrade_on_llm_error(analysis_context, e, deadline)
+            self._record_llm_outcome()
+            return self._finalize_analysis(analysis_context, response)
                 
         except Exception as e:
             logger.error(f"分析适应症时发生错误: {str(e)}")
@@ -250,3 +500,104 @@ class IndicationAnalyzer:
                 case.updated_at = datetime.now()
             except Exception as e:
                 logger.error(f"处理病例 {case.id} 时发生错误: {str(e)}")
+
+
+class AsyncIndicationAnalyzer(IndicationAnalyzer):
+    """异步适应症分析器 - ES检索与LLM调用均不阻塞事件循环"""
+    
+    def __init__(self, es: AsyncElasticsearch = None, client: AsyncOpenAI = None,
+                 llm_cache: LLMResponseCache = None, indication_index=None):
+        """初始化异步分析器
+        
+        Args:
+            es: AsyncElasticsearch客户端实例
+            client: 异步LLM客户端实例
+            llm_cache: LLM响应缓存（默认使用config.yaml配置的进程级缓存）
+            indication_index: 可选的IndicationIndex，规则可直接定论时免去ES检索
+        """
+        self.es = es or get_async_es_client()
+        
+        if client is None:
+            load_env()
+            client = get_async_llm_client()
+        self.client = client
+        self.model = "deepseek-chat"
+        self.llm_cache = llm_cache or get_llm_cache()
+        self.llm_policy = self._load_llm_policy()
+        self.circuit_breaker = get_llm_circuit_breaker()
+        
+        self.rule_analyzer = RuleAnalyzer(indication_index, get_disease_relations())
+        self.knowledge_enhancer = AsyncKnowledgeEnhancer(self.es, indication_index)
+        self.result_synthesizer = ResultSynthesizer()
+    
+    async def analyze_indication(self, case: Case, emit: Optional[EventCallback] = None,
+                                 deadline: Optional[Deadline] = None) -> Dict[str, Any]:
+        """分析用药适应症情况（异步版）
+        
+        任务被取消时（如客户端断开），正在进行的LLM请求会随之取消。
+        
+        Args:
+            case: 包含实体识别结果的病例数据
+            emit: 可选的阶段事件回调，依次收到 evidence、rules、llm_token（流式模式调用LLM）事件
+            deadline: 可选的时间预算，知识增强与LLM调用按阶段超时；LLM阶段超时或预算不足时返回降级的规则结论
+        """
+        try:
+            if not case.recognized_entities.drugs:
+                raise ValueError("未识别到药品信息")
+            
+            analysis_context = self._try_rules_from_index(case)
+            if analysis_context is not None:
+                self._emit_rules(emit, analysis_context)
+                return self._finalize_rule_only(analysis_context)
+            
+            knowledge_timeout = False
+            try:
+                enhanced_case = await run_stage(deadline, "knowledge", self.knowledge_enhancer.enhance_case(case))
+            except DeadlineExceededError:
+                # 知识增强超时：药品在内存适应症索引中时仍可给出规则结论
+                enhanced_case = self.knowledge_enhancer.enhance_case_from_index(case)
+                if enhanced_case is None:
+                    raise
+                knowledge_timeout = True
+            analysis_context = self._prepare_analysis(case, enhanced_case)
+            if emit:
+                emit("evidence", {
+                    "clinical_guidelines": analysis_context["clinical_guidelines"] or [],
+                    "expert_consensus": analysis_context["expert_consensus"] or [],
+                    "research_papers": analysis_context["research_papers"] or []
+                })
+            self._emit_rules(emit, analysis_context)
+            if not self._should_call_llm(analysis_context["rule_result"]):
+                return self._finalize_rule_only(analysis_context)
+            
+            degraded_reason = "knowledge_timeout" if knowledge_timeout else self._llm_unavailable(deadline)
+            if degraded_reason:
+                return self._finalize_degraded(analysis_context, degraded_reason)
+            
+            params = dict(
+                model=self.model,
+                messages=self._build_messages(analysis_context["prompt"]),
+                cache=self.llm_cache,
+                temperature=0.1,
+                max_tokens=2000
+            )
+            try:
+                response = await run_stage(deadline, "llm", self._call_llm(params, emit))
+            except Exception as e:
+                return self._degrade_on_llm_error(analysis_context, e, deadline)
+            self._record_llm_outcome()
+            return self._finalize_analysis(analysis_context, response)
+        
+        except Exception as e:
+            logger.error(f"分析适应症时发生错误: {str(e)}")
+            raise
+    
+    async def _call_llm(self, params: Dict[str, Any], emit: Optional[EventCallback]) -> str:
+        """调用LLM；有事件回调时以流式模式调用并推送 llm_token 事件"""
+        if not emit:
+            return await create_chat_completion_async(self.client, **params)
+        parts = []
+        async for delta in stream_chat_completion_async(self.client, **params):
+            parts.append(delta)
+            emit("llm_token", {"text": delta})
+        return ''.join(parts)
@@ -15,6 +15,7 @@ class DiseaseMatch:
     id: str
     standard_name: str
     score: float
+    match_type: str = "exact"  # exact/hierarchy/fuzzy/related
 
 @dataclass
 class RecognizedDrug:
@@ -56,6 +57,7 @@ class EnhancedCase:
             self.name: str = None
             self.standard_name: str = None
             self.indications: List[str] = []
+            self.indication_ids: List[str] = []  # 适应症对应的疾病ID
             self.contraindications: List[str] = []
             self.precautions: List[str] = []
             self.pharmacology: str = None
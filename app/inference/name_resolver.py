@@ -0,0 +1,343 @@
+"""进程内药品/疾病名称解析器
+
+从drugs、diseases索引导出全部名称，按原始名称和规范化名称建立哈希表。
+输入名称与索引中的name完全相同或规范化后相同时直接在本地返回匹配，
+未命中时由调用方回退到ES检索。
+
+规范化规则：全半角统一（NFKC）、去空白、小写；疾病名另去掉括号内的补充说明和标点。
+药品名先按保留剂型的规范化名称查找；未命中时才去掉末尾剂型后缀再查找，
+此时同一通用名下的不同剂型（片/注射液/胶囊）是不同产品：只有一个产品时直接返回，
+有多个时非唯一模式返回全部候选，唯一模式返回None交由ES检索，不任取其一。
+
+启用 fuzzy 时另为药品名称建立字符n-gram索引（见 ngram_index.py），
+精确/规范化均未命中的药品名在本地完成模糊匹配，不再发起ES模糊查询。
+启用 disease_matching 时另建疾病层级/模糊匹配表（见 disease_matcher.py），
+精确/规范化均未命中的疾病名按子疾病层级和n-gram相似度在本地匹配。
+"""
+
+import logging
+import re
+import unicodedata
+from typing import AbstractSet, Any, Dict, List, Optional, Tuple
+
+from elasticsearch import Elasticsearch
+
+from app.shared import iter_index_docs
+from .index_snapshot import IndexSnapshot
+
+logger = logging.getLogger(__name__)
+
+# 常见药品剂型后缀
+DOSAGE_FORM_SUFFIXES = ['片', '胶囊', '颗粒', '注射液', '口服液', '软膏', '乳膏', '栓', '丸', '散', '缓释片', '肠溶片']
+_SUFFIXES_LONGEST_FIRST = sorted(DOSAGE_FORM_SUFFIXES, key=len, reverse=True)
+
+# 本地命中的匹配分数（ES路径为BM25得分，本地命中均为名称等价，使用固定值）
+LOCAL_MATCH_SCORE = 1.0
+
+# 每个名称最多保留的文档数（与ES精确查询非唯一模式的size一致）
+MAX_IDS_PER_NAME = 3
+
+ENTITY_KINDS = ("drug", "disease")
+
+# 疾病名中的括号补充说明与标点（NFKC之后全角括号已转为半角）
+_DISEASE_BRACKETS = re.compile(r'[(\[【][^)\]】]*[)\]】]')
+_DISEASE_PUNCTUATION = re.compile(r'[,，、;；:：\'"“”‘’·\-—_/]')
+
+
+def normalize_name(name: str, strip_dosage_form: bool = False) -> str:
+    """规范化名称
+
+    Args:
+        name: 原始名称
+        strip_dosage_form: 是否去掉末尾的剂型后缀（药品名使用）
+    """
+    text = ''.join(unicodedata.normalize('NFKC', name or '').split()).lower()
+    if strip_dosage_form:
+        for suffix in _SUFFIXES_LONGEST_FIRST:
+            if text.endswith(suffix) and len(text) > len(suffix):
+                return text[:-len(suffix)]
+    return text
+
+
+def normalize_disease_name(name: str) -> str:
+    """规范化疾病名称：在normalize_name基础上去掉括号内的补充说明和标点
+
+    如 "高血压（原发性）" -> "高血压"；去掉后为空时保留normalize_name的结果。
+    """
+    text = normalize_name(name)
+    stripped = _DISEASE_PUNCTUATION.sub('', _DISEASE_BRACKETS.sub('', text))
+    return stripped or text
+
+
+def strip_dosage_forms(name: str) -> str:
+    """移除名称中出现的所有剂型后缀（名称相似度比较使用）"""
+    for suffix in DOSAGE_FORM_SUFFIXES:
+        name = name.replace(suffix, '')
+    return name
+
+
+def names_similar(clean1: str, set1: AbstractSet[str], clean2: str, set2: AbstractSet[str]) -> bool:
+    """检查两个已移除剂型后缀的名称是否相似（严格版本）
+
+    字符集合可预先计算，批量比较时避免重复构建。
+    1. 子串包含检查
+    2. 字符顺序匹配检查
+    3. 严格的字符重叠度检查
+
+    Args:
+        clean1: 名称1（查询名）
+        set1: 名称1的字符集合
+        clean2: 名称2（匹配名）
+        set2: 名称2的字符集合
+    """
+    # 策略1：如果清理后的名称相互包含，认为相似
+    if clean1 in clean2 or clean2 in clean1:
+        return True
+
+    # 策略2：检查字符顺序是否匹配
+    # 短名称的所有字符必须在长名称中按顺序出现
+    shorter, longer = (clean1, clean2) if len(clean1) <= len(clean2) else (clean2, clean1)
+    pos = 0
+    for char in shorter:
+        found = longer.find(char, pos)
+        if found == -1:
+            # 有字符找不到，不相似
+            return False
+        pos = found + 1
+
+    # 策略3：严格的字符重叠度检查
+    # 需要至少85%的字符重叠
+    overlap = len(set1 & set2)
+    min_len = min(len(set1), len(set2))
+    if min_len > 0 and overlap / min_len >= 0.85:
+        # 额外检查：长名称不能比短名称长太多
+        # 避免 "艾塞那肽" 匹配 "聚乙二醇洛塞那肽" 这种情况
+        max_len = max(len(clean1), len(clean2))
+        # 长度比例至少要达到60%
+        if min_len / max_len >= 0.6:
+            return True
+
+    return False
+
+
+class NameResolver(IndexSnapshot):
+    """药品/疾病名称本地解析器"""
+
+    name = "名称解析器"
+
+    def __init__(self, es: Elasticsearch = None, drugs_index: str = 'drugs', diseases_index: str = 'diseases',
+                 refresh_interval: float = 300.0, page_size: int = 5000, fuzzy: bool = False,
+                 disease_matching: bool = False, disease_related: bool = False):
+        """初始化解析器（不立即加载）
+
+        Args:
+            es: 同步ES客户端
+            drugs_index: 药品索引名
+            diseases_index: 疾病索引名
+            refresh_interval: 后台检查索引版本的间隔（秒）
+            page_size: 导出时每页条数
+            fuzzy: 是否建立药品名n-gram索引用于本地模糊匹配
+            disease_matching: 是否建立疾病层级/模糊匹配表
+            disease_related: 疾病匹配是否包含related_diseases
+        """
+        super().__init__(es, [drugs_index, diseases_index], refresh_interval, page_size)
+        self.index_names = {"drug": drugs_index, "disease": diseases_index}
+        self.fuzzy = fuzzy
+        self._fuzzy_index = None
+        self.disease_matching = disease_matching
+        self.disease_related = disease_related
+        self._disease_matcher = None
+
+        # kind -> (原始名称表, 规范化名称表)，值为 [(id, name), ...]
+        self._tables: Dict[str, Tuple[Dict[str, list], Dict[str, list]]] = {
+            kind: ({}, {}) for kind in ENTITY_KINDS
+        }
+        # 去掉剂型后缀的药品名 -> {原始名称: [(id, name), ...]}
+        self._dosage_form_table: Dict[str, Dict[str, list]] = {}
+        self.counters = {
+            kind: {"lookups": 0, "exact_hits": 0, "normalized_hits": 0, "misses": 0}
+            for kind in ENTITY_KINDS
+        }
+        self.counters["drug"]["ambiguous"] = 0
+        self.counters["disease"].update({"hierarchy_hits": 0, "fuzzy_hits": 0, "related_hits": 0})
+        self.fuzzy_counters = {"lookups": 0, "hits": 0}
+
+    @classmethod
+    def from_config(cls, es: Elasticsearch, config: Dict[str, Any]):
+        """根据配置创建并启动后台加载，未启用时返回None"""
+        if not config.get('enabled', False):
+            return None
+        resolver = cls(
+            es,
+            refresh_interval=config.get('refresh_interval', 300.0),
+            page_size=config.get('page_size', 5000),
+            fuzzy=config.get('fuzzy', False),
+            disease_matching=config.get('disease_matching', False),
+            disease_related=config.get('disease_related', False)
+        )
+        resolver.start_background_refresh()
+        return resolver
+
+    @property
+    def fuzzy_ready(self) -> bool:
+        """本地模糊匹配是否可用"""
+        return self._fuzzy_index is not None
+
+    @staticmethod
+    def _normalize(kind: str, name: str) -> str:
+        if kind == "drug":
+            return normalize_name(name)
+        return normalize_disease_name(name)
+
+    def _source_fields(self, kind: str) -> List[str]:
+        if kind == "disease" and self.disease_matching:
+            return ['id', 'name', 'sub_diseases', 'related_diseases']
+        return ['id', 'name']
+
+    @staticmethod
+    def _add(table: Dict[str, list], key: str, entry: Tuple[str, str]):
+        bucket = table.setdefault(key, [])
+        if len(bucket) < MAX_IDS_PER_NAME:
+            bucket.append(entry)
+
+    def _build(self):
+        """导出药品与疾病名称并整体替换当前名称表"""
+        # 以下模块依赖本模块的规范化函数，在此处导入避免循环导入
+        from .ngram_index import NGramIndex
+        from .disease_matcher import DiseaseMatcher
+
+        fuzzy_index = NGramIndex() if self.fuzzy else None
+        disease_matcher = DiseaseMatcher(include_related=self.disease_related) if self.disease_matching else None
+        tables = {}
+        dosage_form_table: Dict[str, Dict[str, list]] = {}
+        for kind in ENTITY_KINDS:
+            exact: Dict[str, list] = {}
+            normalized: Dict[str, list] = {}
+            for hit in iter_index_docs(self.es, self.index_names[kind], source=self._source_fields(kind),
+                                       page_size=self.page_size):
+                source = hit['_source']
+                name = source.get('name')
+                if not name:
+                    continue
+                entry = (source.get('id') or hit['_id'], name)
+                self._add(exact, name, entry)
+                self._add(normalized, self._normalize(kind, name), entry)
+                if kind == "drug":
+                    products = dosage_form_table.setdefault(normalize_name(name, strip_dosage_form=True), {})
+                    self._add(products, name, entry)
+                if fuzzy_index is not None and kind == "drug":
+                    fuzzy_index.add(*entry)
+                if disease_matcher is not None and kind == "disease":
+                    disease_matcher.add(*entry, source.get('sub_diseases'), source.get('related_diseases'))
+            tables[kind] = (exact, normalized)
+            logger.info(f"{self.name}: {kind} 名称 {len(exact)} 个, 规范化名称 {len(normalized)} 个")
+        self._tables = tables
+        self._dosage_form_table = dosage_form_table
+        self._fuzzy_index = fuzzy_index
+        self._disease_matcher = disease_matcher
+        if fuzzy_index is not None:
+            logger.info(f"{self.name}: 药品n-gram索引 {fuzzy_index.stats()}")
+        if disease_matcher is not None:
+            logger.info(f"{self.name}: 疾病匹配表 {disease_matcher.stats()}")
+
+    def resolve(self, kind: str, name: str, unique: bool = False) -> Optional[List[Dict]]:
+        """在本地解析名称
+
+        Args:
+            kind: drug / disease
+            name: 输入名称
+            unique: 是否只返回唯一结果
+
+        药品名在原始/规范化名称都未命中时，再去掉剂型后缀查找（见 _resolve_dosage_form）；
+        疾病名在原始/规范化名称都未命中时，再按层级和模糊匹配（启用disease_matching时）。
+
+        Returns:
+            Optional[List[Dict]]: 与ES检索相同格式的匹配列表（层级/模糊匹配另含match_type）；
+                未加载、未命中或唯一模式下剂型有歧义时返回None
+        """
+        if not self.ready or not name:
+            return None
+        counters = self.counters[kind]
+        counters["lookups"] += 1
+        exact, normalized = self._tables[kind]
+        limit = 1 if unique else MAX_IDS_PER_NAME
+
+        entries = exact.get(name)
+        if entries:
+            counters["exact_hits"] += 1
+        else:
+            entries = normalized.get(self._normalize(kind, name))
+            if not entries and kind == "drug":
+                entries = self._resolve_dosage_form(name, unique)
+                if entries is None:
+                    counters["ambiguous"] += 1
+                    return None
+                if len({entity_name for _, entity_name in entries}) > 1:
+                    # 多个剂型产品全部返回
+                    counters["ambiguous"] += 1
+                    limit = len(entries)
+            if not entries:
+                matches = self._match_disease(name, unique) if kind == "disease" else []
+                if not matches:
+                    counters["misses"] += 1
+                    return None
+                counters[f"{matches[0]['match_type']}_hits"] += 1
+                return matches
+            counters["normalized_hits"] += 1
+
+        return [
+            {'id': entity_id, 'name': entity_name, '_score': LOCAL_MATCH_SCORE}
+            for entity_id, entity_name in entries[:limit]
+        ]
+
+    def _resolve_dosage_form(self, name: str, unique: bool) -> Optional[list]:
+        """去掉剂型后缀查找药品
+
+        Returns:
+            Optional[list]: 只有一个产品时为其条目；多个产品时非唯一模式为每个产品的首个条目，
+                唯一模式为None（不任取其一）；未命中时为空列表
+        """
+        products = self._dosage_form_table.get(normalize_name(name, strip_dosage_form=True))
+        if not products:
+            return []
+        if len(products) == 1:
+            return next(iter(products.values()))
+        if unique:
+            logger.info(f"药品'{name}'去掉剂型后对应多个产品 {list(products)}，交由ES检索")
+            return None
+        return [entries[0] for entries in products.values()]
+
+    def _match_disease(self, name: str, unique: bool) -> List[Dict]:
+        disease_matcher = self._disease_matcher
+        if disease_matcher is None:
+            return []
+        return disease_matcher.match(name, unique)
+
+    def fuzzy_resolve(self, name: str, unique: bool = False) -> Optional[List[Dict]]:
+        """在本地模糊匹配药品名称（验证规则与ES模糊查询路径相同）
+
+        Returns:
+            Optional[List[Dict]]: 匹配列表（可能为空）；n-gram索引不可用时返回None，调用方回退ES
+        """
+        fuzzy_index = self._fuzzy_index
+        if fuzzy_index is None or not name:
+            return None
+        self.fuzzy_counters["lookups"] += 1
+        matches = fuzzy_index.match(name, unique=unique)
+        if matches:
+            self.fuzzy_counters["hits"] += 1
+        return matches
+
+    def stats(self) -> Dict[str, Any]:
+        stats = super().stats()
+        for kind in ENTITY_KINDS:
+            counters = dict(self.counters[kind])
+            hits = sum(value for key, value in counters.items() if key.endswith("_hits"))
+            counters["hit_rate"] = hits / counters["lookups"] if counters["lookups"] else 0.0
+            counters["names"] = len(self._tables[kind][0])
+            stats[kind] = counters
+        if self._fuzzy_index is not None:
+            stats["fuzzy"] = {**self.fuzzy_counters, **self._fuzzy_index.stats()}
+        if self._disease_matcher is not None:
+            stats["disease_matcher"] = self._disease_matcher.stats()
+        return stats
@@ -0,0 +1,147 @@
+"""名称字符n-gram倒排索引
+
+用于在本地完成药品/疾病名称的模糊匹配（替代ES的 match + minimum_should_match 查询）：
+1. 对清理（药品名默认去剂型后缀）并规范化后的名称建立2/3-gram倒排表
+2. 查询时按n-gram重叠度（Dice系数）取top-k候选
+3. 对候选套用与ES路径相同的名称验证规则（子串、字符顺序、重叠度与长度比例），
+   候选名称的字符集合在建索引时预先计算
+
+相同名称只建一个条目（多个实体ID挂在同一条目下），控制内存占用。
+出现次数过多的n-gram（如"盐酸"）不参与候选召回，保证单次查询的开销有上界。
+"""
+
+import heapq
+from collections import Counter
+from typing import Callable, Dict, FrozenSet, Iterable, List, Sequence, Set, Tuple
+
+from .name_resolver import MAX_IDS_PER_NAME, normalize_name, strip_dosage_forms, names_similar
+
+
+class NGramIndex:
+    """名称n-gram倒排索引（构建完成后只读）"""
+
+    def __init__(self, ngram_sizes: Sequence[int] = (2, 3), max_postings: int = 5000,
+                 clean: Callable[[str], str] = strip_dosage_forms):
+        """初始化索引
+
+        Args:
+            ngram_sizes: 使用的n-gram长度
+            max_postings: 倒排列表长度超过该值的n-gram视为高频词，不参与召回
+            clean: 建索引与验证前的名称清理函数（默认去剂型后缀，疾病名传入疾病规范化函数）
+        """
+        self.ngram_sizes = tuple(ngram_sizes)
+        self.max_postings = max_postings
+        self.clean = clean
+
+        self._names: List[str] = []                 # 原始名称
+        self._ids: List[List[str]] = []             # 名称对应的实体ID
+        self._clean: List[str] = []                 # 清理后的名称（验证规则使用）
+        self._char_sets: List[FrozenSet[str]] = []  # 预先计算的字符集合
+        self._gram_counts: List[int] = []           # 名称的n-gram数（Dice系数分母）
+        self._postings: Dict[str, List[int]] = {}
+        self._positions: Dict[str, int] = {}        # 原始名称 -> 条目序号
+
+    def __len__(self) -> int:
+        return len(self._names)
+
+    def _grams(self, text: str) -> Set[str]:
+        """名称的n-gram集合，名称短于最小n时整体作为一个gram"""
+        grams = set()
+        for n in self.ngram_sizes:
+            grams.update(text[i:i + n] for i in range(len(text) - n + 1))
+        if not grams and text:
+            grams.add(text)
+        return grams
+
+    def add(self, entity_id: str, name: str):
+        """添加一个名称"""
+        position = self._positions.get(name)
+        if position is not None:
+            if len(self._ids[position]) < MAX_IDS_PER_NAME:
+                self._ids[position].append(entity_id)
+            return
+
+        position = len(self._names)
+        clean = self.clean(name)
+        grams = self._grams(normalize_name(clean))
+        self._positions[name] = position
+        self._names.append(name)
+        self._ids.append([entity_id])
+        self._clean.append(clean)
+        self._char_sets.append(frozenset(clean))
+        self._gram_counts.append(len(grams))
+        for gram in grams:
+            self._postings.setdefault(gram, []).append(position)
+
+    def candidates(self, name: str, k: int = 10) -> List[Tuple[int, float]]:
+        """按n-gram重叠度（Dice系数）返回top-k候选 [(条目序号, 得分), ...]"""
+        query_grams = self._grams(normalize_name(self.clean(name)))
+        usable = [gram for gram in query_grams if gram in self._postings]
+        if not usable:
+            return []
+        selective = [gram for gram in usable if len(self._postings[gram]) <= self.max_postings]
+        if not selective:
+            # 全部是高频gram时只用最稀有的一个，保证开销有上界
+            selective = [min(usable, key=lambda gram: len(self._postings[gram]))]
+
+        overlaps = Counter()
+        for gram in selective:
+            overlaps.update(self._postings[gram])
+
+        query_size = len(query_grams)
+        return heapq.nlargest(
+            k,
+            ((position, 2 * count / (query_size + self._gram_counts[position]))
+             for position, count in overlaps.items()),
+            key=lambda item: item[1]
+        )
+
+    def match(self, name: str, k: int = 10, unique: bool = False, min_score: float = 0.0) -> List[Dict]:
+        """模糊匹配名称
+
+        Args:
+            name: 查询名称
+            k: 参与验证的候选数（对应ES模糊查询的size）
+            unique: 是否只返回唯一结果
+            min_score: 候选的最低Dice系数
+
+        Returns:
+            List[Dict]: 与ES检索相同格式的匹配列表（_score为Dice系数）
+        """
+        clean = self.clean(name)
+        char_set = frozenset(clean)
+
+        results = []
+        for position, score in self.candidates(name, k):
+            if score < min_score:
+                continue
+            matched_name = self._names[position]
+            is_valid = (
+                name in matched_name or
+                matched_name in name or
+                names_similar(clean, char_set, self._clean[position], self._char_sets[position])
+            )
+            if not is_valid:
+                continue
+            for entity_id in self._ids[position]:
+                results.append({'id': entity_id, 'name': matched_name, '_score': score})
+            if unique:
+                break
+
+        return results[:1] if unique else results[:5]
+
+    def match_batch(self, names: Iterable[str], k: int = 10, unique: bool = False) -> List[List[Dict]]:
+        """批量模糊匹配（重复名称只计算一次）"""
+        cache: Dict[str, List[Dict]] = {}
+        results = []
+        for name in names:
+            if name not in cache:
+                cache[name] = self.match(name, k, unique)
+            results.append(cache[name])
+        return results
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "names": len(self._names),
+            "ngrams": len(self._postings)
+        }
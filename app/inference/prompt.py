@@ -2,6 +2,9 @@
 
 import json
 
+# 提示模板版本：修改任一模板时递增，使依赖模板输出的缓存结果失效
+PROMPT_VERSION = "2"
+
 def create_entity_recognition_prompt(input_data: dict) -> str:
     """Create a prompt for entity recognition
 
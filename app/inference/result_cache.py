@@ -0,0 +1,124 @@
+"""最终判定结果缓存
+
+缓存 ResultGenerator.generate 的输出，键为
+(药品ID, 规范化疾病名, 提示模板版本, drugs/diseases索引版本)。
+
+索引版本由各具体索引的 uuid 组成，索引重建（删除后重新创建、别名切换）
+后 uuid 改变，旧条目随之失效。为避免每个请求都访问ES，索引版本按
+version_check_interval 定期刷新。
+"""
+
+import copy
+import logging
+import threading
+import time
+from typing import Any, Dict, Optional, Sequence, Tuple
+
+from elasticsearch import Elasticsearch
+
+from app.shared.cache import LRUCache
+from app.shared.es_client import format_index_version, get_index_version
+from .name_resolver import normalize_name
+from .prompt import PROMPT_VERSION
+
+logger = logging.getLogger(__name__)
+
+CacheKey = Tuple[str, str, str, str]
+
+
+class ResultCache:
+    """最终判定结果缓存（线程安全）"""
+
+    def __init__(self, es: Elasticsearch, indices: Sequence[str] = ('drugs', 'diseases'),
+                 maxsize: int = 10000, ttl: Optional[float] = None,
+                 version_check_interval: float = 30.0):
+        """初始化结果缓存
+
+        Args:
+            es: Elasticsearch客户端，用于读取索引版本
+            indices: 决定缓存有效性的索引
+            maxsize: 最大条目数
+            ttl: 条目有效期（秒），None表示不过期
+            version_check_interval: 索引版本刷新间隔（秒）
+        """
+        self.es = es
+        self.indices = list(indices)
+        self.cache = LRUCache(maxsize=maxsize, ttl=ttl)
+        self.version_check_interval = version_check_interval
+        self.invalidations = 0
+        self._index_version: Optional[str] = None
+        self._checked_at = 0.0
+        self._version_lock = threading.Lock()
+
+    @classmethod
+    def from_config(cls, es, config: Dict[str, Any]) -> Optional["ResultCache"]:
+        """根据 inference.result_cache 配置创建，未启用时返回None"""
+        if not config.get('enabled', False):
+            return None
+        return cls(
+            es,
+            maxsize=config.get('maxsize', 10000),
+            ttl=config.get('ttl_seconds'),
+            version_check_interval=config.get('version_check_interval', 30.0)
+        )
+
+    def _version_due(self) -> bool:
+        return self._index_version is None or time.monotonic() - self._checked_at >= self.version_check_interval
+
+    def _apply_index_version(self, version: str):
+        """更新索引版本，版本变化时清空缓存"""
+        if self._index_version is not None and version != self._index_version:
+            logger.info(f"索引版本变化 ({self._index_version} -> {version})，清空结果缓存")
+            self.cache.clear()
+            self.invalidations += 1
+        self._index_version = version
+
+    def index_version(self) -> Optional[str]:
+        """当前索引版本，ES不可用且从未成功获取时返回None"""
+        if not self._version_due():
+            return self._index_version
+        with self._version_lock:
+            if self._version_due():
+                self._checked_at = time.monotonic()
+                try:
+                    self._apply_index_version(get_index_version(self.es, self.indices))
+                except Exception as e:
+                    logger.warning(f"获取索引版本失败: {str(e)}")
+        return self._index_version
+
+    def make_key(self, drug_id: str, disease_name: str, index_version: str) -> CacheKey:
+        return (drug_id, normalize_name(disease_name), PROMPT_VERSION, index_version)
+
+    def get(self, key: CacheKey) -> Optional[Dict[str, Any]]:
+        """读取缓存结果（返回副本）"""
+        result = self.cache.get(key)
+        return copy.deepcopy(result) if result is not None else None
+
+    def set(self, key: CacheKey, result: Dict[str, Any]):
+        """写入结果（保存副本，调用方后续修改不影响缓存）"""
+        self.cache.set(key, copy.deepcopy(result))
+
+    def stats(self) -> Dict[str, Any]:
+        stats = self.cache.stats()
+        stats["index_version"] = self._index_version
+        stats["invalidations"] = self.invalidations
+        return stats
+
+
+class AsyncResultCache(ResultCache):
+    """最终判定结果缓存（异步版，索引版本通过AsyncElasticsearch获取）"""
+
+    async def index_version(self) -> Optional[str]:
+        """当前索引版本，ES不可用且从未成功获取时返回None"""
+        if not self._version_due():
+            return self._index_version
+        # 先记录检查时间，避免并发请求同时刷新
+        self._checked_at = time.monotonic()
+        try:
+            index = ','.join(self.indices)
+            settings = await self.es.indices.get_settings(index=index, name='index.uuid')
+            mappings = await self.es.indices.get_mapping(index=index, filter_path='*.mappings._meta')
+            self._apply_index_version(format_index_version(settings, mappings))
+        except Exception as e:
+            logger.warning(f"获取索引版本失败: {str(e)}")
+        return self._index_version
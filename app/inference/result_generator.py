@@ -42,7 +42,8 @@ class ResultGenerator:
                     "disease_info": {
                         "id": case.recognized_entities.diseases[0].matches[0].id if (case.recognized_entities.diseases and case.recognized_entities.diseases[0].matches) else None,
                         "name": case.recognized_entities.diseases[0].name if case.recognized_entities.diseases else None,
-                        "standard_name": case.recognized_entities.diseases[0].matches[0].standard_name if (case.recognized_entities.diseases and case.recognized_entities.diseases[0].matches) else None
+                        "standard_name": case.recognized_entities.diseases[0].matches[0].standard_name if (case.recognized_entities.diseases and case.recognized_entities.diseases[0].matches) else None,
+                        "match_type": case.recognized_entities.diseases[0].matches[0].match_type if (case.recognized_entities.diseases and case.recognized_entities.diseases[0].matches) else None
                     },
                     "is_offlabel": synthesis_result["is_offlabel"],
                     "analysis_details": synthesis_result["analysis_details"],
@@ -177,7 +177,8 @@ class ResultSynthesizer:
             "sources": []
         }
         
-        # 添加规则分析的证据
+        # 添加规则分析的证据（规则匹配到的适应症作为默认值，LLM结果可覆盖）
+        evidence["matching_indication"] = rule_result.get("matched_indication", "")
         if rule_result.get("reasoning"):
             evidence["indication_match_reasoning"].extend(rule_result["reasoning"])
         if rule_result.get("evidence"):
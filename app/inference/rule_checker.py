@@ -1,12 +1,25 @@
 """规则分析模块"""
 
-from typing import Dict, List
+from typing import Dict, List, Tuple
+
+from .contraindication_scanner import ContraindicationScanner
+from .name_resolver import normalize_disease_name
 
 class RuleAnalyzer:
-    def __init__(self):
-        # 初始化同义词库、上下位概念库等
-        self.synonym_db = {}  # TODO: 这里应该连接到实际的同义词数据库
-        self.hierarchy_db = {}  # TODO: 这里应该连接到实际的疾病层级数据库
+    def __init__(self, indication_index=None, disease_relations=None, contraindication_scanner=None):
+        """
+        Args:
+            indication_index: 可选的IndicationIndex，精确匹配时优先查询，
+                并提供疾病的同义/祖先ID集合用于ID匹配
+            disease_relations: 可选的DiseaseRelations（编译的疾病同义/层级关系表）
+            contraindication_scanner: 禁忌症扫描器，默认新建（按药品缓存自动机）
+        """
+        self.indication_index = indication_index
+        self.disease_relations = disease_relations
+        self.contraindication_scanner = contraindication_scanner or ContraindicationScanner()
+        # 手工补充的同义词库、上下位概念库（小写名称 -> 名称列表），与编译的关系表合并使用
+        self.synonym_db = {}
+        self.hierarchy_db = {}
 
     def analyze(self, drug_info: Dict, disease_info: Dict) -> Dict:
         """
@@ -22,6 +35,10 @@ class RuleAnalyzer:
         result = {
             "is_offlabel": True,
             "confidence": 0.0,
+            "match_type": None,       # exact / synonym / hierarchy
+            "matched_indication": "",
+            "contraindicated": False,
+            "contraindication_mentions": [],  # 仅在病例描述中提及的禁忌症
             "reasoning": [],
             "evidence": []
         }
@@ -31,37 +48,89 @@ class RuleAnalyzer:
             result["reasoning"].append("输入数据不完整")
             return result
 
-        # 执行各种匹配
-        exact_match = self.exact_match(drug_info, disease_info)
-        synonym_match = self.synonym_match(drug_info, disease_info)
-        hierarchy_match = self.hierarchy_match(drug_info, disease_info)
+        # 按 精确 -> 同义 -> 上下位 的优先级匹配，每一级ID集合匹配或名称匹配任一命中即可
+        # （适应症可能只有部分解析出疾病ID，ID只命中上下位时名称仍可能精确匹配）
+        synonym_match = hierarchy_match = ""
+        id_match_type, id_matched = self.id_match(drug_info, disease_info)
+        exact_match = id_matched if id_match_type == "exact" else self.exact_match(drug_info, disease_info)
+        if not exact_match:
+            synonym_match = id_matched if id_match_type == "synonym" else self.synonym_match(drug_info, disease_info)
+        if not exact_match and not synonym_match:
+            hierarchy_match = (id_matched if id_match_type == "hierarchy"
+                               else self.hierarchy_match(drug_info, disease_info))
         contraindication_check = self.check_contraindications(drug_info, disease_info)
+        contraindication_mentions = [
+            c for c in self.check_contraindication_mentions(drug_info, disease_info)
+            if c not in contraindication_check
+        ]
 
         # 综合分析结果
         if exact_match:
             result["is_offlabel"] = False
             result["confidence"] = 1.0
+            result["match_type"] = "exact"
+            result["matched_indication"] = exact_match
             result["reasoning"].append("疾病名称与药品适应症精确匹配")
             result["evidence"].append(f"适应症: {exact_match}")
         elif synonym_match:
             result["is_offlabel"] = False
             result["confidence"] = 0.9
+            result["match_type"] = "synonym"
+            result["matched_indication"] = synonym_match
             result["reasoning"].append("疾病名称与药品适应症同义词匹配")
             result["evidence"].append(f"同义词匹配: {synonym_match}")
         elif hierarchy_match:
             result["is_offlabel"] = False
             result["confidence"] = 0.8
+            result["match_type"] = "hierarchy"
+            result["matched_indication"] = hierarchy_match
             result["reasoning"].append("疾病名称与药品适应症存在上下位关系")
             result["evidence"].append(f"层级关系: {hierarchy_match}")
 
         if contraindication_check:
             result["is_offlabel"] = True
+            result["contraindicated"] = True
             result["confidence"] = max(result["confidence"], 0.95)
             result["reasoning"].append("用药违反禁忌症规则")
             result["evidence"].extend(contraindication_check)
+        if contraindication_mentions:
+            result["contraindication_mentions"] = contraindication_mentions
+            result["reasoning"].append("病例描述中提及药品禁忌症")
+            result["evidence"].extend(f"描述提及禁忌症: {c}" for c in contraindication_mentions)
 
         return result
 
+    def id_match(self, drug_info: Dict, disease_info: Dict) -> Tuple[str, str]:
+        """疾病ID集合匹配
+        
+        drug_info["indication_ids"] 为适应症解析出的疾病ID（indication_disease_ids），
+        依次检查疾病ID本身、同义疾病ID、祖先疾病ID是否在其中，均为集合查找。
+        
+        Returns:
+            Tuple[str, str]: (匹配类型 exact/synonym/hierarchy, 匹配的适应症名称)；未匹配时为 ("", "")
+        """
+        disease_id = disease_info.get("id")
+        indication_ids = drug_info.get("indication_ids")
+        if not disease_id or not indication_ids:
+            return "", ""
+        if not isinstance(indication_ids, (set, frozenset)):
+            indication_ids = frozenset(indication_ids)
+        
+        if disease_id in indication_ids:
+            return "exact", disease_info.get("name", "")
+        if self.indication_index is None:
+            return "", ""
+        
+        for match_type, related_ids in (
+            ("synonym", self.indication_index.synonyms(disease_id)),
+            ("hierarchy", self.indication_index.ancestors(disease_id)),
+        ):
+            matched_ids = related_ids & indication_ids
+            if matched_ids:
+                matched_id = min(matched_ids)
+                return match_type, self.indication_index.disease_name(matched_id) or matched_id
+        return "", ""
+
     def exact_match(self, drug_info: Dict, disease_info: Dict) -> str:
         """精确匹配检查 - 严格的字符串匹配
         
@@ -73,6 +142,12 @@ class RuleAnalyzer:
         if not disease_name:
             return ""
         
+        # 优先查询内存适应症索引（O(1)集合查找）
+        if self.indication_index is not None and drug_info.get("id"):
+            matched = self.indication_index.match_indication(drug_info["id"], disease_name)
+            if matched:
+                return matched
+        
         disease_name_lower = disease_name.lower()
         indications = drug_info.get("indications", [])
         
@@ -105,10 +180,15 @@ class RuleAnalyzer:
         disease_name = disease_info.get("name", "")
         if not disease_name:
             return ""
-        disease_name = disease_name.lower()
-        disease_synonyms = self.synonym_db.get(disease_name, [])
+        disease_synonyms = set(self.synonym_db.get(disease_name.lower(), []))
+        # 与层级匹配一致：关系表按规范化名称分组，适应症规范化后与同义组的键比较
+        synonym_key = self.disease_relations.synonym_key(disease_name) if self.disease_relations is not None else None
+        if not disease_synonyms and synonym_key is None:
+            return ""
         for indication in drug_info.get("indications", []):
-            if indication.lower() in disease_synonyms:
+            if not indication:
+                continue
+            if indication.lower() in disease_synonyms or normalize_disease_name(indication) == synonym_key:
                 return indication
         return ""
 
@@ -117,21 +197,26 @@ class RuleAnalyzer:
         disease_name = disease_info.get("name", "")
         if not disease_name:
             return ""
-        disease_name = disease_name.lower()
-        disease_hierarchy = self.hierarchy_db.get(disease_name, [])
+        disease_hierarchy = set(self.hierarchy_db.get(disease_name.lower(), []))
+        # 关系表中的祖先为规范化名称，适应症规范化后比较
+        ancestors = self.disease_relations.ancestors(disease_name) if self.disease_relations is not None else frozenset()
+        if not disease_hierarchy and not ancestors:
+            return ""
         for indication in drug_info.get("indications", []):
-            if indication.lower() in disease_hierarchy:
+            if not indication:
+                continue
+            if indication.lower() in disease_hierarchy or normalize_disease_name(indication) in ancestors:
                 return indication
         return ""
 
     def check_contraindications(self, drug_info: Dict, disease_info: Dict) -> List[str]:
-        """禁忌症检查"""
-        contraindications = []
-        disease_name = disease_info.get("name", "")
-        if not disease_name:
-            return contraindications
-        disease_name = disease_name.lower()
-        for contraindication in drug_info.get("contraindications", []):
-            if contraindication.lower() in disease_name:
-                contraindications.append(contraindication)
-        return contraindications
+        """禁忌症检查：诊断名称中出现的禁忌症"""
+        return self.contraindication_scanner.scan(
+            drug_info.get("id"), drug_info.get("contraindications") or [], disease_info.get("name", "")
+        )
+
+    def check_contraindication_mentions(self, drug_info: Dict, disease_info: Dict) -> List[str]:
+        """病例描述中出现的禁忌症（合并症、既往史等），与诊断共用同一个自动机"""
+        return self.contraindication_scanner.scan(
+            drug_info.get("id"), drug_info.get("contraindications") or [], disease_info.get("description", "")
+        )
@@ -33,7 +33,8 @@
 6. **disease_indexer.py** - ES索引管理
    - DiseaseIndexer类：疾病索引操作
    - 批次聚合 → 去重统计 → ES索引
-   - 建立药品-疾病关联
+   - 建立药品-疾病关联（indications_list -> indication_disease_ids）
+   - 编译疾病同义/层级关系表（disease_relations.bin）
 
 ## 命名规范
 
@@ -61,6 +62,12 @@ python -m app.pipeline.disease_extraction --concurrency 20 --resume
 
 # 构建疾病索引（聚合并导入ES）
 python -m app.pipeline.disease_indexer --rebuild
+
+# 只重新关联药品适应症与疾病ID（疾病索引未变、药品数据更新后）
+python -m app.pipeline.disease_indexer --link-only
+
+# 只重新编译疾病同义/层级关系表（规则分析使用）
+python -m app.pipeline.disease_indexer --relations-only
 ```
 
 ## 数据流转
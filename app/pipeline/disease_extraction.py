@@ -20,7 +20,12 @@ import httpx
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from elasticsearch import Elasticsearch
-from app.shared import get_es_client, setup_logging, Config
+from app.shared import (
+    get_es_client, setup_logging, Config, get_async_llm_http_client, llm_transport_stats, close_llm_http_clients,
+    LLMRateLimiter, get_llm_rate_limiter
+)
+from app.shared.rate_limiter import estimate_tokens
+from app.shared.llm_client import get_llm_base_url, get_llm_api_key
 
 Config.load_env()
 logger = setup_logging("disease_extraction", log_dir="data/cache/logs")
@@ -41,11 +46,11 @@ class AsyncDiseaseExtractionSearchAfter:
         self.state_file = Path(state_file)
         self.model = "deepseek-chat"
         
-        self.api_key = os.getenv("DEEPSEEK_API_KEY")
+        self.api_key = get_llm_api_key()
         if not self.api_key:
             raise ValueError("未配置 DEEPSEEK_API_KEY")
         
-        self.api_base_url = "https://api.deepseek.com/v1/chat/completions"
+        self.api_base_url = f"{get_llm_base_url()}/v1/chat/completions"
         
         self.output_dir.mkdir(parents=True, exist_ok=True)
         self.state_file.parent.mkdir(parents=True, exist_ok=True)
@@ -53,7 +58,9 @@ class AsyncDiseaseExtractionSearchAfter:
         self.es = get_es_client()
         self.drugs_index = 'drugs'
         self.state = self._load_state()
-        self.semaphore = asyncio.Semaphore(concurrency)
+        # 与推理引擎共用进程级限流器，--concurrency 作为并发窗口上限
+        self.rate_limiter = get_llm_rate_limiter() or LLMRateLimiter(initial_concurrency=concurrency)
+        self.rate_limiter.cap_concurrency(concurrency)
     
     def _load_state(self) -> Dict[str, Any]:
         if self.state_file.exists():
@@ -147,10 +154,9 @@ class AsyncDiseaseExtractionSearchAfter:
         drug_name: str,
         retry_count: int = 3
     ) -> Optional[Dict[str, Any]]:
-        async with self.semaphore:
-            for attempt in range(retry_count):
-                try:
-                    prompt = f"""请从以下适应症文本中提取疾病信息。
+        for attempt in range(retry_count):
+            try:
+                prompt = f"""请从以下适应症文本中提取疾病信息。
 
 适应症文本: {indication_text}
 
@@ -166,61 +172,69 @@ class AsyncDiseaseExtractionSearchAfter:
     }}
   ]
 }}"""
-                    
+                
+                messages = [
+                    {"role": "system", "content": "你是医学文本分析专家。只返回JSON，不要解释。"},
+                    {"role": "user", "content": prompt}
+                ]
+                async with self.rate_limiter.limit_async(estimate_tokens(messages)) as permit:
                     response = await client.post(
                         self.api_base_url,
+                        headers={"Authorization": f"Bearer {self.api_key}"},
                         json={
                             "model": self.model,
-                            "messages": [
-                                {"role": "system", "content": "你是医学文本分析专家。只返回JSON，不要解释。"},
-                                {"role": "user", "content": prompt}
-                            ],
+                            "messages": messages,
                             "temperature": 0.3,
                             "max_tokens": 1500
                         }
                     )
-                    
                     if response.status_code == 429:
-                        wait_time = 2 ** attempt
-                        await asyncio.sleep(wait_time)
-                        continue
-                    
-                    response.raise_for_status()
-                    data = response.json()
-                    content = data['choices'][0]['message']['content']
-                    
-                    # 解析JSON
-                    json_str = content
-                    if "```json" in content:
-                        start = content.find("```json") + 7
-                        end = content.find("```", start)
-                        json_str = content[start:end].strip()
-                    elif "```" in content:
-                        start = content.find("```") + 3
-                        end = content.find("```", start)
-                        json_str = content[start:end].strip()
-                    
-                    json_str = ''.join(c for c in json_str if c >= ' ' or c in ['\n', '\r', '\t'])
-                    result = json.loads(json_str)
-                    
-                    return {
-                        'id': self._generate_stable_id(indication_text),
-                        'drug_id': drug_id,
-                        'drug_name': drug_name,
-                        'indication_text': indication_text,
-                        'diseases': result.get('diseases', []),
-                        'extraction_time': datetime.now().isoformat(),
-                        'confidence': 0.95
-                    }
-                    
-                except Exception as e:
-                    if attempt < retry_count - 1:
-                        await asyncio.sleep(2)
-                        continue
-                    return None
-            
-            return None
-    
+                        # 限流器收缩并发窗口；按Retry-After（缺省指数退避）等待后重试
+                        permit.mark_throttled()
+                    else:
+                        response.raise_for_status()
+                        data = response.json()
+                        permit.record_usage(data.get('usage', {}).get('total_tokens'))
+                
+                if response.status_code == 429:
+                    wait_time = float(response.headers.get('Retry-After') or 2 ** attempt)
+                    await asyncio.sleep(wait_time)
+                    continue
+                
+                content = data['choices'][0]['message']['content']
+                
+                # 解析JSON
+                json_str = content
+                if "```json" in content:
+                    start = content.find("```json") + 7
+                    end = content.find("```", start)
+                    json_str = content[start:end].strip()
+                elif "```" in content:
+                    start = content.find("```") + 3
+                    end = content.find("```", start)
+                    json_str = content[start:end].strip()
+                
+                json_str = ''.join(c for c in json_str if c >= ' ' or c in ['\n', '\r', '\t'])
+                result = json.loads(json_str)
+                
+                return {
+                    'id': self._generate_stable_id(indication_text),
+                    'drug_id': drug_id,
+                    'drug_name': drug_name,
+                    'indication_text': indication_text,
+                    'diseases': result.get('diseases', []),
+                    'extraction_time': datetime.now().isoformat(),
+                    'confidence': 0.95
+                }
+                
+            except Exception as e:
+                if attempt < retry_count - 1:
+                    await asyncio.sleep(2)
+                    continue
+                return None
+        
+        return None
+
     async def process_batch_async(self, batch_drugs: List[Dict], batch_number: int) -> Dict[str, Any]:
         batch_results = {
             'batch_number': batch_number,
@@ -241,38 +255,26 @@ class AsyncDiseaseExtractionSearchAfter:
                 if indication and indication.strip():
                     tasks.append((indication, drug['id'], drug['name']))
         
-        timeout = httpx.Timeout(60.0, connect=15.0, read=60.0, write=10.0)
-        limits = httpx.Limits(
-            max_keepalive_connections=self.concurrency,
-            max_connections=self.concurrency * 2
-        )
+        # 各批次共用同一个keep-alive连接池（连接数上限见 inference.llm.transport.max_connections）
+        client = get_async_llm_http_client()
+        extraction_tasks = [
+            self.extract_single_indication_async(client, ind, did, dname)
+            for ind, did, dname in tasks
+        ]
         
-        async with httpx.AsyncClient(
-            headers={
-                "Authorization": f"Bearer {self.api_key}",
-                "Content-Type": "application/json"
-            },
-            timeout=timeout,
-            limits=limits
-        ) as client:
-            extraction_tasks = [
-                self.extract_single_indication_async(client, ind, did, dname)
-                for ind, did, dname in tasks
-            ]
+        for coro in tqdm.as_completed(
+            extraction_tasks,
+            desc=f"批次 {batch_number}",
+            total=len(extraction_tasks),
+            leave=False
+        ):
+            result = await coro
             
-            for coro in tqdm.as_completed(
-                extraction_tasks,
-                desc=f"批次 {batch_number}",
-                total=len(extraction_tasks),
-                leave=False
-            ):
-                result = await coro
-                
-                if result:
-                    batch_results['extractions'].append(result)
-                    batch_results['success_count'] += 1
-                else:
-                    batch_results['failure_count'] += 1
+            if result:
+                batch_results['extractions'].append(result)
+                batch_results['success_count'] += 1
+            else:
+                batch_results['failure_count'] += 1
         
         for drug in batch_drugs:
             self.state['processed_drug_ids'].add(drug['id'])
@@ -369,6 +371,10 @@ class AsyncDiseaseExtractionSearchAfter:
             logger.error(f"错误: {str(e)}")
             self._save_state()
             raise
+        finally:
+            logger.info(f"LLM连接池: {llm_transport_stats()['async']}")
+            logger.info(f"LLM限流: {self.rate_limiter.stats()}")
+            await close_llm_http_clients()
         
         logger.info("任务完成!")
     
@@ -4,10 +4,14 @@ import json
 from pathlib import Path
 from typing import List, Dict, Any
 from collections import defaultdict
-from app.shared import get_es_client, setup_logging
+from app.shared import get_es_client, iter_index_docs, mark_index_updated, setup_logging
+from app.inference.name_resolver import normalize_disease_name
+from app.inference.disease_relations import compile_disease_relations, write_disease_relations
 
 logger = setup_logging("disease_indexer")
 
+DEFAULT_RELATIONS_PATH = "data/processed/diseases/disease_relations.bin"
+
 
 class DiseaseIndexer:
     """疾病索引管理"""
@@ -15,6 +19,7 @@ class DiseaseIndexer:
     def __init__(self):
         self.es = get_es_client()
         self.diseases_index = 'diseases'
+        self.drugs_index = 'drugs'
         logger.info("DiseaseIndexer初始化完成")
     
     def create_index(self, delete_if_exists: bool = False):
@@ -188,6 +193,92 @@ class DiseaseIndexer:
         
         logger.info(f"✅ 索引完成: 成功 {success}, 失败 {failed}")
         
+        # 未重建索引时为原地更新，需更新内容版本通知推理服务重新加载
+        self.es.indices.refresh(index=self.diseases_index)
+        mark_index_updated(self.es, self.diseases_index)
+        
+        return success, failed
+    
+    def build_relations(self, diseases: Dict[str, Dict], output_path: str = DEFAULT_RELATIONS_PATH) -> str:
+        """编译疾病同义/层级关系表（规则分析使用）
+        
+        Args:
+            diseases: load_diseases_from_batches 的聚合结果
+            output_path: 关系表输出路径
+            
+        Returns:
+            str: 关系表版本
+        """
+        compiled = compile_disease_relations(diseases.values())
+        version = write_disease_relations(output_path, compiled)
+        links = sum(len(ancestors) for ancestors in compiled["ancestors"])
+        logger.info(f"✅ 疾病关系表: {output_path} (版本 {version}, "
+                    f"{len(compiled['keys'])} 个疾病, {links} 条祖先关系)")
+        return version
+    
+    def load_disease_ids(self) -> Dict[str, List[str]]:
+        """导出疾病索引，返回 规范化名称 -> 疾病ID列表"""
+        disease_ids = defaultdict(list)
+        for hit in iter_index_docs(self.es, self.diseases_index, source=['id', 'name']):
+            name = hit['_source'].get('name')
+            if name:
+                disease_ids[normalize_disease_name(name)].append(hit['_source'].get('id') or hit['_id'])
+        return disease_ids
+    
+    def link_drug_indications(self, batch_size: int = 500):
+        """将药品的indications_list解析为疾病ID，写入药品文档的indication_disease_ids字段
+        
+        适应症名称按规范化名称对应到diseases索引中的疾病，
+        推理阶段的规则匹配据此使用ID集合查找。
+        
+        Args:
+            batch_size: 批量更新大小
+            
+        Returns:
+            Tuple[int, int]: (成功, 失败) 更新数
+        """
+        from elasticsearch.helpers import bulk
+        
+        self.es.indices.put_mapping(
+            index=self.drugs_index,
+            body={"properties": {"indication_disease_ids": {"type": "keyword"}}}
+        )
+        disease_ids = self.load_disease_ids()
+        logger.info(f"疾病名称表: {len(disease_ids)} 个规范化名称")
+        
+        stats = {"drugs": 0, "indications": 0, "resolved": 0}
+        
+        def actions():
+            for hit in iter_index_docs(
+                self.es, self.drugs_index,
+                query={"exists": {"field": "indications_list"}},
+                source=['indications_list']
+            ):
+                ids = []
+                for indication in hit['_source'].get('indications_list') or []:
+                    stats["indications"] += 1
+                    matched = disease_ids.get(normalize_disease_name(indication or ''))
+                    if matched:
+                        stats["resolved"] += 1
+                        ids.extend(i for i in matched if i not in ids)
+                stats["drugs"] += 1
+                yield {
+                    '_op_type': 'update',
+                    '_index': self.drugs_index,
+                    '_id': hit['_id'],
+                    'doc': {'indication_disease_ids': ids}
+                }
+        
+        logger.info("开始关联药品适应症与疾病ID...")
+        success, failed = bulk(self.es, actions(), chunk_size=batch_size, raise_on_error=False)
+        
+        # 原地更新不改变索引uuid：刷新后写入新的内容版本，推理服务据此重新加载适应症索引并清空结果缓存
+        self.es.indices.refresh(index=self.drugs_index)
+        content_version = mark_index_updated(self.es, self.drugs_index)
+        rate = stats["resolved"] / stats["indications"] if stats["indications"] else 0.0
+        logger.info(f"✅ 关联完成: 药品 {stats['drugs']}, 适应症 {stats['indications']}, "
+                    f"解析为疾病ID {stats['resolved']} ({rate:.1%}), 更新成功 {success}, 失败 {failed}, "
+                    f"内容版本 {content_version}")
         return success, failed
     
     def run(
@@ -214,11 +305,16 @@ class DiseaseIndexer:
         
         # 3. 索引到ES
         success, failed = self.index_diseases(diseases)
+        self.build_relations(diseases)
         
         # 4. 验证
+        self.es.indices.refresh(index=self.diseases_index)
         count = self.es.count(index=self.diseases_index)
         logger.info(f"✅ ES中疾病总数: {count['count']}")
         
+        # 5. 药品适应症关联疾病ID
+        self.link_drug_indications()
+        
         logger.info("=" * 50)
         logger.info("流程完成！")
         logger.info("=" * 50)
@@ -231,11 +327,19 @@ def main():
     parser = argparse.ArgumentParser(description='疾病索引构建')
     parser.add_argument('--rebuild', action='store_true', help='重建索引')
     parser.add_argument('--batches-dir', default='data/processed/diseases/diseases_search_after', help='批次目录')
+    parser.add_argument('--link-only', action='store_true', help='只重新关联药品适应症与疾病ID')
+    parser.add_argument('--relations-only', action='store_true', help='只重新编译疾病同义/层级关系表')
+    parser.add_argument('--relations-path', default=DEFAULT_RELATIONS_PATH, help='关系表输出路径')
     
     args = parser.parse_args()
     
     indexer = DiseaseIndexer()
-    indexer.run(batches_dir=args.batches_dir, rebuild=args.rebuild)
+    if args.link_only:
+        indexer.link_drug_indications()
+    elif args.relations_only:
+        indexer.build_relations(indexer.load_diseases_from_batches(args.batches_dir), args.relations_path)
+    else:
+        indexer.run(batches_dir=args.batches_dir, rebuild=args.rebuild)
 
 
 if __name__ == '__main__':
@@ -77,6 +77,9 @@ DRUG_INDEX_MAPPING = {
             "indications_list": {
                 "type": "keyword"
             },
+            "indication_disease_ids": {
+                "type": "keyword"
+            },
             "contraindications": {
                 "type": "text",
                 "analyzer": "drug_analyzer"
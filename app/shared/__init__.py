@@ -1,10 +1,33 @@
 """共享工具模块"""
 
-from .es_client import get_es_client
+from .es_client import (
+    get_es_client, get_async_es_client, format_index_version, get_index_version, mark_index_updated,
+    iter_index_docs
+)
+from .llm_client import (
+    get_llm_client, get_async_llm_client, create_chat_completion, create_chat_completion_async,
+    stream_chat_completion_async
+)
+from .llm_cache import LLMResponseCache, get_llm_cache
+from .llm_transport import (
+    get_llm_http_client, get_async_llm_http_client, llm_transport_stats, close_llm_http_clients
+)
+from .rate_limiter import LLMRateLimiter, get_llm_rate_limiter
+from .circuit_breaker import CircuitBreaker, get_llm_circuit_breaker
+from .hedging import LLMHedger, get_llm_hedger
+from .llm_simulator import LLMSimulator
 from .config import Config
 from .logging_utils import setup_logging
 
 # 便捷函数
 load_env = Config.load_env
 
-__all__ = ['get_es_client', 'Config', 'setup_logging', 'load_env']
+__all__ = ['get_es_client', 'get_async_es_client', 'format_index_version', 'get_index_version',
+           'mark_index_updated', 'iter_index_docs',
+           'get_llm_client', 'get_async_llm_client',
+           'create_chat_completion', 'create_chat_completion_async', 'stream_chat_completion_async',
+           'LLMResponseCache', 'get_llm_cache',
+           'get_llm_http_client', 'get_async_llm_http_client', 'llm_transport_stats', 'close_llm_http_clients',
+           'LLMRateLimiter', 'get_llm_rate_limiter', 'CircuitBreaker', 'get_llm_circuit_breaker',
+           'LLMHedger', 'get_llm_hedger', 'LLMSimulator',
+           'Config', 'setup_logging', 'load_env']
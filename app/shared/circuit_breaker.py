@@ -0,0 +1,126 @@
+"""LLM调用熔断
+
+最近 window 次调用中失败率达到 error_rate（且调用数不少于 min_calls）时熔断：
+open_seconds 内不再调用LLM（推理器直接返回规则结论并标记降级），
+之后放行一次探测调用（half_open），成功则恢复，失败则继续熔断。
+
+配置见 config.yaml 的 inference.llm.circuit_breaker。
+"""
+
+import collections
+import logging
+import threading
+import time
+from typing import Any, Dict, Optional
+
+from .config import Config
+
+logger = logging.getLogger(__name__)
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class CircuitBreaker:
+    """滑动窗口失败率熔断器（线程安全）"""
+
+    def __init__(self, window: int = 20, min_calls: int = 10, error_rate: float = 0.5,
+                 open_seconds: float = 30.0):
+        self.window = window
+        self.min_calls = min_calls
+        self.error_rate = error_rate
+        self.open_seconds = open_seconds
+
+        self.state = CLOSED
+        self._results = collections.deque(maxlen=window)
+        self._opened_at = 0.0
+        self._probe_started: Optional[float] = None
+        self._lock = threading.Lock()
+
+        self.rejected = 0
+        self.trips = 0
+
+    @classmethod
+    def from_config(cls, config: Dict[str, Any]) -> "CircuitBreaker":
+        """根据 inference.llm.circuit_breaker 配置创建"""
+        return cls(
+            window=config.get('window', 20),
+            min_calls=config.get('min_calls', 10),
+            error_rate=config.get('error_rate', 0.5),
+            open_seconds=config.get('open_seconds', 30.0)
+        )
+
+    def allow(self) -> bool:
+        """是否允许发起调用；允许后须调用 record_success / record_failure"""
+        with self._lock:
+            now = time.monotonic()
+            if self.state == OPEN and now - self._opened_at >= self.open_seconds:
+                self.state = HALF_OPEN
+                self._probe_started = None
+            if self.state == HALF_OPEN:
+                # 只放行一个探测调用；探测调用未回报结果（如被取消）超过open_seconds后再放行一个
+                if self._probe_started is None or now - self._probe_started >= self.open_seconds:
+                    self._probe_started = now
+                    return True
+            elif self.state == CLOSED:
+                return True
+            self.rejected += 1
+            return False
+
+    def record_success(self):
+        with self._lock:
+            if self.state == HALF_OPEN:
+                logger.info("LLM熔断恢复")
+                self.state = CLOSED
+                self._results.clear()
+            self._results.append(True)
+
+    def record_failure(self):
+        with self._lock:
+            if self.state == HALF_OPEN:
+                self._trip()
+                return
+            self._results.append(False)
+            failures = self._results.count(False)
+            if (self.state == CLOSED and len(self._results) >= self.min_calls
+                    and failures / len(self._results) >= self.error_rate):
+                self._trip()
+
+    def _trip(self):
+        self.state = OPEN
+        self._opened_at = time.monotonic()
+        self.trips += 1
+        logger.warning(f"LLM调用失败率过高，熔断{self.open_seconds}秒")
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            calls = len(self._results)
+            failures = self._results.count(False)
+            return {
+                "state": self.state,
+                "recent_calls": calls,
+                "recent_error_rate": failures / calls if calls else 0.0,
+                "trips": self.trips,
+                "rejected": self.rejected
+            }
+
+
+_circuit_breaker: Optional[CircuitBreaker] = None
+_circuit_breaker_lock = threading.Lock()
+
+
+def get_llm_circuit_breaker() -> Optional[CircuitBreaker]:
+    """获取进程内共享的LLM熔断器
+
+    根据config.yaml中的 inference.llm.circuit_breaker 创建，未启用时返回None。
+    """
+    global _circuit_breaker
+    if _circuit_breaker is None:
+        with _circuit_breaker_lock:
+            if _circuit_breaker is None:
+                breaker_config = Config.get_inference_config().get('llm', {}).get('circuit_breaker', {})
+                if not breaker_config.get('enabled', False):
+                    return None
+                _circuit_breaker = CircuitBreaker.from_config(breaker_config)
+    return _circuit_breaker
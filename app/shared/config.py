@@ -19,6 +19,10 @@ class Config:
             'DEEPSEEK_API_KEY',
             'ELASTIC_PASSWORD',
         ]
+        # 模拟LLM后端不需要API Key
+        if Path("config.yaml").exists() and \
+                Config.get_inference_config().get('llm', {}).get('backend') == 'simulator':
+            required_vars.remove('DEEPSEEK_API_KEY')
         
         missing_vars = [var for var in required_vars if not os.getenv(var)]
         if missing_vars:
@@ -70,13 +74,51 @@ class Config:
         config = Config.load_yaml(config_path)
         return config.get('inference', {
             'skip_entity_recognition': False,
+            'llm_policy': 'always',
             'enable_clinical_guidelines': False,
             'enable_expert_consensus': False,
             'enable_research_papers': False,
+            'batch': {
+                'max_concurrency': 1
+            },
+            'jobs': {
+                'enabled': False
+            },
+            'singleflight': {
+                'enabled': False
+            },
+            'deadline': {
+                'default_ms': None
+            },
+            'result_cache': {
+                'enabled': False
+            },
+            'indication_index': {
+                'enabled': False
+            },
+            'name_resolver': {
+                'enabled': False
+            },
+            'entity_dictionary': {
+                'enabled': False
+            },
+            'disease_relations': {
+                'enabled': False
+            },
             'llm': {
+                'backend': 'deepseek',
                 'model': 'deepseek-chat',
                 'temperature': 0.1,
-                'max_tokens': 2000
+                'max_tokens': 2000,
+                'rate_limit': {
+                    'enabled': False
+                },
+                'circuit_breaker': {
+                    'enabled': False
+                },
+                'hedging': {
+                    'enabled': False
+                }
             },
             'evaluation': {
                 'sample_size_yes': 50,
@@ -1,7 +1,9 @@
 """Elasticsearch客户端管理"""
 
 import os
-from elasticsearch import Elasticsearch
+import time
+from typing import Any, Dict, Iterator, List, Optional, Sequence
+from elasticsearch import Elasticsearch, AsyncElasticsearch
 from dotenv import load_dotenv
 
 
@@ -29,3 +31,128 @@ def get_es_client() -> Elasticsearch:
         )
     except Exception as e:
         raise Exception(f"Failed to connect to Elasticsearch: {str(e)}")
+
+
+
+def get_async_es_client() -> AsyncElasticsearch:
+    """获取异步 Elasticsearch 客户端实例（需要安装aiohttp）
+    
+    Returns:
+        AsyncElasticsearch: 异步ES客户端实例
+        
+    Raises:
+        Exception: 创建客户端失败时抛出异常
+    """
+    load_dotenv()
+    
+    try:
+        return AsyncElasticsearch(
+            hosts=[os.getenv('ES_HOST', 'http://localhost:9200')],
+            basic_auth=(
+                os.getenv('ELASTIC_USERNAME', 'elastic'),
+                os.getenv('ELASTIC_PASSWORD', 'elastic')
+            ),
+            request_timeout=30,
+            retry_on_timeout=True,
+            max_retries=3
+        )
+    except Exception as e:
+        raise Exception(f"Failed to connect to Elasticsearch: {str(e)}")
+
+
+# 写入映射 _meta 的内容版本键：原地更新文档（如 --link-only 关联疾病ID）后由 mark_index_updated 更新
+CONTENT_VERSION_META = 'content_version'
+
+
+def format_index_version(settings, mappings=None) -> str:
+    """由 indices.get_settings(name='index.uuid') 与 indices.get_mapping 的响应生成索引版本戳
+
+    版本戳由各具体索引的 名称:uuid[:内容版本] 组成，索引重建、别名切换
+    或原地更新后（mark_index_updated）随之改变。
+    """
+    parts = []
+    for name in sorted(settings):
+        part = f"{name}:{settings[name]['settings']['index']['uuid']}"
+        mapping = mappings[name] if mappings is not None and name in mappings else {}
+        meta = mapping.get('mappings', {}).get('_meta') or {}
+        if meta.get(CONTENT_VERSION_META):
+            part += f":{meta[CONTENT_VERSION_META]}"
+        parts.append(part)
+    return '|'.join(parts)
+
+
+def get_index_version(es: Elasticsearch, indices: Sequence[str]) -> str:
+    """获取若干索引的当前版本戳"""
+    index = ','.join(indices)
+    return format_index_version(
+        es.indices.get_settings(index=index, name='index.uuid'),
+        es.indices.get_mapping(index=index, filter_path='*.mappings._meta')
+    )
+
+
+def mark_index_updated(es: Elasticsearch, index: str) -> str:
+    """原地更新索引文档后写入新的内容版本，使版本戳变化
+
+    推理服务据此重新加载内存索引（IndicationIndex、名称解析等）并清空结果缓存；
+    只替换 _meta 中的内容版本，保留其它 _meta 字段。
+
+    Returns:
+        str: 新的内容版本
+    """
+    content_version = str(time.time_ns())
+    mappings = es.indices.get_mapping(index=index)
+    for name in mappings:
+        meta = dict(mappings[name].get('mappings', {}).get('_meta') or {})
+        meta[CONTENT_VERSION_META] = content_version
+        es.indices.put_mapping(index=name, body={"_meta": meta})
+    return content_version
+
+
+def iter_index_docs(
+    es: Elasticsearch,
+    index: str,
+    query: Optional[Dict[str, Any]] = None,
+    source: Optional[List[str]] = None,
+    page_size: int = 1000,
+    keep_alive: str = "2m"
+) -> Iterator[Dict[str, Any]]:
+    """使用 PIT + search_after 导出索引中的全部文档（无10000条限制，结果为一致快照）
+
+    Args:
+        es: ES客户端
+        index: 索引名
+        query: 过滤查询，None表示全部文档
+        source: 需要返回的_source字段
+        page_size: 每页条数
+        keep_alive: PIT保持时间
+
+    Yields:
+        Dict: 命中文档（含_id和_source）
+    """
+    pit_id = es.open_point_in_time(index=index, keep_alive=keep_alive)['id']
+    try:
+        search_after = None
+        while True:
+            params = {
+                "pit": {"id": pit_id, "keep_alive": keep_alive},
+                "sort": [{"_shard_doc": "asc"}],
+                "size": page_size,
+                "query": query or {"match_all": {}},
+                "track_total_hits": False
+            }
+            if source is not None:
+                params["source"] = source
+            if search_after is not None:
+                params["search_after"] = search_after
+            result = es.search(**params)
+            pit_id = result.get('pit_id', pit_id)
+            hits = result['hits']['hits']
+            if not hits:
+                break
+            yield from hits
+            search_after = hits[-1]['sort']
+    finally:
+        try:
+            es.close_point_in_time(id=pit_id)
+        except Exception:
+            pass
@@ -0,0 +1,229 @@
+"""LLM请求对冲（hedged requests）
+
+首个请求超过近期延迟的某个分位数（如p95）仍未返回时，再发出一个相同的请求，
+先返回者胜出，另一个被取消，以此削减偶发的长尾延迟（服务端个别请求卡住20~30秒）。
+
+- 延迟分布按 模型+max_tokens 分别统计（实体识别与适应症推理的响应长度差异很大）
+- 样本数不足 min_samples 时不对冲；触发延迟不低于 min_delay
+- 最近请求（至多 window 个，不足 min_samples 时按 min_samples 计）中对冲的比例（含进行中的对冲）
+  不超过 max_hedge_rate，控制额外调用费用；刚开始对冲时不会把整个窗口的额度集中用掉
+- 延迟样本记录调用方实际等待的时间（对冲胜出时也从首个请求发出时算起），触发延迟反映真实长尾
+- 调用方可在下游已拥塞时（如限流器有排队者）跳过对冲，此时对冲请求只会排在后面
+
+只用于异步的非流式调用：流式调用已向客户端推送片段，同步调用无法取消落后的请求。
+配置见 config.yaml 的 inference.llm.hedging。
+"""
+
+import asyncio
+import collections
+import logging
+import threading
+import time
+from typing import Any, Awaitable, Callable, Deque, Dict, Hashable, Optional, TypeVar
+
+from .config import Config
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+
+class LatencyTracker:
+    """最近若干次请求的延迟分布"""
+
+    def __init__(self, window: int = 200):
+        self._samples: Deque[float] = collections.deque(maxlen=window)
+
+    def record(self, seconds: float):
+        self._samples.append(seconds)
+
+    def __len__(self) -> int:
+        return len(self._samples)
+
+    def percentile(self, p: float) -> Optional[float]:
+        if not self._samples:
+            return None
+        ordered = sorted(self._samples)
+        index = min(len(ordered) - 1, max(0, int(round(p / 100 * len(ordered))) - 1))
+        return ordered[index]
+
+
+class LLMHedger:
+    """按延迟分位数触发的请求对冲"""
+
+    def __init__(self, percentile: float = 95, min_samples: int = 20, min_delay: float = 2.0,
+                 max_hedge_rate: float = 0.05, window: int = 200):
+        """初始化
+
+        Args:
+            percentile: 触发对冲的延迟分位数
+            min_samples: 样本数达到此值后才开始对冲
+            min_delay: 最短触发延迟（秒）
+            max_hedge_rate: 最近window个请求中对冲请求的最大比例
+            window: 延迟分布与对冲比例的统计窗口（请求数）
+        """
+        self.percentile = percentile
+        self.min_samples = min_samples
+        self.min_delay = min_delay
+        self.max_hedge_rate = max_hedge_rate
+        self.window = window
+
+        self._trackers: Dict[Hashable, LatencyTracker] = {}
+        self._recent_hedged: Deque[bool] = collections.deque(maxlen=window)
+        self._hedges_in_flight = 0
+        self._lock = threading.Lock()
+
+        self.requests = 0
+        self.hedged = 0
+        self.hedge_wins = 0
+        self.primary_wins = 0
+        self.budget_skipped = 0
+        self.busy_skipped = 0
+
+    @classmethod
+    def from_config(cls, config: Dict[str, Any]) -> "LLMHedger":
+        """根据 inference.llm.hedging 配置创建"""
+        return cls(
+            percentile=config.get('percentile', 95),
+            min_samples=config.get('min_samples', 20),
+            min_delay=config.get('min_delay', 2.0),
+            max_hedge_rate=config.get('max_hedge_rate', 0.05),
+            window=config.get('window', 200)
+        )
+
+    def hedge_delay(self, key: Hashable) -> Optional[float]:
+        """该类请求的对冲触发延迟（秒），样本不足时返回None（不对冲）"""
+        with self._lock:
+            tracker = self._trackers.get(key)
+            if tracker is None or len(tracker) < self.min_samples:
+                return None
+            return max(self.min_delay, tracker.percentile(self.percentile))
+
+    def _record(self, key: Hashable, seconds: float, hedged: bool):
+        with self._lock:
+            self._trackers.setdefault(key, LatencyTracker(self.window)).record(seconds)
+            self._recent_hedged.append(hedged)
+
+    def _take_hedge(self) -> bool:
+        """对冲比例未超上限时占用一次对冲额度（进行中的对冲也计入，结束后调用 _release_hedge）
+
+        额度按已观测的请求数计算，而非整个窗口大小。
+        """
+        with self._lock:
+            observed = max(len(self._recent_hedged), self.min_samples)
+            if sum(self._recent_hedged) + self._hedges_in_flight + 1 > self.max_hedge_rate * observed:
+                self.budget_skipped += 1
+                return False
+            self.hedged += 1
+            self._hedges_in_flight += 1
+            return True
+
+    def _release_hedge(self):
+        with self._lock:
+            self._hedges_in_flight -= 1
+
+    async def run(self, key: Hashable, call: Callable[[], Awaitable[T]],
+                  hedge_call: Optional[Callable[[], Awaitable[T]]] = None,
+                  can_hedge: Optional[Callable[[], bool]] = None) -> T:
+        """执行请求，必要时对冲
+
+        延迟从调用 run 时开始计时，调用方应在取得限流许可等排队之后再调用。
+
+        Args:
+            key: 延迟分布的分组键
+            call: 发起一次请求的协程工厂
+            hedge_call: 发起对冲请求的协程工厂（如需另外取得许可），None表示再调用一次call
+            can_hedge: 触发对冲时调用，返回False则不对冲（如限流器已有排队者）
+        """
+        with self._lock:
+            self.requests += 1
+        delay = self.hedge_delay(key)
+        started = time.monotonic()
+        primary = asyncio.ensure_future(call())
+        if delay is None:
+            result = await primary
+            self._record(key, time.monotonic() - started, False)
+            return result
+
+        try:
+            done, _ = await asyncio.wait({primary}, timeout=delay)
+        except asyncio.CancelledError:
+            primary.cancel()
+            raise
+        if not done and can_hedge is not None and not can_hedge():
+            with self._lock:
+                self.busy_skipped += 1
+            done = True
+        if done or not self._take_hedge():
+            result = await primary
+            self._record(key, time.monotonic() - started, False)
+            return result
+
+        logger.info(f"LLM请求超过{delay:.1f}秒未返回，发出对冲请求")
+        hedge = asyncio.ensure_future((hedge_call or call)())
+        pending = {primary, hedge}
+        error: Optional[BaseException] = None
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        won_by_hedge = task is hedge
+                        with self._lock:
+                            if won_by_hedge:
+                                self.hedge_wins += 1
+                            else:
+                                self.primary_wins += 1
+                        # 记录调用方实际等待的时间：只记对冲请求自身的耗时会使分位数在长尾下持续走低
+                        self._record(key, time.monotonic() - started, True)
+                        return task.result()
+                    error = error or task.exception()
+            raise error
+        finally:
+            # 取消落后的请求（连接随之关闭，不再等待其响应）
+            for task in pending:
+                task.cancel()
+            self._release_hedge()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            delays = {}
+            for key, tracker in self._trackers.items():
+                label = key if isinstance(key, str) else ":".join(str(part) for part in key)
+                p = tracker.percentile(self.percentile)
+                delays[label] = {
+                    "samples": len(tracker),
+                    f"p{self.percentile:g}": round(p, 3) if p is not None else None,
+                    "p50": round(tracker.percentile(50), 3) if len(tracker) else None
+                }
+            return {
+                "requests": self.requests,
+                "hedged": self.hedged,
+                "hedge_rate": self.hedged / self.requests if self.requests else 0.0,
+                "hedge_wins": self.hedge_wins,
+                "primary_wins": self.primary_wins,
+                "budget_skipped": self.budget_skipped,
+                "busy_skipped": self.busy_skipped,
+                "hedges_in_flight": self._hedges_in_flight,
+                "latency": delays
+            }
+
+
+_hedger: Optional[LLMHedger] = None
+_hedger_lock = threading.Lock()
+
+
+def get_llm_hedger() -> Optional[LLMHedger]:
+    """获取进程内共享的LLM请求对冲器
+
+    根据config.yaml中的 inference.llm.hedging 创建，未启用时返回None。
+    """
+    global _hedger
+    if _hedger is None:
+        with _hedger_lock:
+            if _hedger is None:
+                hedging_config = Config.get_inference_config().get('llm', {}).get('hedging', {})
+                if not hedging_config.get('enabled', False):
+                    return None
+                _hedger = LLMHedger.from_config(hedging_config)
+    return _hedger
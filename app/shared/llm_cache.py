@@ -0,0 +1,212 @@
+"""LLM响应缓存
+
+按 (模型, 调用参数, 消息内容) 的哈希对LLM响应做内容寻址缓存：
+- 内存LRU层：进程内毫秒级命中
+- SQLite磁盘层：跨进程、跨重启复用
+两层均支持TTL过期和容量淘汰。
+"""
+
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from .cache import LRUCache
+from .config import Config
+from .llm_transport import load_backend
+
+
+class SQLiteCache:
+    """基于SQLite的磁盘缓存（线程安全）"""
+
+    def __init__(self, path: str, ttl: Optional[float] = None, max_entries: int = 100000):
+        """初始化磁盘缓存
+
+        Args:
+            path: SQLite数据库文件路径
+            ttl: 条目有效期（秒），None表示不过期
+            max_entries: 最大条目数，超出时按最近访问时间淘汰
+        """
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.path), check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS llm_cache ("
+            "key TEXT PRIMARY KEY, value TEXT NOT NULL, "
+            "created_at REAL NOT NULL, last_access REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_llm_cache_access ON llm_cache(last_access)")
+        self._conn.commit()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: str) -> Optional[str]:
+        """读取缓存，未命中或已过期时返回None"""
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value, created_at FROM llm_cache WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            value, created_at = row
+            if self.ttl is not None and created_at + self.ttl <= now:
+                self._conn.execute("DELETE FROM llm_cache WHERE key = ?", (key,))
+                self._conn.commit()
+                self.misses += 1
+                return None
+            self._conn.execute("UPDATE llm_cache SET last_access = ? WHERE key = ?", (now, key))
+            self._conn.commit()
+            self.hits += 1
+            return value
+
+    def set(self, key: str, value: str):
+        """写入缓存，并按TTL和容量淘汰旧条目"""
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO llm_cache (key, value, created_at, last_access) VALUES (?, ?, ?, ?)",
+                (key, value, now, now)
+            )
+            if self.ttl is not None:
+                cursor = self._conn.execute("DELETE FROM llm_cache WHERE created_at <= ?", (now - self.ttl,))
+                self.evictions += cursor.rowcount
+            count = self._conn.execute("SELECT COUNT(*) FROM llm_cache").fetchone()[0]
+            if count > self.max_entries:
+                cursor = self._conn.execute(
+                    "DELETE FROM llm_cache WHERE key IN ("
+                    "SELECT key FROM llm_cache ORDER BY last_access ASC LIMIT ?)",
+                    (count - self.max_entries,)
+                )
+                self.evictions += cursor.rowcount
+            self._conn.commit()
+
+    def clear(self):
+        """清空缓存"""
+        with self._lock:
+            self._conn.execute("DELETE FROM llm_cache")
+            self._conn.commit()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM llm_cache").fetchone()[0]
+
+    def stats(self) -> Dict[str, Any]:
+        """命中率等统计信息"""
+        total = self.hits + self.misses
+        return {
+            "size": len(self),
+            "max_entries": self.max_entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": self.hits / total if total else 0.0
+        }
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+class LLMResponseCache:
+    """两级LLM响应缓存（内存LRU + SQLite）"""
+
+    def __init__(
+        self,
+        memory_size: int = 1000,
+        ttl: Optional[float] = None,
+        disk_path: Optional[str] = None,
+        disk_max_entries: int = 100000
+    ):
+        """初始化缓存
+
+        Args:
+            memory_size: 内存层最大条目数
+            ttl: 条目有效期（秒），None表示不过期
+            disk_path: SQLite文件路径，None则只使用内存层
+            disk_max_entries: 磁盘层最大条目数
+        """
+        self.memory = LRUCache(maxsize=memory_size, ttl=ttl)
+        self.disk = SQLiteCache(disk_path, ttl=ttl, max_entries=disk_max_entries) if disk_path else None
+
+    @staticmethod
+    def make_key(model: str, messages: List[Dict[str, str]], params: Dict[str, Any]) -> str:
+        """根据模型、调用参数和消息内容生成缓存键"""
+        payload = json.dumps(
+            {"model": model, "params": params, "messages": messages},
+            ensure_ascii=False,
+            sort_keys=True
+        )
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+    def get(self, key: str) -> Optional[str]:
+        """依次查询内存层和磁盘层，磁盘命中时回填内存层"""
+        value = self.memory.get(key)
+        if value is not None:
+            return value
+        if self.disk is not None:
+            value = self.disk.get(key)
+            if value is not None:
+                self.memory.set(key, value)
+                return value
+        return None
+
+    def set(self, key: str, value: str):
+        """同时写入内存层和磁盘层"""
+        self.memory.set(key, value)
+        if self.disk is not None:
+            self.disk.set(key, value)
+
+    def clear(self):
+        self.memory.clear()
+        if self.disk is not None:
+            self.disk.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        """各层命中统计"""
+        memory_stats = self.memory.stats()
+        disk_stats = self.disk.stats() if self.disk is not None else None
+        lookups = memory_stats["hits"] + memory_stats["misses"]
+        hits = memory_stats["hits"] + (disk_stats["hits"] if disk_stats else 0)
+        return {
+            "hits": hits,
+            "misses": lookups - hits,
+            "hit_rate": hits / lookups if lookups else 0.0,
+            "memory": memory_stats,
+            "disk": disk_stats
+        }
+
+
+_llm_cache: Optional[LLMResponseCache] = None
+_llm_cache_lock = threading.Lock()
+
+
+def get_llm_cache() -> Optional[LLMResponseCache]:
+    """获取进程内共享的LLM响应缓存
+
+    根据config.yaml中的 inference.llm.cache 创建，未启用时返回None。
+    使用模拟后端时也返回None：模拟响应不能写入磁盘缓存，压测也需要每次都走到后端。
+    """
+    global _llm_cache
+    if _llm_cache is None:
+        with _llm_cache_lock:
+            if _llm_cache is None:
+                cache_config = Config.get_inference_config().get('llm', {}).get('cache', {})
+                if not cache_config.get('enabled', False) or load_backend() == "simulator":
+                    return None
+                _llm_cache = LLMResponseCache(
+                    memory_size=cache_config.get('memory_size', 1000),
+                    ttl=cache_config.get('ttl_seconds'),
+                    disk_path=cache_config.get('disk_path'),
+                    disk_max_entries=cache_config.get('disk_max_entries', 100000)
+                )
+    return _llm_cache
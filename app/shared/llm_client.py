@@ -0,0 +1,200 @@
+"""LLM客户端管理"""
+
+import os
+from contextlib import nullcontext
+from typing import AsyncIterator, Dict, List, Optional
+from openai import OpenAI, AsyncOpenAI
+from dotenv import load_dotenv
+
+from .config import Config
+from .llm_cache import LLMResponseCache
+from .llm_transport import get_llm_http_client, get_async_llm_http_client, load_backend
+from .rate_limiter import Permit, estimate_tokens, get_llm_rate_limiter
+from .hedging import get_llm_hedger
+
+DEEPSEEK_BASE_URL = "https://api.deepseek.com"
+
+
+def get_llm_base_url() -> str:
+    """LLM服务地址，可用 inference.llm.base_url 指向本地模拟服务（见 llm_simulator）"""
+    return (Config.get_inference_config().get('llm', {}).get('base_url') or DEEPSEEK_BASE_URL).rstrip('/')
+
+
+def get_llm_api_key() -> Optional[str]:
+    """DeepSeek API Key；模拟后端不校验，未配置时使用占位值"""
+    load_dotenv()
+    api_key = os.getenv("DEEPSEEK_API_KEY")
+    if not api_key and load_backend() == "simulator":
+        return "simulator"
+    return api_key
+
+
+def get_llm_client() -> OpenAI:
+    """获取 DeepSeek (OpenAI兼容) 客户端实例
+
+    所有实例共用 llm_transport 的进程级连接池，多次调用不会重复建立TCP/TLS连接。
+
+    Returns:
+        OpenAI: LLM客户端实例
+    """
+    return OpenAI(
+        api_key=get_llm_api_key(),
+        base_url=get_llm_base_url(),
+        http_client=get_llm_http_client()
+    )
+
+
+def get_async_llm_client() -> AsyncOpenAI:
+    """获取异步 DeepSeek (OpenAI兼容) 客户端实例
+
+    供异步推理路径使用，单个事件循环内可同时挂起大量请求；
+    同一事件循环内的实例共用 llm_transport 的连接池。
+
+    Returns:
+        AsyncOpenAI: 异步LLM客户端实例
+    """
+    return AsyncOpenAI(
+        api_key=get_llm_api_key(),
+        base_url=get_llm_base_url(),
+        http_client=get_async_llm_http_client()
+    )
+
+
+def _llm_permit(messages: List[Dict[str, str]]):
+    """进程级限流器的许可（with / async with 均可），未启用限流时为空上下文"""
+    limiter = get_llm_rate_limiter()
+    if limiter is None:
+        return nullcontext(Permit(0))
+    return limiter.limit(estimate_tokens(messages))
+
+
+def _llm_limiter_idle() -> bool:
+    """限流器没有排队者（对冲请求不必排在其后），未启用限流时为True"""
+    limiter = get_llm_rate_limiter()
+    return limiter is None or limiter.stats()["waiting"] == 0
+
+
+def _request_options(timeout: Optional[float]) -> Dict[str, float]:
+    return {} if timeout is None else {"timeout": timeout}
+
+
+def _total_tokens(completion) -> Optional[int]:
+    usage = getattr(completion, "usage", None)
+    return getattr(usage, "total_tokens", None)
+
+
+def create_chat_completion(client: OpenAI, model: str, messages: List[Dict[str, str]],
+                           cache: Optional[LLMResponseCache] = None, timeout: Optional[float] = None,
+                           **params) -> str:
+    """调用chat.completions并返回响应文本，命中缓存时不发起网络请求
+
+    实际请求经过进程级限流器（inference.llm.rate_limit）。
+
+    Args:
+        client: LLM客户端实例
+        model: 模型名称
+        messages: 对话消息
+        cache: LLM响应缓存，None表示不使用缓存
+        timeout: 本次请求的超时（秒），None使用客户端默认值；不参与缓存键计算
+        **params: 其它调用参数（temperature、max_tokens等），参与缓存键计算
+
+    Returns:
+        str: 模型响应内容
+    """
+    key = None
+    if cache is not None:
+        key = cache.make_key(model, messages, params)
+        cached = cache.get(key)
+        if cached is not None:
+            return cached
+
+    with _llm_permit(messages) as permit:
+        completion = client.chat.completions.create(
+            model=model, messages=messages, **params, **_request_options(timeout)
+        )
+        permit.record_usage(_total_tokens(completion))
+    content = completion.choices[0].message.content
+
+    if cache is not None and content:
+        cache.set(key, content)
+    return content
+
+
+async def create_chat_completion_async(client: AsyncOpenAI, model: str, messages: List[Dict[str, str]],
+                                       cache: Optional[LLMResponseCache] = None, timeout: Optional[float] = None,
+                                       **params) -> str:
+    """create_chat_completion 的异步版本
+
+    启用 inference.llm.hedging 时，请求超过近期延迟分位数仍未返回会发出对冲请求，先返回者胜出。
+    对冲只计时网络调用（取得限流许可之后），对冲请求另外持有许可；限流器有排队者时不对冲。
+    """
+    key = None
+    if cache is not None:
+        key = cache.make_key(model, messages, params)
+        cached = cache.get(key)
+        if cached is not None:
+            return cached
+
+    async def request():
+        return await client.chat.completions.create(
+            model=model, messages=messages, **params, **_request_options(timeout)
+        )
+
+    async def hedge_request():
+        async with _llm_permit(messages) as hedge_permit:
+            completion = await request()
+            hedge_permit.record_usage(_total_tokens(completion))
+        return completion
+
+    hedger = get_llm_hedger()
+    async with _llm_permit(messages) as permit:
+        if hedger is None:
+            completion = await request()
+        else:
+            completion = await hedger.run((model, params.get("max_tokens")), request,
+                                          hedge_call=hedge_request, can_hedge=_llm_limiter_idle)
+        permit.record_usage(_total_tokens(completion))
+    content = completion.choices[0].message.content
+
+    if cache is not None and content:
+        cache.set(key, content)
+    return content
+
+
+async def stream_chat_completion_async(client: AsyncOpenAI, model: str, messages: List[Dict[str, str]],
+                                       cache: Optional[LLMResponseCache] = None, timeout: Optional[float] = None,
+                                       **params) -> AsyncIterator[str]:
+    """以流式模式调用chat.completions，逐段产出响应文本
+
+    缓存键与 create_chat_completion 相同（不含stream参数），两者可共享缓存；
+    命中缓存时一次性产出完整响应，完整接收后写入缓存。
+
+    Yields:
+        str: 响应文本片段
+    """
+    key = None
+    if cache is not None:
+        key = cache.make_key(model, messages, params)
+        cached = cache.get(key)
+        if cached is not None:
+            yield cached
+            return
+
+    parts = []
+    # 限流许可覆盖整个流的接收过程
+    async with _llm_permit(messages) as permit:
+        stream = await client.chat.completions.create(
+            model=model, messages=messages, stream=True, **params, **_request_options(timeout)
+        )
+        async for chunk in stream:
+            if not chunk.choices:
+                continue
+            delta = chunk.choices[0].delta.content
+            if delta:
+                parts.append(delta)
+                yield delta
+        permit.record_usage(permit.estimated_tokens + estimate_tokens([{"content": ''.join(parts)}]))
+
+    content = ''.join(parts)
+    if cache is not None and content:
+        cache.set(key, content)
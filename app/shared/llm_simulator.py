@@ -0,0 +1,419 @@
+"""LLM延迟模拟后端
+
+OpenAI兼容的 /chat/completions 替身，用于离线压测与降级演练（不产生调用费用、不需要外网）：
+- 按提示词类型返回符合解析格式的响应：实体识别、适应症分析、适应症疾病抽取
+- 延迟按配置的分布抽样（fixed / uniform / lognormal），可注入长尾（straggler）
+- 按概率注入429与超时；超时按请求的读超时等待后抛出 httpx.ReadTimeout，与真实网络超时一致
+
+两种接入方式：
+1. 进程内：config.yaml 中 inference.llm.backend 设为 simulator，共享LLM连接池
+   （llm_transport）改用 SimulatorTransport，OpenAI SDK、限流、对冲、时间预算等照常生效
+2. 本地HTTP服务：python -m app.shared.llm_simulator --port 8001，
+   再将 inference.llm.base_url 指向 http://localhost:8001（可供其它进程或压测工具使用）
+"""
+
+import asyncio
+import collections
+import json
+import random
+import re
+import threading
+import time
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+import httpx
+
+from .llm_transport import PoolStats, _AsyncTrackedStream, _TrackedStream, _once
+
+DEFAULT_SIMULATOR_CONFIG = {
+    'latency': {
+        'distribution': 'lognormal',  # fixed / uniform / lognormal
+        'value': 1.0,                 # fixed: 固定延迟（秒）
+        'low': 0.5,                   # uniform: 下限（秒）
+        'high': 3.0,                  # uniform: 上限（秒）
+        'median': 1.5,                # lognormal: 中位数（秒）
+        'sigma': 0.5,                 # lognormal: 对数标准差
+    },
+    'straggler_rate': 0.0,            # 长尾请求比例
+    'straggler_seconds': [20, 30],    # 长尾请求的延迟范围（秒）
+    'error_rate': 0.0,                # 返回429的比例
+    'timeout_rate': 0.0,              # 不返回（直到客户端读超时）的比例
+    'stream_chunk_chars': 16,         # 流式响应每个片段的字符数
+    'seed': None,
+}
+
+ENTITY_PROMPT_MARK = "识别所有的药品和疾病实体"
+ANALYSIS_PROMPT_MARK = "是否属于超适应症用药"
+EXTRACTION_PROMPT_MARK = "提取疾病信息"
+
+
+def _merge_config(config: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    merged = dict(DEFAULT_SIMULATOR_CONFIG)
+    merged['latency'] = dict(DEFAULT_SIMULATOR_CONFIG['latency'])
+    for key, value in (config or {}).items():
+        if key == 'latency' and isinstance(value, dict):
+            merged['latency'].update(value)
+        else:
+            merged[key] = value
+    return merged
+
+
+def _line_value(text: str, label: str) -> str:
+    match = re.search(rf"{label}[:：]\s*(.*)", text)
+    return match.group(1).strip() if match else ""
+
+
+def _json_block(content: Dict[str, Any]) -> str:
+    return json.dumps(content, ensure_ascii=False)
+
+
+class LLMSimulator:
+    """模拟响应内容、延迟与故障"""
+
+    def __init__(self, config: Optional[Dict[str, Any]] = None):
+        self.config = _merge_config(config)
+        self._rng = random.Random(self.config.get('seed'))
+        self._lock = threading.Lock()
+        self._latencies = collections.deque(maxlen=1000)
+        self.requests = 0
+        self.throttled = 0
+        self.timeouts = 0
+        self.stragglers = 0
+
+    # ---- 延迟与故障 ----
+
+    def draw(self) -> Tuple[str, float]:
+        """抽样本次请求的结果类型（ok / throttled / timeout）与延迟（秒）"""
+        with self._lock:
+            self.requests += 1
+            rng = self._rng
+            if rng.random() < self.config['error_rate']:
+                self.throttled += 1
+                return "throttled", min(0.05, self._base_latency(rng))
+            if rng.random() < self.config['timeout_rate']:
+                self.timeouts += 1
+                return "timeout", float('inf')
+            if rng.random() < self.config['straggler_rate']:
+                self.stragglers += 1
+                low, high = self.config['straggler_seconds']
+                latency = rng.uniform(low, high)
+            else:
+                latency = self._base_latency(rng)
+            self._latencies.append(latency)
+            return "ok", latency
+
+    def _base_latency(self, rng: random.Random) -> float:
+        latency = self.config['latency']
+        distribution = latency['distribution']
+        if distribution == 'fixed':
+            return latency['value']
+        if distribution == 'uniform':
+            return rng.uniform(latency['low'], latency['high'])
+        if distribution == 'lognormal':
+            return rng.lognormvariate(0, latency['sigma']) * latency['median']
+        raise ValueError(f"未知的延迟分布: {distribution}，可选值: fixed, uniform, lognormal")
+
+    # ---- 响应内容 ----
+
+    def respond(self, messages: List[Dict[str, str]]) -> str:
+        """按提示词类型生成可被对应解析逻辑接受的响应文本"""
+        prompt = (messages[-1].get("content") or "") if messages else ""
+        if ENTITY_PROMPT_MARK in prompt:
+            return self._entity_response(prompt)
+        if ANALYSIS_PROMPT_MARK in prompt:
+            return self._analysis_response(prompt)
+        if EXTRACTION_PROMPT_MARK in prompt:
+            return self._extraction_response(prompt)
+        return "模拟响应"
+
+    def _entity_response(self, prompt: str) -> str:
+        record: Dict[str, Any] = {}
+        match = re.search(r"医疗记录：\n(.*?)\n\n", prompt, re.S)
+        if match:
+            try:
+                record = json.loads(match.group(1))
+            except json.JSONDecodeError:
+                record = {}
+        prescription = record.get("prescription") or {}
+        patient = record.get("patient_info") or {}
+        description = record.get("description") or ""
+        drug = record.get("drug_name") or prescription.get("drug_name") or _first(
+            re.findall(r"(?:处方|使用|服用)([^\s，。,；;]+)", description))
+        disease = record.get("disease_name") or patient.get("diagnosis") or _first(
+            re.findall(r"诊断为([^\s，。,；;]+)", description))
+        entities = {
+            "drugs": [{"name": drug}] if drug else [],
+            "diseases": [{"name": disease}] if disease else [],
+            "context": {"description": description}
+        }
+        return f"<think>模拟实体识别</think>\n```json\n{_json_block(entities)}\n```"
+
+    def _analysis_response(self, prompt: str) -> str:
+        indications = _line_value(prompt, "- 标准适应症")
+        diagnosis = _line_value(prompt, "- 诊断")
+        matched = bool(diagnosis) and diagnosis in indications
+        return _json_block({
+            "is_offlabel": not matched,
+            "confidence": round(0.6 + 0.3 * self._rng.random(), 2),
+            "analysis": {
+                "indication_match": {
+                    "score": 1.0 if matched else 0.0,
+                    "matching_indication": diagnosis if matched else "无",
+                    "reasoning": "模拟响应：按诊断是否出现在标准适应症中判断"
+                },
+                "mechanism_similarity": {"score": 0.5, "reasoning": "模拟响应"},
+                "evidence_support": {"level": "C", "description": "模拟响应"}
+            },
+            "recommendation": {
+                "decision": "建议使用" if matched else "谨慎使用",
+                "explanation": "模拟响应",
+                "risk_assessment": "模拟响应"
+            },
+            "data_limitations": {"missing_data": [], "impact_on_analysis": "模拟响应"}
+        })
+
+    def _extraction_response(self, prompt: str) -> str:
+        text = _line_value(prompt, "适应症文本")
+        names = [name.strip() for name in re.split(r"[，,；;、。]", text) if name.strip()]
+        return _json_block({"diseases": [
+            {"name": name, "type": "disease", "sub_diseases": [], "related_diseases": [], "confidence_score": 0.9}
+            for name in names[:5]
+        ]})
+
+    # ---- OpenAI兼容报文 ----
+
+    def completion_body(self, payload: Dict[str, Any]) -> Dict[str, Any]:
+        messages = payload.get("messages") or []
+        content = self.respond(messages)
+        prompt_tokens = sum(len(message.get("content") or "") for message in messages) // 2
+        completion_tokens = max(1, len(content) // 2)
+        return {
+            "id": f"chatcmpl-sim-{self.requests}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": payload.get("model", "simulator"),
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": content},
+                "finish_reason": "stop"
+            }],
+            "usage": {
+                "prompt_tokens": prompt_tokens,
+                "completion_tokens": completion_tokens,
+                "total_tokens": prompt_tokens + completion_tokens
+            }
+        }
+
+    def stream_events(self, payload: Dict[str, Any], latency: float) -> Iterator[Tuple[float, bytes]]:
+        """流式响应的 (等待秒数, SSE数据) 序列，总延迟分摊到各片段"""
+        body = self.completion_body(payload)
+        content = body["choices"][0]["message"]["content"]
+        size = max(1, self.config['stream_chunk_chars'])
+        chunks = [content[i:i + size] for i in range(0, len(content), size)] or [""]
+        delay = latency / (len(chunks) + 1)
+        base = {"id": body["id"], "object": "chat.completion.chunk", "created": body["created"], "model": body["model"]}
+        for chunk in chunks:
+            event = dict(base, choices=[{"index": 0, "delta": {"content": chunk}, "finish_reason": None}])
+            yield delay, f"data: {_json_block(event)}\n\n".encode()
+        event = dict(base, choices=[{"index": 0, "delta": {}, "finish_reason": "stop"}])
+        yield delay, f"data: {_json_block(event)}\n\ndata: [DONE]\n\n".encode()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            ordered = sorted(self._latencies)
+            return {
+                "requests": self.requests,
+                "throttled": self.throttled,
+                "timeouts": self.timeouts,
+                "stragglers": self.stragglers,
+                "latency_p50": round(ordered[len(ordered) // 2], 3) if ordered else None,
+                "latency_p99": round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.99))], 3) if ordered else None
+            }
+
+
+def _first(items: List[str]) -> Optional[str]:
+    return items[0] if items else None
+
+
+THROTTLED_BODY = {"error": {"message": "Rate limit reached (simulated)", "type": "rate_limit_error"}}
+
+
+def _read_timeout(request: httpx.Request) -> Optional[float]:
+    return (request.extensions.get("timeout") or {}).get("read")
+
+
+def _plan(simulator: LLMSimulator, request: httpx.Request):
+    """解析请求并抽样本次结果: (payload, 结果类型, 实际等待秒数, 是否在等待后超时)"""
+    payload = json.loads(request.content or b"{}")
+    outcome, latency = simulator.draw()
+    read_timeout = _read_timeout(request)
+    timed_out = read_timeout is not None and latency > read_timeout
+    if timed_out:
+        latency = read_timeout
+    elif latency == float('inf'):
+        raise RuntimeError("模拟超时需要客户端设置读超时")
+    return payload, outcome, latency, timed_out
+
+
+def _response(simulator: LLMSimulator, request: httpx.Request, payload: Dict[str, Any],
+              outcome: str, latency: float, stream_cls) -> httpx.Response:
+    if outcome == "throttled":
+        return httpx.Response(429, json=THROTTLED_BODY, headers={"retry-after": "1"}, request=request)
+    if payload.get("stream"):
+        return httpx.Response(
+            200, headers={"content-type": "text/event-stream"},
+            stream=stream_cls(simulator.stream_events(payload, latency)), request=request
+        )
+    return httpx.Response(200, json=simulator.completion_body(payload), request=request)
+
+
+class _SyncEventStream(httpx.SyncByteStream):
+    def __init__(self, events):
+        self._events = events
+
+    def __iter__(self):
+        for delay, data in self._events:
+            time.sleep(delay)
+            yield data
+
+
+class _AsyncEventStream(httpx.AsyncByteStream):
+    def __init__(self, events):
+        self._events = events
+
+    async def __aiter__(self):
+        for delay, data in self._events:
+            await asyncio.sleep(delay)
+            yield data
+
+
+class SimulatorTransport(httpx.BaseTransport):
+    """同步客户端使用的模拟传输（与真实连接池一样，最多max_connections个请求同时进行，其余排队）
+
+    流式响应在接收期间一直占用并发槽与在途计数，响应关闭时释放（与 InstrumentedTransport 一致）；
+    非流式响应体已在内存中，返回时即释放。
+    """
+
+    def __init__(self, simulator: LLMSimulator, max_connections: int = 64):
+        self.simulator = simulator
+        self.pool_stats = PoolStats(max_connections)
+        self._slots = threading.Semaphore(max_connections)
+
+    def _release(self, error: bool = False):
+        self._slots.release()
+        self.pool_stats.release(error=error)
+
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        self.pool_stats.acquire()
+        self._slots.acquire()
+        try:
+            response = self._handle(request)
+        except BaseException:
+            self._release(error=True)
+            raise
+        if isinstance(response.stream, _SyncEventStream):
+            response.stream = _TrackedStream(response.stream, _once(self._release))
+        else:
+            self._release()
+        return response
+
+    def _handle(self, request: httpx.Request) -> httpx.Response:
+        payload, outcome, latency, timed_out = _plan(self.simulator, request)
+        # 流式响应的延迟分摊到各片段
+        if not payload.get("stream") or timed_out:
+            time.sleep(latency)
+        if timed_out:
+            raise httpx.ReadTimeout("模拟读超时", request=request)
+        return _response(self.simulator, request, payload, outcome, latency, _SyncEventStream)
+
+
+class AsyncSimulatorTransport(httpx.AsyncBaseTransport):
+    """异步客户端使用的模拟传输（并发上限同 SimulatorTransport）"""
+
+    def __init__(self, simulator: LLMSimulator, max_connections: int = 64):
+        self.simulator = simulator
+        self.pool_stats = PoolStats(max_connections)
+        self._slots = asyncio.Semaphore(max_connections)
+
+    def _release(self, error: bool = False):
+        self._slots.release()
+        self.pool_stats.release(error=error)
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        self.pool_stats.acquire()
+        try:
+            await self._slots.acquire()
+        except BaseException:
+            self.pool_stats.release(error=True)
+            raise
+        try:
+            response = await self._handle(request)
+        except BaseException:
+            self._release(error=True)
+            raise
+        if isinstance(response.stream, _AsyncEventStream):
+            response.stream = _AsyncTrackedStream(response.stream, _once(self._release))
+        else:
+            self._release()
+        return response
+
+    async def _handle(self, request: httpx.Request) -> httpx.Response:
+        payload, outcome, latency, timed_out = _plan(self.simulator, request)
+        if not payload.get("stream") or timed_out:
+            await asyncio.sleep(latency)
+        if timed_out:
+            raise httpx.ReadTimeout("模拟读超时", request=request)
+        return _response(self.simulator, request, payload, outcome, latency, _AsyncEventStream)
+
+
+def create_simulator_app(simulator: LLMSimulator):
+    """本地HTTP模拟服务（FastAPI应用）"""
+    from fastapi import FastAPI, Request
+    from fastapi.responses import JSONResponse, StreamingResponse
+
+    app = FastAPI(title="LLM Simulator")
+
+    @app.post("/chat/completions")
+    @app.post("/v1/chat/completions")
+    async def chat_completions(request: Request):
+        payload = await request.json()
+        outcome, latency = simulator.draw()
+        if outcome == "throttled":
+            return JSONResponse(THROTTLED_BODY, status_code=429, headers={"retry-after": "1"})
+        if outcome == "timeout":
+            # 保持连接不响应，由客户端的读超时结束
+            await asyncio.sleep(3600)
+        if payload.get("stream"):
+            async def events():
+                for delay, data in simulator.stream_events(payload, latency):
+                    await asyncio.sleep(delay)
+                    yield data
+            return StreamingResponse(events(), media_type="text/event-stream")
+        await asyncio.sleep(latency)
+        return simulator.completion_body(payload)
+
+    @app.get("/stats")
+    async def stats():
+        return simulator.stats()
+
+    return app
+
+
+def main():
+    import argparse
+
+    import uvicorn
+
+    from .config import Config
+
+    parser = argparse.ArgumentParser(description='LLM延迟模拟服务（OpenAI兼容）')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8001)
+    args = parser.parse_args()
+
+    config = Config.get_inference_config().get('llm', {}).get('simulator', {})
+    uvicorn.run(create_simulator_app(LLMSimulator(config)), host=args.host, port=args.port)
+
+
+if __name__ == '__main__':
+    main()
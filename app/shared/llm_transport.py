@@ -0,0 +1,330 @@
+"""LLM HTTP传输层
+
+进程内共享的keep-alive连接池（可选HTTP/2），推理路径的OpenAI客户端与
+疾病抽取任务的直接HTTP调用都通过这里发出请求，避免重复的TCP/TLS握手。
+
+连接池参数取自 config.yaml 的 inference.llm.transport，并统计：
+- requests / connections_opened：请求数与新建连接数，两者之差即连接复用次数
+- queued：发起时在途请求数已达 max_connections、需要等待空闲连接的请求数
+- in_flight / peak_in_flight：当前与峰值在途请求数
+
+共享客户端的 close()/aclose() 为空操作（OpenAI客户端关闭时会关闭其http_client），
+进程退出前调用 close_llm_http_clients() 真正释放连接。
+
+inference.llm.backend 为 simulator 时，连接池改用进程内的延迟模拟传输（见 llm_simulator），
+不发出任何网络请求。
+"""
+
+import asyncio
+import logging
+import threading
+import weakref
+from typing import Any, Dict, Optional
+
+import httpx
+
+from .config import Config
+
+logger = logging.getLogger(__name__)
+
+LLM_BACKENDS = ("deepseek", "simulator")
+
+DEFAULT_TRANSPORT_CONFIG = {
+    'http2': False,
+    'max_connections': 64,
+    'max_keepalive_connections': 32,
+    'keepalive_expiry': 60.0,
+    'timeout': 120.0,
+    'connect_timeout': 10.0,
+    'pool_timeout': 30.0,
+}
+
+
+def load_backend() -> str:
+    """LLM后端：deepseek（默认）或 simulator"""
+    backend = Config.get_inference_config().get('llm', {}).get('backend', 'deepseek')
+    if backend not in LLM_BACKENDS:
+        raise ValueError(f"无效的LLM后端: {backend}，可选值: {', '.join(LLM_BACKENDS)}")
+    return backend
+
+
+def load_transport_config() -> Dict[str, Any]:
+    """读取 inference.llm.transport，缺省项使用默认值"""
+    config = dict(DEFAULT_TRANSPORT_CONFIG)
+    config.update(Config.get_inference_config().get('llm', {}).get('transport', {}) or {})
+    if config['http2']:
+        try:
+            import h2  # noqa: F401
+        except ImportError:
+            logger.warning("未安装h2（pip install 'httpx[http2]'），LLM连接池使用HTTP/1.1")
+            config['http2'] = False
+    return config
+
+
+class PoolStats:
+    """连接池统计（线程安全）"""
+
+    def __init__(self, max_connections: int):
+        self.max_connections = max_connections
+        self.requests = 0
+        self.queued = 0
+        self.errors = 0
+        self.in_flight = 0
+        self.peak_in_flight = 0
+        self._connections = weakref.WeakSet()
+        self.connections_opened = 0
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        with self._lock:
+            self.requests += 1
+            if self.in_flight >= self.max_connections:
+                self.queued += 1
+            self.in_flight += 1
+            self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+
+    def release(self, error: bool = False):
+        with self._lock:
+            self.in_flight -= 1
+            if error:
+                self.errors += 1
+
+    def observe_connections(self, connections):
+        """记录连接池中首次出现的连接（新建连接）"""
+        with self._lock:
+            for connection in connections:
+                if connection not in self._connections:
+                    self._connections.add(connection)
+                    self.connections_opened += 1
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            reused = max(0, self.requests - self.connections_opened)
+            return {
+                "requests": self.requests,
+                "connections_opened": self.connections_opened,
+                "reuse_rate": reused / self.requests if self.requests else 0.0,
+                "queued": self.queued,
+                "in_flight": self.in_flight,
+                "peak_in_flight": self.peak_in_flight,
+                "max_connections": self.max_connections,
+                "errors": self.errors
+            }
+
+
+class _TrackedStream(httpx.SyncByteStream):
+    """响应体读完（关闭）时释放在途计数"""
+
+    def __init__(self, stream: httpx.SyncByteStream, on_close):
+        self._stream = stream
+        self._on_close = on_close
+
+    def __iter__(self):
+        yield from self._stream
+
+    def close(self):
+        try:
+            self._stream.close()
+        finally:
+            self._on_close()
+
+
+class _AsyncTrackedStream(httpx.AsyncByteStream):
+    def __init__(self, stream: httpx.AsyncByteStream, on_close):
+        self._stream = stream
+        self._on_close = on_close
+
+    async def __aiter__(self):
+        async for chunk in self._stream:
+            yield chunk
+
+    async def aclose(self):
+        try:
+            await self._stream.aclose()
+        finally:
+            self._on_close()
+
+
+def _once(fn):
+    called = False
+
+    def wrapper():
+        nonlocal called
+        if not called:
+            called = True
+            fn()
+    return wrapper
+
+
+class InstrumentedTransport(httpx.HTTPTransport):
+    """记录请求、新建连接与排队情况的HTTP传输"""
+
+    def __init__(self, stats: PoolStats, **kwargs):
+        super().__init__(**kwargs)
+        self.pool_stats = stats
+
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        self.pool_stats.acquire()
+        try:
+            response = super().handle_request(request)
+        except Exception:
+            self.pool_stats.release(error=True)
+            raise
+        self.pool_stats.observe_connections(self._pool.connections)
+        response.stream = _TrackedStream(response.stream, _once(self.pool_stats.release))
+        return response
+
+
+class AsyncInstrumentedTransport(httpx.AsyncHTTPTransport):
+    """InstrumentedTransport 的异步版本"""
+
+    def __init__(self, stats: PoolStats, **kwargs):
+        super().__init__(**kwargs)
+        self.pool_stats = stats
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        self.pool_stats.acquire()
+        try:
+            response = await super().handle_async_request(request)
+        except Exception:
+            self.pool_stats.release(error=True)
+            raise
+        self.pool_stats.observe_connections(self._pool.connections)
+        response.stream = _AsyncTrackedStream(response.stream, _once(self.pool_stats.release))
+        return response
+
+
+class SharedHTTPClient(httpx.Client):
+    """进程内共享的同步客户端，close()不关闭连接池"""
+
+    def close(self):
+        pass
+
+    def shutdown(self):
+        super().close()
+
+
+class SharedAsyncHTTPClient(httpx.AsyncClient):
+    """进程内共享的异步客户端，aclose()不关闭连接池"""
+
+    async def aclose(self):
+        pass
+
+    async def shutdown(self):
+        await super().aclose()
+
+
+def _client_kwargs(config: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        "timeout": httpx.Timeout(config['timeout'], connect=config['connect_timeout'], pool=config['pool_timeout']),
+    }
+
+
+def _transport_kwargs(config: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        "http2": config['http2'],
+        "limits": httpx.Limits(
+            max_connections=config['max_connections'],
+            max_keepalive_connections=config['max_keepalive_connections'],
+            keepalive_expiry=config['keepalive_expiry']
+        ),
+    }
+
+
+_lock = threading.Lock()
+_simulator = None
+_simulator_lock = threading.Lock()
+_http_client: Optional[SharedHTTPClient] = None
+# 异步连接池绑定创建时的事件循环，每个事件循环一个
+_async_http_clients: "weakref.WeakKeyDictionary[Any, SharedAsyncHTTPClient]" = weakref.WeakKeyDictionary()
+_no_loop_client: Optional[SharedAsyncHTTPClient] = None
+
+
+def get_llm_simulator():
+    """进程内共享的LLM模拟器（同步与异步连接池共用，统计合并）"""
+    global _simulator
+    with _simulator_lock:
+        if _simulator is None:
+            from .llm_simulator import LLMSimulator
+            _simulator = LLMSimulator(Config.get_inference_config().get('llm', {}).get('simulator', {}))
+            logger.warning("LLM后端为simulator，所有LLM响应均为模拟数据")
+        return _simulator
+
+
+def _create_transport(config: Dict[str, Any], asynchronous: bool):
+    if load_backend() == "simulator":
+        from .llm_simulator import SimulatorTransport, AsyncSimulatorTransport
+        transport_cls = AsyncSimulatorTransport if asynchronous else SimulatorTransport
+        return transport_cls(get_llm_simulator(), config['max_connections'])
+    transport_cls = AsyncInstrumentedTransport if asynchronous else InstrumentedTransport
+    return transport_cls(PoolStats(config['max_connections']), **_transport_kwargs(config))
+
+
+def get_llm_http_client() -> SharedHTTPClient:
+    """获取进程内共享的同步LLM HTTP客户端"""
+    global _http_client
+    with _lock:
+        if _http_client is None:
+            config = load_transport_config()
+            transport = _create_transport(config, asynchronous=False)
+            _http_client = SharedHTTPClient(transport=transport, **_client_kwargs(config))
+            logger.info(f"LLM连接池已创建 (HTTP/2: {config['http2']}, 最大连接数: {config['max_connections']})")
+        return _http_client
+
+
+def get_async_llm_http_client() -> SharedAsyncHTTPClient:
+    """获取当前事件循环共享的异步LLM HTTP客户端（无运行中的事件循环时为进程级实例）"""
+    global _no_loop_client
+    try:
+        loop = asyncio.get_running_loop()
+    except RuntimeError:
+        loop = None
+    with _lock:
+        client = _async_http_clients.get(loop) if loop is not None else _no_loop_client
+        if client is None:
+            config = load_transport_config()
+            transport = _create_transport(config, asynchronous=True)
+            client = SharedAsyncHTTPClient(transport=transport, **_client_kwargs(config))
+            if loop is not None:
+                _async_http_clients[loop] = client
+            else:
+                _no_loop_client = client
+            logger.info(f"异步LLM连接池已创建 (HTTP/2: {config['http2']}, 最大连接数: {config['max_connections']})")
+        return client
+
+
+def llm_transport_stats() -> Dict[str, Any]:
+    """各共享连接池的统计"""
+    with _lock:
+        async_clients = list(_async_http_clients.values())
+        if _no_loop_client is not None:
+            async_clients.append(_no_loop_client)
+        sync_client = _http_client
+    stats = {
+        "backend": load_backend(),
+        "sync": sync_client._transport.pool_stats.stats() if sync_client else None,
+        "async": [client._transport.pool_stats.stats() for client in async_clients]
+    }
+    if _simulator is not None:
+        stats["simulator"] = _simulator.stats()
+    return stats
+
+
+async def close_llm_http_clients():
+    """关闭全部共享连接池（进程退出前调用）"""
+    global _http_client, _no_loop_client
+    with _lock:
+        clients = list(_async_http_clients.values())
+        if _no_loop_client is not None:
+            clients.append(_no_loop_client)
+        _async_http_clients.clear()
+        _no_loop_client = None
+        sync_client, _http_client = _http_client, None
+    for client in clients:
+        try:
+            await client.shutdown()
+        except Exception as e:
+            # 其它（已结束的）事件循环创建的连接池
+            logger.warning(f"关闭LLM连接池失败: {str(e)}")
+    if sync_client is not None:
+        sync_client.shutdown()
@@ -0,0 +1,349 @@
+"""LLM调用限流
+
+进程内共享的限流器，推理引擎（同步线程池与异步事件循环）和疾病抽取任务都通过它发出LLM请求：
+- 令牌桶：按每分钟请求数（RPM）与每分钟token数（TPM）平滑发送速率；
+  token按请求前的估算值预扣，拿到响应中的usage后按实际用量补扣或退还
+- AIMD并发窗口：请求成功时窗口加性增长（约每个窗口的请求全部成功增长 additive_increase），
+  遇到429或超时时乘性减小（乘以 decrease_factor），使并发稳定在服务端的真实上限附近
+
+配置见 config.yaml 的 inference.llm.rate_limit。
+"""
+
+import asyncio
+import collections
+import logging
+import threading
+import time
+from typing import Any, Deque, Dict, List, Optional
+
+import httpx
+
+from .config import Config
+
+logger = logging.getLogger(__name__)
+
+# 请求结果分类
+SUCCESS = "success"
+THROTTLED = "throttled"
+TIMEOUT = "timeout"
+ERROR = "error"
+
+
+def estimate_tokens(messages: List[Dict[str, str]]) -> int:
+    """粗略估算消息的token数（中文约每2字符1个token），用于令牌桶预扣"""
+    return max(1, sum(len(message.get("content") or "") for message in messages) // 2)
+
+
+def classify_exception(exc: BaseException) -> str:
+    """将LLM请求异常归类为 throttled / timeout / error"""
+    status = getattr(exc, "status_code", None)
+    if status is None and isinstance(exc, httpx.HTTPStatusError):
+        status = exc.response.status_code
+    if status == 429:
+        return THROTTLED
+    name = type(exc).__name__
+    if isinstance(exc, (httpx.TimeoutException, asyncio.TimeoutError, TimeoutError)) or name == "APITimeoutError":
+        return TIMEOUT
+    return ERROR
+
+
+class TokenBucket:
+    """令牌桶（线程安全）
+
+    采用预约方式：reserve() 立即扣减（余额可为负）并返回需要等待的秒数，
+    调用方自行 time.sleep / asyncio.sleep，同步与异步调用方可共用同一个桶。
+    """
+
+    def __init__(self, per_minute: float, burst: Optional[float] = None):
+        self.rate = per_minute / 60.0
+        self.capacity = burst or per_minute
+        self.tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def reserve(self, amount: float) -> float:
+        """扣减amount个令牌，返回需要等待的秒数"""
+        with self._lock:
+            self._refill()
+            self.tokens -= amount
+            return -self.tokens / self.rate if self.tokens < 0 else 0.0
+
+    def adjust(self, delta: float):
+        """补扣（delta>0）或退还（delta<0）令牌"""
+        with self._lock:
+            self._refill()
+            self.tokens = min(self.capacity, self.tokens - delta)
+
+    def available(self) -> float:
+        with self._lock:
+            self._refill()
+            return self.tokens
+
+
+class _SyncWaiter:
+    def __init__(self):
+        self.event = threading.Event()
+
+    def grant(self):
+        self.event.set()
+
+
+class _AsyncWaiter:
+    def __init__(self, loop: asyncio.AbstractEventLoop):
+        self.loop = loop
+        self.future = loop.create_future()
+
+    def grant(self):
+        def _set():
+            if not self.future.done():
+                self.future.set_result(None)
+        self.loop.call_soon_threadsafe(_set)
+
+
+class Permit:
+    """一次LLM请求的许可，由 LLMRateLimiter.limit()/limit_async() 产生
+
+    请求结束时根据异常自动归类结果；未抛异常但服务端返回429（如直接使用httpx）时调用 mark_throttled()。
+    """
+
+    def __init__(self, estimated_tokens: int):
+        self.estimated_tokens = estimated_tokens
+        self.actual_tokens: Optional[int] = None
+        self.outcome = SUCCESS
+
+    def record_usage(self, total_tokens: Optional[int]):
+        """记录响应usage中的实际token数"""
+        if total_tokens:
+            self.actual_tokens = total_tokens
+
+    def mark_throttled(self):
+        self.outcome = THROTTLED
+
+    def mark_timeout(self):
+        self.outcome = TIMEOUT
+
+
+class _PermitContext:
+    def __init__(self, limiter: "LLMRateLimiter", estimated_tokens: int):
+        self.limiter = limiter
+        self.permit = Permit(estimated_tokens)
+
+    def __enter__(self) -> Permit:
+        self.limiter._acquire(self.permit.estimated_tokens)
+        return self.permit
+
+    def __exit__(self, exc_type, exc, tb):
+        self.limiter._finish(self.permit, exc)
+
+    async def __aenter__(self) -> Permit:
+        await self.limiter._acquire_async(self.permit.estimated_tokens)
+        return self.permit
+
+    async def __aexit__(self, exc_type, exc, tb):
+        self.limiter._finish(self.permit, exc)
+
+
+class LLMRateLimiter:
+    """RPM/TPM令牌桶 + AIMD自适应并发窗口（线程与事件循环共用）"""
+
+    def __init__(
+        self,
+        requests_per_minute: Optional[float] = None,
+        tokens_per_minute: Optional[float] = None,
+        initial_concurrency: int = 8,
+        min_concurrency: int = 1,
+        max_concurrency: int = 64,
+        additive_increase: float = 1.0,
+        decrease_factor: float = 0.5,
+        decrease_cooldown: float = 2.0
+    ):
+        """初始化限流器
+
+        Args:
+            requests_per_minute: 每分钟请求数上限，None或0表示不限
+            tokens_per_minute: 每分钟token数上限，None或0表示不限
+            initial_concurrency: 初始并发窗口
+            min_concurrency / max_concurrency: 并发窗口上下限
+            additive_increase: 每个窗口的请求全部成功后窗口的增量
+            decrease_factor: 遇到429或超时时窗口的缩减系数
+            decrease_cooldown: 两次缩减的最小间隔（秒），同一波拥塞只缩减一次
+        """
+        self.request_bucket = TokenBucket(requests_per_minute) if requests_per_minute else None
+        self.token_bucket = TokenBucket(tokens_per_minute) if tokens_per_minute else None
+        self.min_concurrency = min_concurrency
+        self.max_concurrency = max_concurrency
+        self.additive_increase = additive_increase
+        self.decrease_factor = decrease_factor
+        self.decrease_cooldown = decrease_cooldown
+
+        self.window = float(max(min_concurrency, min(initial_concurrency, max_concurrency)))
+        self.in_flight = 0
+        self._waiters: Deque[Any] = collections.deque()
+        self._last_decrease = 0.0
+        self._lock = threading.Lock()
+
+        self.outcomes = {SUCCESS: 0, THROTTLED: 0, TIMEOUT: 0, ERROR: 0}
+        self.decreases = 0
+        self.rate_wait_seconds = 0.0
+
+    @classmethod
+    def from_config(cls, config: Dict[str, Any]) -> "LLMRateLimiter":
+        """根据 inference.llm.rate_limit 配置创建"""
+        return cls(
+            requests_per_minute=config.get('requests_per_minute'),
+            tokens_per_minute=config.get('tokens_per_minute'),
+            initial_concurrency=config.get('initial_concurrency', 8),
+            min_concurrency=config.get('min_concurrency', 1),
+            max_concurrency=config.get('max_concurrency', 64),
+            additive_increase=config.get('additive_increase', 1.0),
+            decrease_factor=config.get('decrease_factor', 0.5),
+            decrease_cooldown=config.get('decrease_cooldown', 2.0)
+        )
+
+    def cap_concurrency(self, max_concurrency: int):
+        """收紧并发窗口上限（如批处理任务的 --concurrency）"""
+        with self._lock:
+            self.max_concurrency = max(self.min_concurrency, min(self.max_concurrency, max_concurrency))
+            self.window = min(self.window, self.max_concurrency)
+
+    def limit(self, estimated_tokens: int = 1) -> _PermitContext:
+        """同步调用方使用：with limiter.limit(n) as permit: ..."""
+        return _PermitContext(self, estimated_tokens)
+
+    def limit_async(self, estimated_tokens: int = 1) -> _PermitContext:
+        """异步调用方使用：async with limiter.limit_async(n) as permit: ..."""
+        return _PermitContext(self, estimated_tokens)
+
+    # ---- 速率 ----
+
+    def _reserve_rate(self, estimated_tokens: int) -> float:
+        wait = 0.0
+        if self.request_bucket:
+            wait = max(wait, self.request_bucket.reserve(1))
+        if self.token_bucket:
+            wait = max(wait, self.token_bucket.reserve(estimated_tokens))
+        if wait:
+            with self._lock:
+                self.rate_wait_seconds += wait
+        return wait
+
+    def _refund_rate(self, estimated_tokens: int):
+        if self.request_bucket:
+            self.request_bucket.adjust(-1)
+        if self.token_bucket:
+            self.token_bucket.adjust(-estimated_tokens)
+
+    # ---- 并发窗口 ----
+
+    def _try_acquire_slot(self, waiter) -> bool:
+        """有空闲并发槽且无人排队时占用，否则加入等待队列（调用方持有锁）"""
+        if not self._waiters and self.in_flight < int(self.window):
+            self.in_flight += 1
+            return True
+        self._waiters.append(waiter)
+        return False
+
+    def _dispatch(self):
+        """按窗口大小把空闲槽位交给排队者（调用方持有锁）"""
+        while self._waiters and self.in_flight < int(self.window):
+            self.in_flight += 1
+            self._waiters.popleft().grant()
+
+    def _abandon(self, waiter):
+        """排队者放弃等待：仍在队列中则移除，已被授予槽位则归还"""
+        with self._lock:
+            try:
+                self._waiters.remove(waiter)
+            except ValueError:
+                self.in_flight -= 1
+                self._dispatch()
+
+    def _acquire(self, estimated_tokens: int):
+        wait = self._reserve_rate(estimated_tokens)
+        if wait:
+            time.sleep(wait)
+        waiter = _SyncWaiter()
+        with self._lock:
+            if self._try_acquire_slot(waiter):
+                return
+        waiter.event.wait()
+
+    async def _acquire_async(self, estimated_tokens: int):
+        wait = self._reserve_rate(estimated_tokens)
+        if wait:
+            try:
+                await asyncio.sleep(wait)
+            except asyncio.CancelledError:
+                self._refund_rate(estimated_tokens)
+                raise
+        waiter = _AsyncWaiter(asyncio.get_running_loop())
+        with self._lock:
+            if self._try_acquire_slot(waiter):
+                return
+        try:
+            await waiter.future
+        except asyncio.CancelledError:
+            self._abandon(waiter)
+            self._refund_rate(estimated_tokens)
+            raise
+
+    def _finish(self, permit: Permit, exc: Optional[BaseException]):
+        outcome = permit.outcome
+        if exc is not None:
+            outcome = ERROR if isinstance(exc, asyncio.CancelledError) else classify_exception(exc)
+        if self.token_bucket and permit.actual_tokens is not None:
+            self.token_bucket.adjust(permit.actual_tokens - permit.estimated_tokens)
+
+        with self._lock:
+            self.in_flight -= 1
+            self.outcomes[outcome] += 1
+            if outcome == SUCCESS:
+                self.window = min(self.max_concurrency, self.window + self.additive_increase / self.window)
+            elif outcome in (THROTTLED, TIMEOUT):
+                now = time.monotonic()
+                if now - self._last_decrease >= self.decrease_cooldown:
+                    self._last_decrease = now
+                    self.decreases += 1
+                    previous = self.window
+                    self.window = max(self.min_concurrency, self.window * self.decrease_factor)
+                    logger.warning(f"LLM请求{outcome}，并发窗口 {previous:.1f} -> {self.window:.1f}")
+            self._dispatch()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = {
+                "window": round(self.window, 2),
+                "in_flight": self.in_flight,
+                "waiting": len(self._waiters),
+                "outcomes": dict(self.outcomes),
+                "decreases": self.decreases,
+                "rate_wait_seconds": round(self.rate_wait_seconds, 3)
+            }
+        stats["requests_available"] = round(self.request_bucket.available(), 1) if self.request_bucket else None
+        stats["tokens_available"] = round(self.token_bucket.available(), 1) if self.token_bucket else None
+        return stats
+
+
+_rate_limiter: Optional[LLMRateLimiter] = None
+_rate_limiter_lock = threading.Lock()
+
+
+def get_llm_rate_limiter() -> Optional[LLMRateLimiter]:
+    """获取进程内共享的LLM限流器
+
+    根据config.yaml中的 inference.llm.rate_limit 创建，未启用时返回None。
+    """
+    global _rate_limiter
+    if _rate_limiter is None:
+        with _rate_limiter_lock:
+            if _rate_limiter is None:
+                limit_config = Config.get_inference_config().get('llm', {}).get('rate_limit', {})
+                if not limit_config.get('enabled', False):
+                    return None
+                _rate_limiter = LLMRateLimiter.from_config(limit_config)
+    return _rate_limiter
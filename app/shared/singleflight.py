@@ -0,0 +1,131 @@
+"""进行中请求合并（single-flight）
+
+相同键的并发调用只执行一次：第一个到达的调用（leader）执行计算，
+计算期间到达的调用等待并共享同一结果（或同一异常）。计算结束后键即释放，
+之后的调用重新计算——长期复用由结果缓存负责，这里只合并同时进行的重复请求。
+"""
+
+import asyncio
+import threading
+from concurrent.futures import Future
+from typing import Any, Awaitable, Callable, Dict, Hashable, Tuple
+
+
+class _FlightCounters:
+    """合并统计"""
+
+    def __init__(self):
+        self.leaders = 0      # 实际执行的计算次数
+        self.coalesced = 0    # 被合并（未单独执行）的调用次数
+        self.waiting = 0      # 当前正在等待leader的调用数
+
+    def stats(self, in_flight: int) -> Dict[str, Any]:
+        calls = self.leaders + self.coalesced
+        return {
+            "in_flight": in_flight,
+            "waiting": self.waiting,
+            "leaders": self.leaders,
+            "coalesced": self.coalesced,
+            "coalesce_rate": self.coalesced / calls if calls else 0.0
+        }
+
+
+class SingleFlight(_FlightCounters):
+    """线程版single-flight（供同步推理引擎的线程池使用）"""
+
+    def __init__(self):
+        super().__init__()
+        self._lock = threading.Lock()
+        self._calls: Dict[Hashable, Future] = {}
+
+    def do(self, key: Hashable, fn: Callable[[], Any]) -> Tuple[Any, bool]:
+        """执行或等待相同键的计算
+
+        Returns:
+            Tuple[Any, bool]: (结果, 是否为共享的结果)；共享结果与leader为同一对象，调用方修改前需复制
+        """
+        with self._lock:
+            future = self._calls.get(key)
+            leader = future is None
+            if leader:
+                future = self._calls[key] = Future()
+                self.leaders += 1
+            else:
+                self.coalesced += 1
+                self.waiting += 1
+
+        if not leader:
+            try:
+                return future.result(), True
+            finally:
+                with self._lock:
+                    self.waiting -= 1
+
+        try:
+            result = fn()
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(result)
+            return result, False
+        finally:
+            with self._lock:
+                del self._calls[key]
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return super().stats(len(self._calls))
+
+
+class _AsyncCall:
+    def __init__(self, task: asyncio.Task):
+        self.task = task
+        self.waiters = 0
+
+
+class AsyncSingleFlight(_FlightCounters):
+    """协程版single-flight（同一事件循环内使用）
+
+    计算在独立的任务中执行，某个调用方被取消（如客户端断开）不影响其它等待者；
+    所有调用方都取消后才取消计算本身。
+    """
+
+    def __init__(self):
+        super().__init__()
+        self._calls: Dict[Hashable, _AsyncCall] = {}
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[Any]]) -> Tuple[Any, bool]:
+        """执行或等待相同键的计算
+
+        Returns:
+            Tuple[Any, bool]: (结果, 是否为共享的结果)；共享结果与leader为同一对象，调用方修改前需复制
+        """
+        call = self._calls.get(key)
+        shared = call is not None
+        if call is None:
+            call = self._calls[key] = _AsyncCall(asyncio.ensure_future(fn()))
+            call.task.add_done_callback(lambda _: self._release(key, call))
+            self.leaders += 1
+        else:
+            self.coalesced += 1
+            self.waiting += 1
+
+        call.waiters += 1
+        try:
+            return await asyncio.shield(call.task), shared
+        except asyncio.CancelledError:
+            if call.waiters == 1 and not call.task.done():
+                call.task.cancel()
+            raise
+        finally:
+            call.waiters -= 1
+            if shared:
+                self.waiting -= 1
+
+    def _release(self, key: Hashable, call: _AsyncCall):
+        if self._calls.get(key) is call:
+            del self._calls[key]
+
+    def stats(self) -> Dict[str, Any]:
+        return super().stats(len(self._calls))
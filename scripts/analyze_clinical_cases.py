@@ -5,7 +5,7 @@ import sys
 import csv
 import json
 from pathlib import Path
-from typing import Dict, Any
+from typing import Dict, Any, Optional
 from tqdm import tqdm
 from datetime import datetime
 
@@ -19,29 +19,19 @@ load_env()
 # 加载inference配置
 inference_config = Config.get_inference_config()
 
-def analyze_clinical_case(engine: InferenceEngine, row: Dict[str, str]) -> Dict[str, Any]:
-    """分析单个临床病例
+def build_case_input(row: Dict[str, str]) -> Optional[Dict[str, Any]]:
+    """根据CSV行数据构建推理输入（快速模式：直接使用drug_name和disease_name）
     
-    Args:
-        engine: 推理引擎
-        row: CSV行数据
-        
     Returns:
-        分析结果
+        输入数据，缺少疾病或药品名称时返回None
     """
-    # 构建输入数据
     disease_name = row.get('罕见病适应症', '').strip()
     drug_name = row.get('标化后药名', '').strip()
     
     if not disease_name or not drug_name:
-        return {
-            'error': '缺少疾病或药品名称',
-            'disease': disease_name,
-            'drug': drug_name
-        }
+        return None
     
-    # 构建输入（快速模式：直接使用drug_name和disease_name）
-    input_data = {
+    return {
         'drug_name': drug_name,
         'disease_name': disease_name,
         'description': f"患者诊断为{disease_name}，拟使用{drug_name}治疗",
@@ -53,6 +43,28 @@ def analyze_clinical_case(engine: InferenceEngine, row: Dict[str, str]) -> Dict[
             'drug': drug_name
         }
     }
+
+def missing_name_result(row: Dict[str, str]) -> Dict[str, Any]:
+    """缺少疾病或药品名称时的错误结果"""
+    return {
+        'error': '缺少疾病或药品名称',
+        'disease': row.get('罕见病适应症', '').strip(),
+        'drug': row.get('标化后药名', '').strip()
+    }
+
+def analyze_clinical_case(engine: InferenceEngine, row: Dict[str, str]) -> Dict[str, Any]:
+    """分析单个临床病例
+    
+    Args:
+        engine: 推理引擎
+        row: CSV行数据
+        
+    Returns:
+        分析结果
+    """
+    input_data = build_case_input(row)
+    if input_data is None:
+        return missing_name_result(row)
     
     try:
         # 调用推理引擎（快速模式）
@@ -62,8 +74,8 @@ def analyze_clinical_case(engine: InferenceEngine, row: Dict[str, str]) -> Dict[
     except Exception as e:
         return {
             'error': str(e),
-            'disease': disease_name,
-            'drug': drug_name
+            'disease': input_data['disease_name'],
+            'drug': input_data['drug_name']
         }
 
 def main():
@@ -76,6 +88,8 @@ def main():
                        help='输出JSONL文件')
     parser.add_argument('--use-full-dataset', action='store_true',
                        help='使用完整数据集而非评估数据集')
+    parser.add_argument('--concurrency', type=int, default=None,
+                       help='并发分析的病例数（默认读取config.yaml中的inference.batch.max_concurrency）')
     
     args = parser.parse_args()
     
@@ -122,37 +136,51 @@ def main():
         print("已取消")
         return
     
-    # 分析每一行
-    print(f"\n开始分析...")
+    # 分批并发分析（每批完成后写入，保持输出顺序并支持中途查看结果）
+    concurrency = args.concurrency or engine.batch_max_concurrency
+    chunk_size = max(concurrency * 4, 10)
+    print(f"\n开始分析 (并发数: {concurrency})...")
     results = []
     
-    with open(output_file, 'w', encoding='utf-8') as f:
-        for idx, row in enumerate(tqdm(rows, desc="分析进度"), 1):
-            # 分析
-            result = analyze_clinical_case(engine, row)
+    with open(output_file, 'w', encoding='utf-8') as f, tqdm(total=len(rows), desc="分析进度") as pbar:
+        for chunk_start in range(0, len(rows), chunk_size):
+            chunk_rows = rows[chunk_start:chunk_start + chunk_size]
+            inputs = [build_case_input(row) for row in chunk_rows]
             
-            # 添加原始数据
-            output_row = {
-                'row_number': idx,
-                'disease_id': row.get('disease_id', ''),
-                'disease_name': row.get('罕见病适应症', ''),
-                'drug_id': row.get('drug_id', ''),
-                'drug_name': row.get('标化后药名', ''),
-                'manual_judgment': row.get('是否超适应症', ''),
-                'system_analysis': result,
-                'analysis_time': datetime.now().isoformat()
-            }
+            batch_results = iter(engine.analyze_batch(
+                [input_data for input_data in inputs if input_data is not None],
+                max_concurrency=concurrency,
+                progress_callback=lambda *_: pbar.update(1)
+            ))
             
-            # 写入JSONL
-            f.write(json.dumps(output_row, ensure_ascii=False) + '\n')
-            f.flush()
-            
-            results.append(output_row)
+            for offset, (row, input_data) in enumerate(zip(chunk_rows, inputs)):
+                if input_data is None:
+                    result = missing_name_result(row)
+                    pbar.update(1)
+                else:
+                    result = next(batch_results)
+                
+                idx = chunk_start + offset + 1
+                
+                # 添加原始数据
+                output_row = {
+                    'row_number': idx,
+                    'disease_id': row.get('disease_id', ''),
+                    'disease_name': row.get('罕见病适应症', ''),
+                    'drug_id': row.get('drug_id', ''),
+                    'drug_name': row.get('标化后药名', ''),
+                    'manual_judgment': row.get('是否超适应症', ''),
+                    'system_analysis': result,
+                    'analysis_time': datetime.now().isoformat()
+                }
+                
+                # 写入JSONL
+                f.write(json.dumps(output_row, ensure_ascii=False) + '\n')
+                results.append(output_row)
             
-            # 每10个显示一次进度
-            if idx % 10 == 0:
-                success = len([r for r in results if 'error' not in r['system_analysis']])
-                print(f"\n已处理 {idx}/{len(rows)}, 成功 {success}")
+            f.flush()
+            success = len([r for r in results if 'error' not in r['system_analysis']])
+            print(f"\n已处理 {len(results)}/{len(rows)}, 成功 {success}")
     
     # 统计
     print("\n" + "="*80)
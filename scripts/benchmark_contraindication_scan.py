@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+"""对比禁忌症检查：逐条子串循环 vs Aho-Corasick自动机
+
+对每种禁忌症列表长度，扫描同一批诊断名称+病例描述，对比：
+- 原实现（每条禁忌症 `in` 一次，O(禁忌症数 × 文本长度)）
+- 自动机冷启动（每次编译+扫描，即LRU未命中）
+- 自动机热缓存（按药品ID命中LRU，只扫描）
+并校验两种实现的命中结果一致。
+
+默认使用合成数据，不依赖ES；--es 时另从drugs索引抽取禁忌症最多的药品。
+"""
+
+import argparse
+import random
+import statistics
+import sys
+import time
+from typing import List
+
+sys.path.insert(0, '.')
+
+from app.inference.contraindication_scanner import ContraindicationScanner
+
+# 合成禁忌症与文本的词表
+TERMS = ['过敏', '肾功能不全', '肝功能不全', '妊娠', '哺乳期', '心力衰竭', '低血压', '哮喘',
+         '消化道溃疡', '出血倾向', '严重感染', '糖尿病酮症酸中毒', '甲状腺功能亢进', '癫痫',
+         '青光眼', '重症肌无力', '房室传导阻滞', '低钾血症', '高钾血症', '血小板减少']
+FILLER = '患者男性65岁因胸闷气短入院既往体健否认药物过敏史查体血压正常心率规整'
+
+
+def loop_check(contraindications: List[str], *texts: str) -> List[str]:
+    """原实现：逐条禁忌症做子串查找"""
+    hits = []
+    for text in texts:
+        text = text.lower()
+        for contraindication in contraindications:
+            if contraindication.lower() in text and contraindication not in hits:
+                hits.append(contraindication)
+    return [c for c in contraindications if c in hits]
+
+
+def synthetic_contraindications(size: int, rng: random.Random) -> List[str]:
+    items = []
+    while len(items) < size:
+        name = rng.choice(TERMS) + (rng.choice(TERMS) if rng.random() < 0.5 else '') + str(len(items))
+        items.append(name if rng.random() < 0.8 else f"{name}患者禁用")
+    return items
+
+
+def synthetic_texts(contraindications: List[str], count: int, rng: random.Random) -> List[tuple]:
+    texts = []
+    for _ in range(count):
+        diagnosis = rng.choice(contraindications) if rng.random() < 0.2 else rng.choice(TERMS)
+        description = ''.join(rng.choice([FILLER, rng.choice(TERMS)]) for _ in range(8))
+        if rng.random() < 0.3:
+            description += rng.choice(contraindications)
+        texts.append((diagnosis, description))
+    return texts
+
+
+def es_contraindication_lists(size: int) -> List[List[str]]:
+    """从drugs索引抽取禁忌症条目最多的药品"""
+    from app.shared import get_es_client
+    es = get_es_client()
+    result = es.search(index='drugs', body={
+        "query": {"exists": {"field": "contraindications"}},
+        "_source": ["contraindications"],
+        "size": size * 10
+    })
+    lists = [hit['_source'].get('contraindications') or [] for hit in result['hits']['hits']]
+    lists = [items for items in lists if isinstance(items, list)]
+    return sorted(lists, key=len, reverse=True)[:size]
+
+
+def timed(fn, texts) -> float:
+    """返回每个病例的平均耗时（微秒）"""
+    start = time.perf_counter()
+    for diagnosis, description in texts:
+        fn(diagnosis, description)
+    return (time.perf_counter() - start) / len(texts) * 1e6
+
+
+def run(label: str, contraindications: List[str], texts: List[tuple], repeat: int):
+    scanner = ContraindicationScanner(min_patterns=1)
+    mismatches = sum(
+        loop_check(contraindications, d, t) != scanner.scan("drug", contraindications, d, t)
+        for d, t in texts
+    )
+
+    loop_us, cold_us, warm_us = [], [], []
+    for _ in range(repeat):
+        loop_us.append(timed(lambda d, t: loop_check(contraindications, d, t), texts))
+        cold_us.append(timed(lambda d, t: scanner.scan(None, contraindications, d, t), texts))
+        warm_us.append(timed(lambda d, t: scanner.scan("drug", contraindications, d, t), texts))
+
+    loop, cold, warm = (statistics.median(v) for v in (loop_us, cold_us, warm_us))
+    print(f"{label:<16} 循环={loop:9.1f}µs  自动机冷={cold:9.1f}µs  自动机热={warm:9.1f}µs  "
+          f"加速={loop / warm:6.1f}x  不一致={mismatches}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="对比禁忌症子串循环与Aho-Corasick自动机")
+    parser.add_argument('--sizes', default='10,100,500,2000', help='合成禁忌症列表长度（逗号分隔）')
+    parser.add_argument('--cases', type=int, default=500, help='每种长度的病例数')
+    parser.add_argument('--repeat', type=int, default=5, help='重复次数（取中位数）')
+    parser.add_argument('--es', type=int, default=0, help='从drugs索引抽取的药品数（0表示不使用ES）')
+    parser.add_argument('--seed', type=int, default=42, help='随机种子')
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    print("=" * 100)
+    print(f"每病例平均耗时（诊断名称 + 病例描述），{args.cases} 个病例，重复 {args.repeat} 次取中位数")
+    for size in (int(s) for s in args.sizes.split(',') if s.strip()):
+        contraindications = synthetic_contraindications(size, rng)
+        run(f"合成 {size} 条", contraindications, synthetic_texts(contraindications, args.cases, rng), args.repeat)
+
+    if args.es > 0:
+        for i, contraindications in enumerate(es_contraindication_lists(args.es)):
+            if contraindications:
+                run(f"ES药品#{i} {len(contraindications)} 条", contraindications,
+                    synthetic_texts(contraindications, args.cases, rng), args.repeat)
+    print("=" * 100)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+"""对比药品名称模糊匹配：ES模糊查询 vs 本地n-gram索引
+
+两条路径使用相同的名称验证规则，对比：
+- 单次查询延迟（p50/p95/平均）
+- 批量查询吞吐
+- top-1结果一致率（两边都无匹配也计为一致）
+
+查询名称默认取 test_entity_matching.py 的测试案例，
+另从drugs索引随机抽取药品名并去掉剂型后缀/盐名前缀作为模糊查询。
+"""
+
+import argparse
+import random
+import statistics
+import sys
+import time
+from typing import Dict, List
+
+sys.path.insert(0, '.')
+sys.path.insert(0, 'scripts')
+
+from app.inference.entity_matcher import EntityRecognizer
+from app.inference.name_resolver import NameResolver, strip_dosage_forms
+from test_entity_matching import TEST_CASES
+
+# 抽样名称去掉的常见盐名/剂型前缀
+NAME_PREFIXES = ['注射用', '盐酸', '硫酸', '酒石酸', '马来酸', '枸橼酸', '复方']
+
+
+def sample_queries(es, index: str, size: int, seed: int) -> List[str]:
+    """从药品索引随机抽取名称并去掉剂型后缀与盐名前缀"""
+    result = es.search(index=index, body={
+        "query": {"function_score": {"random_score": {"seed": seed, "field": "_seq_no"}}},
+        "_source": ["name"],
+        "size": size
+    })
+    queries = []
+    for hit in result['hits']['hits']:
+        name = strip_dosage_forms(hit['_source'].get('name') or '')
+        for prefix in NAME_PREFIXES:
+            if name.startswith(prefix) and len(name) > len(prefix) + 1:
+                name = name[len(prefix):]
+        if name:
+            queries.append(name)
+    return queries
+
+
+def percentile(values: List[float], pct: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct))]
+
+
+def summarize(label: str, latencies: List[float]):
+    print(f"{label:<12} p50={percentile(latencies, 0.5):8.3f}ms  "
+          f"p95={percentile(latencies, 0.95):8.3f}ms  mean={statistics.mean(latencies):8.3f}ms")
+
+
+def top1_name(matches: List[Dict]) -> str:
+    return matches[0]['name'] if matches else ''
+
+
+def main():
+    parser = argparse.ArgumentParser(description="对比ES模糊查询与本地n-gram索引的药品名称匹配")
+    parser.add_argument('--sample', type=int, default=200, help='从drugs索引抽样的名称数')
+    parser.add_argument('--input', help='额外的查询名称文件（每行一个）')
+    parser.add_argument('--seed', type=int, default=42, help='抽样随机种子')
+    args = parser.parse_args()
+
+    recognizer = EntityRecognizer()
+    es = recognizer.es
+
+    queries = [case["drug"] for case in TEST_CASES]
+    if args.input:
+        with open(args.input, 'r', encoding='utf-8') as f:
+            queries.extend(line.strip() for line in f if line.strip())
+    if args.sample > 0:
+        queries.extend(sample_queries(es, recognizer.drugs_index, args.sample, args.seed))
+    random.Random(args.seed).shuffle(queries)
+    print(f"查询名称: {len(queries)} 个")
+
+    print("构建n-gram索引...")
+    start = time.perf_counter()
+    resolver = NameResolver(es=es, fuzzy=True)
+    resolver.load()
+    print(f"构建耗时: {time.perf_counter() - start:.1f}s, {resolver.stats()['fuzzy']}")
+
+    es_latencies, local_latencies = [], []
+    agreed = 0
+    disagreements = []
+    for query in queries:
+        start = time.perf_counter()
+        result = es.search(index=recognizer.drugs_index, body=recognizer._build_fuzzy_drug_query(query))
+        es_matches = recognizer._validate_fuzzy_drug_hits(query, result['hits']['hits'], unique=True)
+        es_latencies.append((time.perf_counter() - start) * 1000)
+
+        start = time.perf_counter()
+        local_matches = resolver.fuzzy_resolve(query, unique=True)
+        local_latencies.append((time.perf_counter() - start) * 1000)
+
+        if top1_name(es_matches) == top1_name(local_matches):
+            agreed += 1
+        else:
+            disagreements.append((query, top1_name(es_matches), top1_name(local_matches)))
+
+    start = time.perf_counter()
+    resolver._fuzzy_index.match_batch(queries, unique=True)
+    batch_seconds = time.perf_counter() - start
+
+    print("=" * 80)
+    print("单次查询延迟")
+    summarize("ES模糊查询", es_latencies)
+    summarize("n-gram索引", local_latencies)
+    print(f"n-gram批量: {len(queries)} 个名称 {batch_seconds * 1000:.1f}ms "
+          f"({len(queries) / batch_seconds:.0f} 个/秒)")
+    print(f"top-1一致率: {agreed}/{len(queries)} ({agreed / len(queries) * 100:.1f}%)")
+
+    if disagreements:
+        print("-" * 80)
+        print("不一致样例（查询 | ES | n-gram）:")
+        for query, es_name, local_name in disagreements[:20]:
+            print(f"  {query} | {es_name or '-'} | {local_name or '-'}")
+    print("=" * 80)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,170 @@
+#!/usr/bin/env python3
+"""推理引擎压测（配合LLM延迟模拟后端）
+
+以固定并发持续调用 AsyncInferenceEngine.analyze，统计：
+- 吞吐（请求/秒）与端到端延迟分位数（p50/p95/p99）
+- 降级比例（metadata.degraded，LLM超时/熔断/预算不足时返回规则结论）与错误数
+- 引擎运行统计：连接池、限流窗口、熔断、对冲、模拟后端的注入情况
+
+默认要求 config.yaml 中 inference.llm.backend 为 simulator，避免误对DeepSeek发起大量付费请求；
+实体对齐与知识增强仍查询ES，需要ES服务可用。
+结果缓存与请求合并默认关闭，保证每个请求都走到LLM。
+"""
+
+import argparse
+import asyncio
+import csv
+import json
+import random
+import statistics
+import sys
+import time
+from collections import Counter
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from app.inference.engine import AsyncInferenceEngine
+from app.shared import Config, close_llm_http_clients
+from app.shared.llm_transport import load_backend
+
+DEFAULT_INPUT = "data/raw/clinical_cases/evaluation_dataset.csv"
+
+# 没有评估数据集时使用的示例病例
+SAMPLE_CASES = [
+    ("美托洛尔", "高血压"),
+    ("美托洛尔", "心力衰竭"),
+    ("二甲双胍", "2型糖尿病"),
+    ("二甲双胍", "多囊卵巢综合征"),
+    ("阿司匹林", "冠心病"),
+    ("利妥昔单抗", "视神经脊髓炎"),
+]
+
+
+def load_cases(input_file: str) -> List[Dict[str, Any]]:
+    """从评估数据集（或同格式CSV）读取药品-疾病对"""
+    pairs = SAMPLE_CASES
+    if Path(input_file).exists():
+        with open(input_file, 'r', encoding='utf-8') as f:
+            rows = list(csv.DictReader(f))
+        pairs = [(row.get('标化后药名', '').strip(), row.get('罕见病适应症', '').strip()) for row in rows]
+        pairs = [(drug, disease) for drug, disease in pairs if drug and disease]
+    else:
+        print(f"{input_file} 不存在，使用内置的{len(SAMPLE_CASES)}个示例病例")
+    return [
+        {
+            'drug_name': drug,
+            'disease_name': disease,
+            'description': f"患者诊断为{disease}，拟使用{drug}治疗",
+        }
+        for drug, disease in pairs
+    ]
+
+
+def percentile(ordered: List[float], p: float) -> Optional[float]:
+    if not ordered:
+        return None
+    return ordered[min(len(ordered) - 1, max(0, int(round(p / 100 * len(ordered))) - 1))]
+
+
+async def run_load(engine: AsyncInferenceEngine, cases: List[Dict[str, Any]], requests: int,
+                   concurrency: int, deadline_ms: Optional[float], seed: int) -> Dict[str, Any]:
+    """以固定并发发出requests个分析请求"""
+    rng = random.Random(seed)
+    queue: asyncio.Queue = asyncio.Queue()
+    for _ in range(requests):
+        queue.put_nowait(rng.choice(cases))
+
+    latencies: List[float] = []
+    outcomes: Counter = Counter()
+    reasons: Counter = Counter()
+
+    async def worker():
+        while not queue.empty():
+            input_data = queue.get_nowait()
+            started = time.monotonic()
+            try:
+                result = await engine.analyze(dict(input_data), deadline_ms=deadline_ms)
+            except Exception as e:
+                outcomes['error'] += 1
+                reasons[type(e).__name__] += 1
+                continue
+            latencies.append(time.monotonic() - started)
+            metadata = result.get('metadata', {}) if isinstance(result, dict) else {}
+            if metadata.get('degraded'):
+                outcomes['degraded'] += 1
+                reasons[metadata.get('degraded_reason', 'unknown')] += 1
+            else:
+                outcomes['ok'] += 1
+
+    started = time.monotonic()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.monotonic() - started
+
+    ordered = sorted(latencies)
+    return {
+        'requests': requests,
+        'concurrency': concurrency,
+        'deadline_ms': deadline_ms,
+        'elapsed_s': round(elapsed, 2),
+        'throughput_rps': round(requests / elapsed, 2) if elapsed else None,
+        'latency_s': {
+            'mean': round(statistics.mean(ordered), 3) if ordered else None,
+            'p50': percentile(ordered, 50),
+            'p95': percentile(ordered, 95),
+            'p99': percentile(ordered, 99),
+            'max': ordered[-1] if ordered else None,
+        },
+        'outcomes': dict(outcomes),
+        'degraded_rate': outcomes['degraded'] / requests if requests else 0.0,
+        'error_rate': outcomes['error'] / requests if requests else 0.0,
+        'reasons': dict(reasons),
+    }
+
+
+async def main_async(args):
+    cases = load_cases(args.input)
+    engine = AsyncInferenceEngine(skip_entity_recognition=not args.full)
+    if not args.keep_caches:
+        engine.result_cache = None
+        engine.singleflight = None
+
+    try:
+        report = await run_load(engine, cases, args.requests, args.concurrency, args.deadline_ms, args.seed)
+        report['engine_stats'] = engine.get_stats()
+    finally:
+        await close_llm_http_clients()
+
+    print(json.dumps(report, ensure_ascii=False, indent=2, default=str))
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2, default=str)
+        print(f"\n报告: {args.output}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='推理引擎压测（配合LLM延迟模拟后端）')
+    parser.add_argument('--input', default=DEFAULT_INPUT, help='病例CSV（评估数据集格式）')
+    parser.add_argument('--requests', type=int, default=200, help='请求总数')
+    parser.add_argument('--concurrency', type=int, default=20, help='并发数')
+    parser.add_argument('--deadline-ms', type=float, default=None, help='每个请求的时间预算（毫秒）')
+    parser.add_argument('--full', action='store_true', help='完整模式（包含LLM实体识别）')
+    parser.add_argument('--keep-caches', action='store_true', help='保留结果缓存与请求合并')
+    parser.add_argument('--seed', type=int, default=42, help='病例抽样的随机种子')
+    parser.add_argument('--output', help='报告输出路径（JSON）')
+    parser.add_argument('--allow-real', action='store_true', help='允许对真实LLM后端压测（会产生调用费用）')
+    args = parser.parse_args()
+
+    Config.load_env()
+    backend = load_backend()
+    if backend != 'simulator' and not args.allow_real:
+        print(f"当前LLM后端为 {backend}，请在 config.yaml 中设置 inference.llm.backend: simulator，"
+              f"或使用 --allow-real 确认对真实后端压测")
+        sys.exit(1)
+
+    asyncio.run(main_async(args))
+
+
+if __name__ == "__main__":
+    main()
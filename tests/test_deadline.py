@@ -0,0 +1,90 @@
+"""时间预算与LLM熔断测试 - 不依赖ES和DeepSeek服务"""
+
+import asyncio
+import time
+
+import openai
+import pytest
+
+from app.inference.deadline import Deadline, DeadlineExceededError, run_stage
+from app.inference.llm_reasoner import IndicationAnalyzer
+from app.shared.circuit_breaker import CircuitBreaker
+
+
+class TestDeadline:
+    """阶段超时取 min(阶段上限, 剩余总预算)"""
+
+    def test_from_config(self):
+        config = {"default_ms": None, "stages": {"entities_ms": 800, "knowledge_ms": 500}, "min_llm_ms": 300}
+        assert Deadline.from_config(None, config) is None
+
+        deadline = Deadline.from_config(1500, config)
+        assert deadline.stage_timeout("knowledge") == pytest.approx(0.5)
+        assert deadline.stage_timeout("llm") == pytest.approx(1.5, abs=0.05)
+        assert not deadline.llm_budget_exhausted()
+
+        assert Deadline.from_config(200, config).llm_budget_exhausted()
+
+    def test_run_stage_timeout(self):
+        async def slow():
+            await asyncio.sleep(1)
+
+        deadline = Deadline(1000, {"knowledge": 50})
+        started = time.monotonic()
+        with pytest.raises(DeadlineExceededError) as exc_info:
+            asyncio.run(run_stage(deadline, "knowledge", slow()))
+        print(f"\n{exc_info.value} 耗时: {deadline.summary()}")
+        assert exc_info.value.stage == "knowledge"
+        assert time.monotonic() - started < 0.5
+        assert "knowledge" in deadline.summary()["stages_ms"]
+
+
+class TestCircuitBreaker:
+    """失败率熔断与半开探测"""
+
+    def test_trip_and_recover(self):
+        breaker = CircuitBreaker(window=4, min_calls=4, error_rate=0.5, open_seconds=0.05)
+        for ok in (True, False, True):
+            assert breaker.allow()
+            breaker.record_success() if ok else breaker.record_failure()
+        assert breaker.state == "closed"
+
+        breaker.record_failure()
+        assert breaker.state == "open" and not breaker.allow()
+
+        # 熔断期结束后只放行一个探测调用
+        time.sleep(0.06)
+        assert breaker.allow() and not breaker.allow()
+        breaker.record_success()
+        print(f"\n统计: {breaker.stats()}")
+        assert breaker.state == "closed" and breaker.allow()
+        assert breaker.stats()["trips"] == 1
+
+    def test_failed_probe_reopens(self):
+        breaker = CircuitBreaker(window=2, min_calls=2, open_seconds=0.05)
+        breaker.record_failure()
+        breaker.record_failure()
+        time.sleep(0.06)
+        assert breaker.allow()
+        breaker.record_failure()
+        assert breaker.state == "open" and breaker.stats()["trips"] == 2
+
+    def test_budget_timeouts_not_recorded(self):
+        """预算引起的超时不计入熔断，服务端错误与未设预算时的超时计为失败"""
+        analyzer = IndicationAnalyzer.__new__(IndicationAnalyzer)
+        analyzer.circuit_breaker = CircuitBreaker(window=10, min_calls=10)
+        analyzer._finalize_degraded = lambda context, reason: {"degraded_reason": reason}
+        request_timeout = openai.APITimeoutError(request=None)
+
+        deadline = Deadline(1000)
+        for error in (DeadlineExceededError("llm", 1000), request_timeout):
+            result = analyzer._degrade_on_llm_error({}, error, deadline)
+            assert result["degraded_reason"] == "llm_timeout"
+        assert analyzer.circuit_breaker.stats()["recent_calls"] == 0
+
+        for error, active in ((request_timeout, None), (RuntimeError("502"), deadline)):
+            with pytest.raises(type(error)):
+                analyzer._degrade_on_llm_error({}, error, active)
+        stats = analyzer.circuit_breaker.stats()
+        print(f"\n统计: {stats}")
+        assert stats["recent_calls"] == 2 and stats["recent_error_rate"] == 1.0
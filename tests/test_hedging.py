@@ -0,0 +1,137 @@
+"""LLM请求对冲测试 - 使用假请求，不依赖DeepSeek服务"""
+
+import asyncio
+
+import pytest
+
+from app.shared.hedging import LLMHedger, LatencyTracker
+
+
+def _warm_up(hedger: LLMHedger, key, seconds: float, count: int):
+    for _ in range(count):
+        hedger._record(key, seconds, False)
+
+
+class TestLLMHedger:
+    """按延迟分位数触发对冲，先返回者胜出"""
+
+    def test_hedge_wins_against_straggler(self):
+        hedger = LLMHedger(percentile=95, min_samples=5, min_delay=0.02, max_hedge_rate=0.5, window=10)
+        _warm_up(hedger, "k", 0.02, 5)
+        delays = iter([1.0, 0.01])
+        cancelled = []
+
+        async def call():
+            delay = next(delays)
+            try:
+                await asyncio.sleep(delay)
+            except asyncio.CancelledError:
+                cancelled.append(delay)
+                raise
+            return delay
+
+        result = asyncio.run(hedger.run("k", call))
+        stats = hedger.stats()
+        print(f"\n统计: {stats}")
+        assert result == 0.01
+        assert cancelled == [1.0]
+        assert (stats["hedged"], stats["hedge_wins"], stats["primary_wins"]) == (1, 1, 0)
+
+    def test_no_hedge_without_samples_or_budget(self):
+        hedger = LLMHedger(min_samples=3, min_delay=0.01, max_hedge_rate=0.005, window=200)
+        calls = []
+
+        async def call():
+            calls.append(1)
+            await asyncio.sleep(0.05)
+            return "ok"
+
+        # 样本不足：不对冲
+        assert asyncio.run(hedger.run("k", call)) == "ok"
+        assert len(calls) == 1 and hedger.hedge_delay("k") is None
+
+        # 对冲额度为每200个请求1次（加上首个请求共观测到200个）
+        _warm_up(hedger, "k", 0.005, 199)
+
+        async def burst():
+            for _ in range(3):
+                await hedger.run("k", call)
+
+        asyncio.run(burst())
+        stats = hedger.stats()
+        print(f"\n统计: {stats}")
+        assert stats["hedged"] == 1 and stats["budget_skipped"] == 2
+
+    def test_failed_primary_falls_back_to_hedge(self):
+        hedger = LLMHedger(min_samples=1, min_delay=0.01, max_hedge_rate=1.0, window=10)
+        _warm_up(hedger, "k", 0.01, 1)
+        attempts = []
+
+        async def call():
+            attempts.append(1)
+            if len(attempts) == 1:
+                await asyncio.sleep(0.03)
+                raise ConnectionError("reset")
+            await asyncio.sleep(0.05)
+            return "hedge"
+
+        assert asyncio.run(hedger.run("k", call)) == "hedge"
+
+    def test_burst_after_warm_up_respects_rate(self):
+        """刚达到min_samples时并发的慢请求：额度按已观测请求数计算，进行中的对冲也计入"""
+        hedger = LLMHedger(min_samples=20, min_delay=0.01, max_hedge_rate=0.1, window=200)
+        _warm_up(hedger, "k", 0.01, 20)
+
+        async def call():
+            await asyncio.sleep(0.05)
+            return "ok"
+
+        async def burst():
+            return await asyncio.gather(*(hedger.run("k", call) for _ in range(20)))
+
+        assert asyncio.run(burst()) == ["ok"] * 20
+        stats = hedger.stats()
+        print(f"\n统计: {stats}")
+        assert stats["hedged"] == 2 and stats["budget_skipped"] == 18
+        assert stats["hedge_rate"] <= hedger.max_hedge_rate
+        assert stats["hedges_in_flight"] == 0
+
+    def test_hedge_win_records_observed_latency(self):
+        """对冲胜出时记录从首个请求发出算起的延迟"""
+        hedger = LLMHedger(min_samples=1, min_delay=0.05, max_hedge_rate=1.0, window=10)
+        _warm_up(hedger, "k", 0.05, 1)
+        delays = iter([1.0, 0.01])
+
+        async def call():
+            await asyncio.sleep(next(delays))
+            return "ok"
+
+        asyncio.run(hedger.run("k", call))
+        assert hedger.stats()["hedge_wins"] == 1
+        assert max(hedger._trackers["k"]._samples) >= 0.06
+
+    def test_hedge_call_and_busy_skip(self):
+        hedger = LLMHedger(min_samples=1, min_delay=0.01, max_hedge_rate=1.0, window=50)
+        _warm_up(hedger, "k", 0.01, 50)
+
+        async def call():
+            await asyncio.sleep(0.2)
+            return "primary"
+
+        async def hedge_call():
+            return "hedge"
+
+        # 下游拥塞时不对冲
+        assert asyncio.run(hedger.run("k", call, hedge_call, can_hedge=lambda: False)) == "primary"
+        assert hedger.stats()["busy_skipped"] == 1 and hedger.stats()["hedged"] == 0
+
+        assert asyncio.run(hedger.run("k", call, hedge_call, can_hedge=lambda: True)) == "hedge"
+        assert hedger.stats()["hedge_wins"] == 1
+
+
+def test_latency_percentile():
+    tracker = LatencyTracker(window=100)
+    for ms in range(1, 101):
+        tracker.record(ms / 1000)
+    assert tracker.percentile(95) == pytest.approx(0.095)
+    assert tracker.percentile(50) == pytest.approx(0.05)
@@ -0,0 +1,105 @@
+"""批量任务队列测试 - 使用假推理引擎，不依赖ES和DeepSeek服务"""
+
+import asyncio
+
+import openai
+
+from app.inference.engine import is_transient_error
+from app.inference.job_queue import JobQueue, JobStore
+
+
+class FakeEngine:
+    """按输入产出结果的推理引擎，drug_name为bad时返回错误结果，flaky时前两次返回临时错误"""
+
+    def __init__(self):
+        self.analyzed = []
+
+    async def analyze_batch_stream(self, inputs, max_concurrency=None):
+        position = 0
+        async for input_data in inputs:
+            self.analyzed.append(input_data["drug_name"])
+            await asyncio.sleep(0)
+            if input_data["drug_name"] == "bad":
+                yield position, {"error": "药品信息缺失", "retryable": False, "input": input_data}
+            elif input_data["drug_name"] == "flaky" and self.analyzed.count("flaky") <= 2:
+                yield position, {"error": "Request timed out.", "retryable": True, "input": input_data}
+            else:
+                yield position, {"drug_info": {"name": input_data["drug_name"]}, "is_offlabel": False}
+            position += 1
+
+
+INPUTS = [{"drug_name": name} for name in ["a", "bad", "c", "d", "e"]]
+
+
+class TestJobQueue:
+    """任务提交、进度持久化与重启续跑"""
+
+    def test_process_job(self, tmp_path):
+        store = JobStore(str(tmp_path / "jobs.sqlite"))
+        queue = JobQueue(FakeEngine(), store, page_size=2)
+        job_id = queue.submit(INPUTS)
+        assert store.get_job(job_id)["status"] == "queued"
+
+        asyncio.run(queue.process_job(job_id))
+        job = store.get_job(job_id)
+        print(f"\n任务: {job}")
+        assert job["status"] == "completed"
+        assert (job["done"], job["failed"], job["progress"]) == (4, 1, 1.0)
+
+        results = list(store.iter_results(job_id))
+        assert [row["index"] for row in results] == [0, 1, 2, 3, 4]
+        assert results[2]["data"]["drug_info"]["name"] == "c"
+        assert list(store.iter_results(job_id, "failed")) == [
+            {"index": 1, "success": False, "error": "药品信息缺失"}
+        ]
+
+    def test_resume_after_restart(self, tmp_path):
+        path = str(tmp_path / "jobs.sqlite")
+        store = JobStore(path)
+        job_id = store.create_job(INPUTS)
+        store.mark_running(job_id)
+        store.record_result(job_id, 0, {"is_offlabel": True})
+        store.record_result(job_id, 3, {"is_offlabel": True})
+        store.close()
+
+        # 重启后只分析未完成的病例
+        engine = FakeEngine()
+        store = JobStore(path)
+        queue = JobQueue(engine, store)
+        assert store.next_job() == job_id
+        asyncio.run(queue.process_job(job_id))
+        print(f"\n续跑分析: {engine.analyzed}")
+        assert engine.analyzed == ["bad", "c", "e"]
+        assert store.get_job(job_id)["status"] == "completed"
+        assert store.next_job() is None
+
+    def test_transient_errors_retried(self, tmp_path):
+        store = JobStore(str(tmp_path / "jobs.sqlite"))
+        engine = FakeEngine()
+        queue = JobQueue(engine, store, max_attempts=3, retry_delay=0)
+        job_id = queue.submit([{"drug_name": name} for name in ["a", "flaky", "bad"]])
+
+        # 临时错误保持pending，任务未完成；输入错误直接记为失败
+        assert asyncio.run(queue.process_job(job_id)) is False
+        job = store.get_job(job_id)
+        assert (job["status"], job["done"], job["failed"]) == ("running", 1, 1)
+
+        assert asyncio.run(queue.process_job(job_id)) is False
+        assert asyncio.run(queue.process_job(job_id)) is True
+        print(f"\n分析顺序: {engine.analyzed}")
+        assert engine.analyzed == ["a", "flaky", "bad", "flaky", "flaky"]
+        job = store.get_job(job_id)
+        assert (job["status"], job["done"], job["failed"]) == ("completed", 2, 1)
+
+        # 达到最多尝试次数后记为失败
+        job_id = queue.submit([{"drug_name": "flaky"}])
+        store.record_result(job_id, 0, {"error": "Request timed out.", "retryable": True}, max_attempts=1)
+        assert list(store.iter_results(job_id, "failed")) == [
+            {"index": 0, "success": False, "error": "Request timed out."}
+        ]
+
+
+def test_is_transient_error():
+    assert is_transient_error(openai.APITimeoutError(request=None))
+    assert is_transient_error(asyncio.TimeoutError())
+    assert not is_transient_error(ValueError("药品信息缺失"))
@@ -0,0 +1,90 @@
+"""LLM响应缓存测试 - 不依赖ES和DeepSeek服务"""
+
+import time
+from types import SimpleNamespace
+
+from app.shared.cache import LRUCache
+from app.shared.llm_cache import LLMResponseCache
+from app.shared.llm_client import create_chat_completion
+
+
+class FakeLLMClient:
+    """记录调用次数的LLM客户端"""
+
+    def __init__(self):
+        self.calls = 0
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self._create))
+
+    def _create(self, model, messages, **params):
+        self.calls += 1
+        message = SimpleNamespace(content=f"response-{self.calls}")
+        return SimpleNamespace(choices=[SimpleNamespace(message=message)])
+
+
+MESSAGES = [{"role": "user", "content": "患者诊断为重症肌无力，拟使用溴吡斯的明治疗"}]
+
+
+class TestLRUCache:
+    """内存LRU层"""
+
+    def test_eviction_and_counters(self):
+        cache = LRUCache(maxsize=2)
+        cache.set("a", 1)
+        cache.set("b", 2)
+        cache.get("a")
+        cache.set("c", 3)  # 淘汰最久未使用的b
+
+        assert cache.get("b") is None
+        assert cache.get("a") == 1
+        stats = cache.stats()
+        print(f"\n统计: {stats}")
+        assert stats["evictions"] == 1
+        assert stats["hits"] == 2
+        assert stats["misses"] == 1
+
+    def test_ttl(self):
+        cache = LRUCache(maxsize=10, ttl=0.05)
+        cache.set("a", 1)
+        time.sleep(0.1)
+        assert cache.get("a") is None
+
+
+class TestLLMResponseCache:
+    """两级缓存与chat.completions调用"""
+
+    def test_hit_skips_network(self, tmp_path):
+        cache = LLMResponseCache(memory_size=10, disk_path=str(tmp_path / "llm.sqlite"))
+        client = FakeLLMClient()
+
+        first = create_chat_completion(client, model="deepseek-chat", messages=MESSAGES,
+                                       cache=cache, temperature=0.1)
+        second = create_chat_completion(client, model="deepseek-chat", messages=MESSAGES,
+                                        cache=cache, temperature=0.1)
+        assert first == second
+        assert client.calls == 1
+
+        # 参数不同 → 不同的缓存键
+        create_chat_completion(client, model="deepseek-chat", messages=MESSAGES,
+                               cache=cache, temperature=0.7)
+        assert client.calls == 2
+        print(f"\n统计: {cache.stats()}")
+
+    def test_disk_tier_survives_restart(self, tmp_path):
+        path = str(tmp_path / "llm.sqlite")
+        client = FakeLLMClient()
+        create_chat_completion(client, model="deepseek-chat", messages=MESSAGES,
+                               cache=LLMResponseCache(disk_path=path))
+
+        # 新实例内存层为空，应从磁盘层命中
+        reopened = LLMResponseCache(disk_path=path)
+        create_chat_completion(client, model="deepseek-chat", messages=MESSAGES, cache=reopened)
+        assert client.calls == 1
+        assert reopened.stats()["disk"]["hits"] == 1
+
+    def test_disk_size_eviction(self, tmp_path):
+        cache = LLMResponseCache(memory_size=1, disk_path=str(tmp_path / "llm.sqlite"), disk_max_entries=3)
+        for i in range(5):
+            cache.set(f"key-{i}", f"value-{i}")
+        assert len(cache.disk) == 3
+        assert cache.disk.get("key-0") is None
+        assert cache.disk.get("key-4") == "value-4"
@@ -0,0 +1,116 @@
+"""LLM延迟模拟后端测试 - 不依赖ES和DeepSeek服务"""
+
+import asyncio
+import json
+import time
+
+import httpx
+import openai
+import pytest
+from openai import AsyncOpenAI
+
+from app.inference.entity_matcher import EntityRecognizer
+from app.inference.llm_reasoner import IndicationAnalyzer
+from app.inference.prompt import create_entity_recognition_prompt, create_indication_analysis_prompt
+from app.shared.llm_simulator import AsyncSimulatorTransport, LLMSimulator
+
+FAST = {"latency": {"distribution": "fixed", "value": 0.01}, "seed": 0}
+
+
+def _client(simulator: LLMSimulator) -> AsyncOpenAI:
+    http_client = httpx.AsyncClient(transport=AsyncSimulatorTransport(simulator))
+    return AsyncOpenAI(api_key="simulator", base_url="http://simulator", http_client=http_client, max_retries=0)
+
+
+async def _complete(simulator: LLMSimulator, prompt: str, **kwargs) -> str:
+    async with _client(simulator) as client:
+        completion = await client.chat.completions.create(
+            model="deepseek-chat", messages=[{"role": "user", "content": prompt}], **kwargs
+        )
+    return completion.choices[0].message.content
+
+
+def _analysis_prompt(diagnosis: str) -> str:
+    return create_indication_analysis_prompt(
+        "美托洛尔", "高血压；心绞痛", "", "", "", diagnosis, f"患者诊断为{diagnosis}",
+        "无", "（数据不可用）", "", "（数据不可用）", "", "（数据不可用）", ""
+    )
+
+
+class TestSimulatorResponses:
+    """响应能被实体识别与适应症分析的解析逻辑接受"""
+
+    def test_entity_recognition(self):
+        prompt = create_entity_recognition_prompt({"description": "患者诊断为高血压，处方美托洛尔"})
+        response = asyncio.run(_complete(LLMSimulator(FAST), prompt))
+        think, entities = EntityRecognizer.__new__(EntityRecognizer)._parse_recognition_response(response)
+        print(f"\n实体: {entities}")
+        assert think and entities["drugs"] == [{"name": "美托洛尔"}]
+        assert entities["diseases"] == [{"name": "高血压"}]
+
+    def test_indication_analysis(self):
+        analyzer = IndicationAnalyzer.__new__(IndicationAnalyzer)
+        for diagnosis, offlabel in (("高血压", False), ("偏头痛", True)):
+            response = asyncio.run(_complete(LLMSimulator(FAST), _analysis_prompt(diagnosis)))
+            result = json.loads(analyzer._clean_json_response(response))
+            assert result["is_offlabel"] is offlabel
+            assert 0 <= result["confidence"] <= 1 and "indication_match" in result["analysis"]
+
+    def test_stream(self):
+        async def run():
+            async with _client(LLMSimulator(FAST)) as client:
+                stream = await client.chat.completions.create(
+                    model="deepseek-chat", messages=[{"role": "user", "content": _analysis_prompt("高血压")}],
+                    stream=True
+                )
+                return "".join([chunk.choices[0].delta.content or "" async for chunk in stream])
+
+        assert json.loads(asyncio.run(run()))["is_offlabel"] is False
+
+    def test_stream_holds_slot_until_closed(self):
+        """流式响应接收期间占用并发槽，关闭后才放行排队的请求"""
+        async def run():
+            transport = AsyncSimulatorTransport(LLMSimulator(FAST), max_connections=1)
+            body = {"model": "deepseek-chat", "messages": [{"role": "user", "content": "你好"}], "stream": True}
+            async with httpx.AsyncClient(transport=transport, base_url="http://simulator") as client:
+                async with client.stream("POST", "/chat/completions", json=body) as response:
+                    assert transport.pool_stats.stats()["in_flight"] == 1
+                    queued = asyncio.ensure_future(client.post("/chat/completions", json=dict(body, stream=False)))
+                    await asyncio.sleep(0.05)
+                    assert not queued.done()
+                    await response.aread()
+                assert (await queued).status_code == 200
+            return transport.pool_stats.stats()
+
+        stats = asyncio.run(run())
+        print(f"\n连接池: {stats}")
+        assert stats["in_flight"] == 0 and stats["queued"] == 1
+
+
+class TestFaultInjection:
+    """注入429与超时"""
+
+    def test_throttled(self):
+        simulator = LLMSimulator(dict(FAST, error_rate=1.0))
+        with pytest.raises(openai.RateLimitError):
+            asyncio.run(_complete(simulator, "你好"))
+        assert simulator.stats()["throttled"] == 1
+
+    def test_timeout_waits_for_read_timeout(self):
+        simulator = LLMSimulator(dict(FAST, timeout_rate=1.0))
+        started = time.monotonic()
+        with pytest.raises(openai.APITimeoutError):
+            asyncio.run(_complete(simulator, "你好", timeout=0.1))
+        elapsed = time.monotonic() - started
+        print(f"\n超时耗时: {elapsed:.3f}秒, 统计: {simulator.stats()}")
+        assert 0.1 <= elapsed < 1.0
+        assert simulator.stats()["timeouts"] == 1
+
+
+def test_latency_distribution():
+    simulator = LLMSimulator({"latency": {"distribution": "lognormal", "median": 1.0, "sigma": 0.3}, "seed": 1})
+    latencies = sorted(simulator.draw()[1] for _ in range(1000))
+    assert latencies[500] == pytest.approx(1.0, rel=0.1)
+
+    simulator = LLMSimulator(dict(FAST, straggler_rate=1.0, straggler_seconds=[20, 30]))
+    assert 20 <= simulator.draw()[1] <= 30
@@ -0,0 +1,58 @@
+"""LLM连接池测试 - 使用本地HTTP服务，不依赖DeepSeek服务"""
+
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import httpx
+import pytest
+
+from app.shared.llm_transport import InstrumentedTransport, PoolStats
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        body = b'{"choices": []}'
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def server_url():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _Handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_address[1]}"
+    server.shutdown()
+    server.server_close()
+
+
+class TestInstrumentedTransport:
+    """连接复用与在途统计"""
+
+    def test_keepalive_reuse(self, server_url):
+        stats = PoolStats(max_connections=4)
+        with httpx.Client(transport=InstrumentedTransport(stats, limits=httpx.Limits(max_connections=4))) as client:
+            for _ in range(5):
+                assert client.post(f"{server_url}/v1/chat/completions", json={}).status_code == 200
+
+        result = stats.stats()
+        print(f"\n统计: {result}")
+        assert result["requests"] == 5 and result["connections_opened"] == 1
+        assert result["reuse_rate"] == pytest.approx(0.8)
+        assert result["in_flight"] == 0 and result["errors"] == 0
+
+    def test_connect_error_released(self):
+        stats = PoolStats(max_connections=1)
+        with httpx.Client(transport=InstrumentedTransport(stats)) as client:
+            with pytest.raises(httpx.ConnectError):
+                client.post("http://127.0.0.1:1/v1/chat/completions", json={})
+        assert stats.stats()["errors"] == 1 and stats.stats()["in_flight"] == 0
@@ -0,0 +1,199 @@
+"""名称匹配测试 - 本地名称解析与词典实体识别，不依赖ES服务"""
+
+from app.inference.name_resolver import NameResolver, normalize_name, normalize_disease_name
+from app.inference.ngram_index import NGramIndex
+from app.inference.entity_dictionary import AhoCorasick, EntityDictionary
+
+
+class FakeSnapshotES:
+    """只支持名称导出所需接口的ES替身"""
+
+    DOCS = {
+        "drugs": [
+            {"id": "d1", "name": "溴吡斯的明片"},
+            {"id": "d2", "name": "酒石酸美托洛尔片"},
+        ],
+        "diseases": [
+            {"id": "s1", "name": "重症肌无力"},
+            {"id": "s2", "name": "高血压", "sub_diseases": ["原发性高血压", "妊娠期高血压"]},
+            {"id": "s3", "name": "2型糖尿病"},
+        ],
+    }
+
+    def __init__(self):
+        self.indices = self
+        self._pit_index = None
+        self._meta = {}
+
+    def get_settings(self, index, **kwargs):
+        return {name: {"settings": {"index": {"uuid": "u1"}}} for name in index.split(",")}
+
+    def get_mapping(self, index, filter_path=None, **kwargs):
+        # filter_path 过滤 _meta 时，没有 _meta 的索引不出现在响应中
+        return {name: {"mappings": {"_meta": dict(self._meta.get(name, {}))}}
+                for name in index.split(",") if name in self._meta or filter_path is None}
+
+    def put_mapping(self, index, body, **kwargs):
+        self._meta[index] = body["_meta"]
+
+    def open_point_in_time(self, index, **kwargs):
+        self._pit_index = index
+        return {"id": "pit"}
+
+    def close_point_in_time(self, **kwargs):
+        pass
+
+    def search(self, **kwargs):
+        if kwargs.get("search_after"):
+            return {"hits": {"hits": []}}
+        docs = self.DOCS[self._pit_index]
+        return {"hits": {"hits": [
+            {"_id": doc["id"], "_source": doc, "sort": [i]} for i, doc in enumerate(docs)
+        ]}}
+
+
+class TestNormalizeName:
+    """名称规范化"""
+
+    def test_fullwidth_space_case(self):
+        assert normalize_name("ＡＢＣ 片剂") == "abc片剂"
+
+    def test_dosage_form_suffix(self):
+        assert normalize_name("溴吡斯的明片", strip_dosage_form=True) == "溴吡斯的明"
+        assert normalize_name("阿司匹林肠溶片", strip_dosage_form=True) == "阿司匹林"
+        # 名称本身就是剂型时不去掉
+        assert normalize_name("片", strip_dosage_form=True) == "片"
+
+    def test_disease_name(self):
+        assert normalize_disease_name("高血压（原发性）") == "高血压"
+        assert normalize_disease_name("Ⅱ型 糖尿病") == normalize_disease_name("Ⅱ型糖尿病")
+
+
+class TestNameResolver:
+    """本地名称解析"""
+
+    def test_resolve(self):
+        resolver = NameResolver(es=FakeSnapshotES())
+        assert resolver.resolve("drug", "溴吡斯的明片") is None  # 未加载时回退ES
+
+        resolver.load()
+        exact = resolver.resolve("drug", "溴吡斯的明片", unique=True)
+        normalized = resolver.resolve("drug", "溴吡斯的明", unique=True)
+        print(f"\n精确: {exact}\n规范化: {normalized}")
+        assert exact[0]["id"] == "d1"
+        assert normalized[0]["id"] == "d1"
+        assert resolver.resolve("disease", "高血压")[0]["id"] == "s2"
+        assert resolver.resolve("drug", "美托洛尔") is None
+
+        stats = resolver.stats()
+        print(f"统计: {stats}")
+        assert stats["drug"]["exact_hits"] == 1
+        assert stats["drug"]["normalized_hits"] == 1
+        assert stats["drug"]["misses"] == 1
+
+    def test_dosage_forms_not_merged(self):
+        class DosageFormES(FakeSnapshotES):
+            DOCS = dict(FakeSnapshotES.DOCS, drugs=[
+                {"id": "n1", "name": "硝苯地平片"},
+                {"id": "n2", "name": "硝苯地平注射液"},
+                {"id": "n3", "name": "硝苯地平 胶囊"},
+            ])
+
+        resolver = NameResolver(es=DosageFormES())
+        resolver.load()
+        # 保留剂型的规范化名称优先（全角/空白差异不影响）
+        assert resolver.resolve("drug", "硝苯地平注射液", unique=True)[0]["id"] == "n2"
+        assert resolver.resolve("drug", "硝苯地平胶囊", unique=True)[0]["id"] == "n3"
+        # 去掉剂型后有多个产品：唯一模式不任取其一，非唯一模式返回全部
+        assert resolver.resolve("drug", "硝苯地平", unique=True) is None
+        candidates = resolver.resolve("drug", "硝苯地平缓释片")
+        print(f"\n候选: {candidates}")
+        assert sorted(match["id"] for match in candidates) == ["n1", "n2", "n3"]
+        assert resolver.stats()["drug"]["ambiguous"] == 2
+
+
+class TestNGramIndex:
+    """本地n-gram模糊匹配"""
+
+    def test_match(self):
+        index = NGramIndex()
+        for entity_id, name in [("d1", "酒石酸美托洛尔片"), ("d2", "聚乙二醇洛塞那肽注射液"),
+                                ("d3", "四环素片"), ("d4", "注射用盐酸多柔比星")]:
+            index.add(entity_id, name)
+
+        matches = index.match("美托洛尔", unique=True)
+        print(f"\n美托洛尔: {matches}")
+        assert matches[0]["id"] == "d1"
+        assert matches[0]["name"] == "酒石酸美托洛尔片"
+        assert index.match("多柔比星")[0]["id"] == "d4"
+        # 与ES路径相同的验证规则：只有部分字符重合时不匹配
+        assert index.match("艾塞那肽") == []
+        assert index.match("环孢素") == []
+
+    def test_resolver_fuzzy(self):
+        resolver = NameResolver(es=FakeSnapshotES(), fuzzy=True)
+        assert resolver.fuzzy_resolve("美托洛尔") is None  # 未加载时回退ES
+        resolver.load()
+        assert resolver.fuzzy_resolve("美托洛尔", unique=True)[0]["id"] == "d2"
+        assert resolver.stats()["fuzzy"]["hits"] == 1
+
+
+class TestDiseaseMatching:
+    """疾病层级/模糊匹配"""
+
+    def test_resolve_disease(self):
+        resolver = NameResolver(es=FakeSnapshotES(), disease_matching=True)
+        resolver.load()
+
+        normalized = resolver.resolve("disease", "高血压（原发性）", unique=True)
+        hierarchy = resolver.resolve("disease", "妊娠期高血压", unique=True)
+        fuzzy = resolver.resolve("disease", "2型糖尿病（成人）伴酮症", unique=True)
+        print(f"\n规范化: {normalized}\n层级: {hierarchy}\n模糊: {fuzzy}")
+        assert normalized[0]["id"] == "s2"
+        assert hierarchy[0]["id"] == "s2" and hierarchy[0]["match_type"] == "hierarchy"
+        assert fuzzy[0]["id"] == "s3" and fuzzy[0]["match_type"] == "fuzzy"
+        assert resolver.resolve("disease", "类风湿关节炎") is None
+
+        stats = resolver.stats()["disease"]
+        assert stats["hierarchy_hits"] == 1
+        assert stats["fuzzy_hits"] == 1
+        assert stats["misses"] == 1
+
+    def test_disabled(self):
+        resolver = NameResolver(es=FakeSnapshotES())
+        resolver.load()
+        assert resolver.resolve("disease", "妊娠期高血压") is None
+
+
+class TestEntityDictionary:
+    """词典实体识别"""
+
+    def test_automaton(self):
+        automaton = AhoCorasick()
+        for i, pattern in enumerate(["he", "she", "his", "hers"]):
+            automaton.add(pattern, i)
+        automaton.finalize()
+        matches = sorted((start, end, automaton.patterns[pid]) for start, end, pid in automaton.iter_matches("ushers"))
+        assert matches == [(1, 4, "she"), (2, 4, "he"), (2, 6, "hers")]
+
+    def test_recognize(self, tmp_path):
+        cache_path = str(tmp_path / "entity_dictionary.pkl")
+        dictionary = EntityDictionary(es=FakeSnapshotES(), cache_path=cache_path)
+        assert dictionary.recognize("高血压患者使用美托洛尔") is None  # 未加载时回退LLM
+        dictionary.load()
+
+        # 最长匹配："妊娠期高血压"不在词典中，命中"高血压"；"酒石酸美托洛尔片"优先于"美托洛尔"
+        entities = dictionary.recognize("患者，男，56岁，诊断为原发性高血压，拟使用酒石酸美托洛尔片治疗")
+        print(f"\n识别结果: {entities}")
+        assert entities["drugs"] == [{"name": "酒石酸美托洛尔片"}]
+        assert entities["diseases"] == [{"name": "高血压"}]
+        # 两个疾病 -> 有歧义，回退LLM
+        assert dictionary.recognize("重症肌无力合并高血压，使用溴吡斯的明") is None
+        # 没有药品 -> 回退LLM
+        assert dictionary.recognize("高血压") is None
+
+        # 索引版本未变时从磁盘缓存加载
+        reloaded = EntityDictionary(es=FakeSnapshotES(), cache_path=cache_path)
+        reloaded._compile = None
+        reloaded.load()
+        assert reloaded.recognize("高血压，溴吡斯的明片")["drugs"] == [{"name": "溴吡斯的明片"}]
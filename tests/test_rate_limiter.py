@@ -0,0 +1,89 @@
+"""LLM限流器测试 - 不依赖DeepSeek服务"""
+
+import asyncio
+
+import httpx
+import pytest
+
+from app.shared.rate_limiter import LLMRateLimiter, TokenBucket, classify_exception
+
+
+def _throttled_error() -> httpx.HTTPStatusError:
+    request = httpx.Request("POST", "https://api.deepseek.com/v1/chat/completions")
+    return httpx.HTTPStatusError("429", request=request, response=httpx.Response(429, request=request))
+
+
+class TestAIMD:
+    """并发窗口的加性增长与乘性减小"""
+
+    def test_window_adapts(self):
+        limiter = LLMRateLimiter(initial_concurrency=4, max_concurrency=8, decrease_cooldown=0)
+        for _ in range(4):
+            with limiter.limit():
+                pass
+        assert limiter.window == pytest.approx(5.0, abs=0.1)
+
+        with pytest.raises(httpx.HTTPStatusError):
+            with limiter.limit():
+                raise _throttled_error()
+        stats = limiter.stats()
+        print(f"\n统计: {stats}")
+        assert stats["window"] == pytest.approx(2.5, abs=0.1)
+        assert stats["outcomes"]["throttled"] == 1 and stats["in_flight"] == 0
+
+        # 手动标记429（直接使用httpx的调用方）
+        with limiter.limit() as permit:
+            permit.mark_throttled()
+        assert limiter.window == pytest.approx(1.25, abs=0.1)
+
+    def test_cooldown_single_decrease_per_burst(self):
+        limiter = LLMRateLimiter(initial_concurrency=16, decrease_cooldown=60)
+        for _ in range(3):
+            with limiter.limit() as permit:
+                permit.mark_timeout()
+        assert limiter.window == 8 and limiter.decreases == 1
+
+    def test_classify_exception(self):
+        assert classify_exception(_throttled_error()) == "throttled"
+        assert classify_exception(httpx.ReadTimeout("timeout")) == "timeout"
+        assert classify_exception(ValueError("bad json")) == "error"
+
+
+class TestConcurrencyWindow:
+    """在途请求数不超过窗口"""
+
+    def test_async_in_flight_bounded(self):
+        limiter = LLMRateLimiter(initial_concurrency=3, max_concurrency=3)
+        peak = 0
+
+        async def call():
+            nonlocal peak
+            async with limiter.limit_async():
+                peak = max(peak, limiter.in_flight)
+                await asyncio.sleep(0.01)
+
+        async def scenario():
+            await asyncio.gather(*[call() for _ in range(12)])
+            # 排队中被取消的调用不占用槽位
+            holders = [asyncio.ensure_future(call()) for _ in range(5)]
+            await asyncio.sleep(0)
+            holders[-1].cancel()
+            await asyncio.gather(*holders, return_exceptions=True)
+
+        asyncio.run(scenario())
+        print(f"\n峰值在途: {peak}, 统计: {limiter.stats()}")
+        assert peak == 3
+        assert limiter.in_flight == 0 and limiter.stats()["waiting"] == 0
+
+
+class TestTokenBucket:
+    """令牌桶预约与结算"""
+
+    def test_reserve_and_adjust(self):
+        bucket = TokenBucket(per_minute=600)
+        assert bucket.reserve(600) == 0.0
+        assert bucket.reserve(10) == pytest.approx(1.0, abs=0.05)
+
+        # 实际用量少于预扣时退还
+        bucket.adjust(-20)
+        assert bucket.available() == pytest.approx(10, abs=1)
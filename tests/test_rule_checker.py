@@ -0,0 +1,248 @@
+"""规则分析测试 - 疾病ID集合匹配、编译的关系表与禁忌症扫描，不依赖ES服务"""
+
+from app.inference.contraindication_scanner import ContraindicationScanner
+from app.inference.disease_relations import DiseaseRelations, compile_disease_relations, write_disease_relations
+from app.inference.indication_index import IndicationIndex
+from app.inference.llm_reasoner import IndicationAnalyzer
+from app.inference.name_resolver import normalize_disease_name
+from app.inference.models import (
+    Case, Context, DiseaseMatch, DrugMatch, EnhancedCase, RecognizedDisease, RecognizedDrug, RecognizedEntities
+)
+from app.inference.rule_checker import RuleAnalyzer
+from app.shared import get_index_version, mark_index_updated
+
+
+class FakeIndexES:
+    """只支持索引导出所需接口的ES替身"""
+
+    DOCS = {
+        "drugs": [
+            {"id": "m1", "name": "二甲双胍片", "indications_list": ["糖尿病"],
+             "indication_disease_ids": ["s1"]},
+            {"id": "m2", "name": "硝苯地平片", "indications_list": ["高血压"],
+             "indication_disease_ids": ["s3"]},
+        ],
+        "diseases": [
+            {"id": "s1", "name": "糖尿病", "sub_diseases": ["2型糖尿病"]},
+            {"id": "s2", "name": "2型糖尿病", "sub_diseases": ["2型糖尿病肾病"]},
+            {"id": "s4", "name": "2型糖尿病肾病"},
+            {"id": "s3", "name": "高血压"},
+            {"id": "s5", "name": "高血压（原发性）"},
+        ],
+    }
+
+    def __init__(self):
+        self.indices = self
+        self._pit_index = None
+        self._meta = {}
+
+    def get_settings(self, index, **kwargs):
+        return {name: {"settings": {"index": {"uuid": "u1"}}} for name in index.split(",")}
+
+    def get_mapping(self, index, filter_path=None, **kwargs):
+        # filter_path 过滤 _meta 时，没有 _meta 的索引不出现在响应中
+        return {name: {"mappings": {"_meta": dict(self._meta.get(name, {}))}}
+                for name in index.split(",") if name in self._meta or filter_path is None}
+
+    def put_mapping(self, index, body, **kwargs):
+        self._meta[index] = body["_meta"]
+
+    def open_point_in_time(self, index, **kwargs):
+        self._pit_index = index
+        return {"id": "pit"}
+
+    def close_point_in_time(self, **kwargs):
+        pass
+
+    def search(self, **kwargs):
+        if kwargs.get("search_after"):
+            return {"hits": {"hits": []}}
+        docs = self.DOCS[self._pit_index]
+        return {"hits": {"hits": [
+            {"_id": doc["id"], "_source": doc, "sort": [i]} for i, doc in enumerate(docs)
+        ]}}
+
+
+class TestIdMatch:
+    """疾病ID集合匹配"""
+
+    def setup_method(self):
+        self.index = IndicationIndex(es=FakeIndexES())
+        self.index.load()
+        self.analyzer = RuleAnalyzer(indication_index=self.index)
+
+    def _drug(self, drug_id):
+        entry = self.index.get(drug_id)
+        return {"id": entry.id, "name": entry.name, "indications": list(entry.indications),
+                "indication_ids": entry.indication_ids, "contraindications": []}
+
+    def test_relations(self):
+        print(f"\n祖先: {self.index.ancestors('s4')}, 同义: {self.index.synonyms('s5')}")
+        assert self.index.ancestors("s4") == {"s1", "s2"}
+        assert self.index.synonyms("s5") == {"s3"}
+
+    def test_exact_synonym_hierarchy(self):
+        exact = self.analyzer.analyze(self._drug("m1"), {"id": "s1", "name": "糖尿病"})
+        synonym = self.analyzer.analyze(self._drug("m2"), {"id": "s5", "name": "高血压（原发性）"})
+        hierarchy = self.analyzer.analyze(self._drug("m1"), {"id": "s4", "name": "2型糖尿病肾病"})
+        assert exact["match_type"] == "exact" and not exact["is_offlabel"]
+        assert synonym["match_type"] == "synonym" and synonym["matched_indication"] == "高血压"
+        assert hierarchy["match_type"] == "hierarchy" and hierarchy["matched_indication"] == "糖尿病"
+
+        offlabel = self.analyzer.analyze(self._drug("m2"), {"id": "s1", "name": "糖尿病"})
+        assert offlabel["is_offlabel"] and offlabel["match_type"] is None
+
+    def test_partial_id_linking(self):
+        # 只有部分适应症解析出疾病ID：ID只命中上下位时，名称精确匹配仍优先
+        drug = {"id": "m3", "indications": ["糖尿病", "2型糖尿病"], "indication_ids": ["s1"], "contraindications": []}
+        result = self.analyzer.analyze(drug, {"id": "s2", "name": "2型糖尿病"})
+        print(f"\n部分链接: {result}")
+        assert result["match_type"] == "exact" and result["matched_indication"] == "2型糖尿病"
+        assert not result["is_offlabel"] and result["confidence"] == 1.0
+        assert RuleAnalyzer().analyze(drug, {"id": "s2", "name": "2型糖尿病"})["match_type"] == "exact"
+
+    def test_without_index(self):
+        # 无内存索引时仍可用药品文档中的疾病ID做精确匹配
+        analyzer = RuleAnalyzer()
+        drug = {"id": "m1", "indications": ["糖尿病"], "indication_ids": ["s1"]}
+        assert analyzer.id_match(drug, {"id": "s1", "name": "糖尿病"}) == ("exact", "糖尿病")
+        assert analyzer.id_match(drug, {"id": "s4", "name": "2型糖尿病肾病"}) == ("", "")
+
+    def test_reload_after_in_place_update(self):
+        # --link-only 原地更新 indication_disease_ids 不改变uuid，内容版本变化后重新加载
+        es = self.index.es
+        version = get_index_version(es, self.index.indices)
+        assert not self.index.refresh_if_changed()
+
+        es.DOCS = dict(FakeIndexES.DOCS, drugs=[
+            dict(doc, indication_disease_ids=["s1", "s2"]) if doc["id"] == "m1" else doc
+            for doc in FakeIndexES.DOCS["drugs"]
+        ])
+        mark_index_updated(es, "drugs")
+        print(f"\n版本: {version} -> {get_index_version(es, self.index.indices)}")
+        assert get_index_version(es, self.index.indices) != version
+        assert self.index.refresh_if_changed()
+        assert self.index.get("m1").indication_ids == {"s1", "s2"}
+
+
+class TestAlignedDisease:
+    """疾病经层级/模糊匹配对齐到其它疾病时，规则分析使用原始诊断名，对齐结果不构成定论"""
+
+    def setup_method(self):
+        self.index = IndicationIndex(es=FakeIndexES())
+        self.index.load()
+        self.analyzer = IndicationAnalyzer.__new__(IndicationAnalyzer)
+        self.analyzer.rule_analyzer = RuleAnalyzer(indication_index=self.index)
+        self.analyzer.llm_policy = "on_uncertain"
+
+    def _run_rules(self, drug_id, diagnosis, disease_id, match_type):
+        entry = self.index.get(drug_id)
+        case = Case(id="c1", recognized_entities=RecognizedEntities(
+            drugs=[RecognizedDrug(name=entry.name, matches=[DrugMatch(drug_id, entry.name, 1.0)])],
+            diseases=[RecognizedDisease(name=diagnosis, matches=[
+                DiseaseMatch(disease_id, self.index.disease_name(disease_id), 0.5, match_type)
+            ])],
+            context=Context(description=f"患者诊断为{diagnosis}", raw_data={})
+        ))
+        enhanced_case = EnhancedCase(case)
+        enhanced_case.drug.id, enhanced_case.drug.name = entry.id, entry.name
+        enhanced_case.drug.indications = list(entry.indications)
+        enhanced_case.drug.indication_ids = list(entry.indication_ids)
+        enhanced_case.disease.id, enhanced_case.disease.name = disease_id, self.index.disease_name(disease_id)
+        return self.analyzer._run_rules(case, enhanced_case)
+
+    def test_fuzzy_alignment_not_decisive(self):
+        # 肺动脉高血压经模糊匹配对齐到高血压：不能报告为精确匹配而跳过LLM
+        disease_name, result = self._run_rules("m2", "肺动脉高血压", "s3", "fuzzy")
+        print(f"\n{disease_name}: {result}")
+        assert disease_name == "肺动脉高血压"
+        assert result["match_type"] == "hierarchy" and result["confidence"] == 0.8
+        assert self.analyzer._should_call_llm(result)
+
+    def test_hierarchy_alignment(self):
+        disease_name, result = self._run_rules("m1", "2型糖尿病", "s1", "hierarchy")
+        assert disease_name == "2型糖尿病" and result["match_type"] == "hierarchy"
+        assert self.analyzer._should_call_llm(result)
+
+        # 精确匹配的疾病仍可由规则定论
+        _, result = self._run_rules("m1", "糖尿病", "s1", "exact")
+        assert result["match_type"] == "exact" and not self.analyzer._should_call_llm(result)
+
+
+class TestDiseaseRelations:
+    """编译的疾病同义/层级关系表"""
+
+    DISEASES = [
+        {"name": "糖尿病", "sub_diseases": ["2型糖尿病", "1型糖尿病"], "related_diseases": ["高血压"]},
+        {"name": "2型糖尿病", "sub_diseases": [{"name": "2型糖尿病肾病"}]},
+        {"name": "高血压（原发性）", "sub_diseases": []},
+        {"name": "高血压", "sub_diseases": []},
+    ]
+
+    def test_compile_and_load(self, tmp_path):
+        path = str(tmp_path / "disease_relations.bin")
+        version = write_disease_relations(path, compile_disease_relations(self.DISEASES))
+        relations = DiseaseRelations(path)
+        print(f"\n关系表: {relations.stats()}")
+        assert relations.version == version
+        assert relations.ancestors("2型糖尿病肾病") == {"糖尿病", "2型糖尿病"}
+        assert relations.ancestors("糖尿病") == frozenset()
+        assert relations.synonyms("高血压") == {"高血压（原发性）"}
+        # related_diseases不作为层级边
+        assert relations.ancestors("高血压") == frozenset()
+
+        analyzer = RuleAnalyzer(disease_relations=relations)
+        drug = {"id": "m1", "indications": ["糖尿病", "高血压（原发性）"], "contraindications": []}
+        hierarchy = analyzer.analyze(drug, {"name": "2型糖尿病肾病"})
+        synonym = analyzer.analyze(drug, {"name": "高血压"})
+        assert hierarchy["match_type"] == "hierarchy" and hierarchy["matched_indication"] == "糖尿病"
+        assert synonym["match_type"] == "synonym" and synonym["matched_indication"] == "高血压（原发性）"
+
+        # 与关系表中的写法只差空白/全半角时，同义与层级同样按规范化名称比较
+        drug = {"id": "m2", "indications": ["２型糖尿病", "高血压 (原发性)"], "contraindications": []}
+        assert analyzer.synonym_match(drug, {"name": "高血压"}) == "高血压 (原发性)"
+        assert analyzer.synonym_match(drug, {"name": "2型 糖尿病"}) == "２型糖尿病"
+        assert analyzer.hierarchy_match(drug, {"name": "2型糖尿病肾病"}) == "２型糖尿病"
+
+    def test_consistent_with_indication_index(self, tmp_path):
+        # 两份快照共用分组与闭包规则，同一份疾病数据得到相同的同义/层级关系
+        index = IndicationIndex(es=FakeIndexES())
+        index.load()
+        path = str(tmp_path / "disease_relations.bin")
+        write_disease_relations(path, compile_disease_relations(FakeIndexES.DOCS["diseases"]))
+        relations = DiseaseRelations(path)
+        for disease in FakeIndexES.DOCS["diseases"]:
+            name = disease["name"]
+            by_id = {index.disease_name(i) for i in index.ancestors(disease["id"])}
+            assert relations.ancestors(name) == {normalize_disease_name(n) for n in by_id}
+            assert {index.disease_name(i).lower() for i in index.synonyms(disease["id"])} <= relations.synonyms(name)
+
+
+class TestContraindicationScanner:
+    """禁忌症自动机扫描"""
+
+    CONTRAINDICATIONS = ["严重肾功能不全", "肾功能不全", "妊娠", "Asthma"]
+
+    def test_scan_matches_loop(self):
+        scanner = ContraindicationScanner(min_patterns=1)
+        hits = scanner.scan("m1", self.CONTRAINDICATIONS, "严重肾功能不全", "既往哮喘(asthma)，现妊娠12周")
+        print(f"\n命中: {hits}, {scanner.stats()}")
+        assert hits == self.CONTRAINDICATIONS
+        # 同一药品第二次扫描复用缓存的自动机
+        assert scanner.scan("m1", self.CONTRAINDICATIONS, "高血压") == []
+        assert scanner.compiled == 1
+
+        loop_scanner = ContraindicationScanner()
+        assert loop_scanner.scan("m1", self.CONTRAINDICATIONS, "肾功能不全") == ["肾功能不全"]
+        assert loop_scanner.compiled == 0
+
+    def test_description_mentions(self):
+        analyzer = RuleAnalyzer(contraindication_scanner=ContraindicationScanner(min_patterns=1))
+        drug = {"id": "m1", "indications": ["高血压"], "contraindications": self.CONTRAINDICATIONS}
+        result = analyzer.analyze(drug, {"name": "高血压", "description": "高血压患者，妊娠8周"})
+        # 描述中提及的禁忌症作为证据，不直接判定禁忌
+        assert not result["contraindicated"] and not result["is_offlabel"]
+        assert result["contraindication_mentions"] == ["妊娠"]
+
+        result = analyzer.analyze(drug, {"name": "严重肾功能不全", "description": ""})
+        assert result["contraindicated"] and result["contraindication_mentions"] == []
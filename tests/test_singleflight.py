@@ -0,0 +1,78 @@
+"""进行中请求合并测试 - 不依赖ES和DeepSeek服务"""
+
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from app.shared.singleflight import AsyncSingleFlight, SingleFlight
+
+
+class TestSingleFlight:
+    """线程版"""
+
+    def test_concurrent_calls_share_one_computation(self):
+        flight = SingleFlight()
+        calls = []
+        started = threading.Event()
+
+        def compute():
+            calls.append(1)
+            started.set()
+            time.sleep(0.1)
+            return {"is_offlabel": False}
+
+        with ThreadPoolExecutor(max_workers=5) as executor:
+            leader = executor.submit(flight.do, ("m1", "糖尿病"), compute)
+            started.wait()
+            followers = [executor.submit(flight.do, ("m1", "糖尿病"), compute) for _ in range(4)]
+            results = [leader.result()] + [future.result() for future in followers]
+
+        print(f"\n统计: {flight.stats()}")
+        assert len(calls) == 1
+        assert [shared for _, shared in results] == [False, True, True, True, True]
+        assert flight.stats()["coalesced"] == 4 and flight.stats()["in_flight"] == 0
+
+        # 计算结束后键释放，之后的调用重新计算
+        flight.do(("m1", "糖尿病"), compute)
+        assert len(calls) == 2
+
+    def test_exception_propagates(self):
+        flight = SingleFlight()
+        with pytest.raises(ValueError):
+            flight.do("k", lambda: (_ for _ in ()).throw(ValueError("未识别到疾病信息")))
+        assert flight.stats()["in_flight"] == 0
+
+
+class TestAsyncSingleFlight:
+    """协程版"""
+
+    def test_coalesce_and_cancel(self):
+        async def scenario():
+            flight = AsyncSingleFlight()
+            calls = []
+
+            async def compute():
+                calls.append(1)
+                await asyncio.sleep(0.05)
+                return {"is_offlabel": True}
+
+            results = await asyncio.gather(*[flight.do("k", compute) for _ in range(5)])
+            assert len(calls) == 1
+            assert sum(shared for _, shared in results) == 4
+
+            # leader的调用方取消后，其它等待者仍得到结果
+            leader = asyncio.ensure_future(flight.do("k2", compute))
+            await asyncio.sleep(0)
+            follower = asyncio.ensure_future(flight.do("k2", compute))
+            await asyncio.sleep(0)
+            leader.cancel()
+            result, shared = await follower
+            assert result == {"is_offlabel": True} and shared
+            return flight.stats()
+
+        stats = asyncio.run(scenario())
+        print(f"\n统计: {stats}")
+        assert stats["leaders"] == 2 and stats["waiting"] == 0 and stats["in_flight"] == 0